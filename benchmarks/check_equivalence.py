@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# check_equivalence.py
+
+# Check that the current annotation and summary code gives the same tables as
+# the original implementations, on the test data and on random synthetic
+# inputs. Exits with 1 if any cell differs.
+
+import os
+import sys
+import argparse
+import tempfile
+
+# the interogate package lives one directory up from the benchmarks
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from interogate.synthetic import write_synthetic_dataset
+
+
+# (gtf, m6a file) pairs in data/ with the outputs of the original code beside them
+DATA_SETS = [('test.gtf', 'test.data.site_proba.csv'),
+             ('AT1G01010.1_UTR_test.gtf', 'data.site_proba.csv')]
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Compare the current and original code paths",
+                                     add_help=False)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("--synthetic", dest='synthetic',
+                          action="store", default=5, type=int,
+                          help="number of random synthetic datasets. Default 5")
+    optional.add_argument("--transcripts", dest='transcripts',
+                          action="store", default=300, type=int,
+                          help="transcripts per synthetic dataset. Default 300")
+    optional.add_argument("--threshold", dest='threshold',
+                          action="store", default=0.9, type=float,
+                          help="probability threshold. Default 0.9")
+    optional.add_argument("--seed", dest='seed',
+                          action="store", default=0, type=int,
+                          help="random seed of the first synthetic dataset")
+    optional.add_argument("--rtol", dest='rtol',
+                          action="store", default=1e-9, type=float,
+                          help="relative tolerance for numbers")
+    optional.add_argument("--atol", dest='atol',
+                          action="store", default=1e-12, type=float,
+                          help="absolute tolerance for numbers")
+    optional.add_argument("-o", "--out", dest='out',
+                          action="store", default=None, type=str,
+                          help="write the differing cells to this TSV")
+    optional.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                          help="Show this help message and exit")
+    return parser.parse_args()
+
+
+def check_golden_outputs(m6a_file, current, rtol, atol):
+    """Diff the current tables against the stored outputs of the original code."""
+    from interogate.equivalence import diff_tables
+    import pandas as pd
+
+    base = os.path.splitext(m6a_file)[0]
+    differences = []
+    for table, golden in (('exon_annotated', f"{base}_exon_annotated.tab"),
+                          ('summary', f"{base}_summary_per_transcript.tab"),
+                          ('overall_summary', f"{base}_summary_per_transcript.tab.overall.summary")):
+        if os.path.exists(golden):
+            differences.append(diff_tables(pd.read_csv(golden, sep="\t"),
+                                           pd.read_csv(current[table], sep="\t"),
+                                           f"golden_{table}", rtol, atol))
+    return differences
+
+
+def main():
+    args = get_args()
+    import numpy as np
+    import pandas as pd
+    from interogate.equivalence import compare_code_paths, compare_benjamini_hochberg, current_outputs
+
+    data_dir = os.path.join(REPO_DIR, "data")
+    length_file = os.path.join(data_dir, "Araport11_genes.201606.cdna.len")
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        runs = [(os.path.join(data_dir, gtf), length_file, os.path.join(data_dir, m6a))
+                for gtf, m6a in DATA_SETS]
+        for n in range(args.synthetic):
+            dataset = write_synthetic_dataset(os.path.join(tmp_dir, f"synthetic{n}"),
+                                              args.transcripts, seed=args.seed + n)
+            runs.append((dataset['gtf'], dataset['length'], dataset['m6a'][0]))
+
+        for gtf_file, run_length_file, m6a_file in runs:
+            out_dir = tempfile.mkdtemp(dir=tmp_dir)
+            differences = [compare_code_paths(gtf_file, run_length_file, m6a_file, args.threshold,
+                                              out_dir, args.rtol, args.atol)]
+            if m6a_file.startswith(data_dir):
+                current = current_outputs(gtf_file, run_length_file, m6a_file, 0.9, out_dir)
+                differences += check_golden_outputs(m6a_file, current, args.rtol, args.atol)
+            differences = pd.concat(differences, ignore_index=True)
+            differences.insert(0, 'm6a_file', os.path.basename(m6a_file))
+            print(f"{os.path.basename(m6a_file)}\t{len(differences)} differing cells")
+            reports.append(differences)
+
+        rng = np.random.default_rng(args.seed)
+        # rounded so there are tied p-values
+        differences = compare_benjamini_hochberg(np.round(rng.random(10000), 3), args.rtol, args.atol)
+        differences.insert(0, 'm6a_file', 'random p-values')
+        print(f"benjamini_hochberg\t{len(differences)} differing cells")
+        reports.append(differences)
+
+    report = pd.concat(reports, ignore_index=True)
+    if args.out:
+        report.to_csv(args.out, index=False, sep="\t")
+    if len(report):
+        print(report.head(50).to_string(index=False))
+        sys.exit(1)
+    print("The current code paths match the original ones")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+#
+# run_benchmarks.py
+
+# Time the pipeline stages on synthetic, genome scale inputs and write the
+# results as JSON so that versions can be compared (see --compare).
+
+import os
+import sys
+import json
+import random
+import logging
+import argparse
+import tempfile
+
+# the interogate package lives one directory up from the benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from interogate.profiling import StageProfiler
+from interogate.synthetic import write_synthetic_dataset
+from interogate.parse_m6a_site_proba import DEFAULT_CHUNKSIZE
+
+
+STAGES = ['parse_gff_gft', 'generate_transcript_coordinates', 'transcript_coordinates_from_file',
+          'query_transcript_exon', 'read_methylated_sites', 'annotate_sites',
+          'summarise_methylation_sites', 'plot_methylation_distribution',
+          'read_indiv_proba_chunked', 'read_indiv_proba_pyarrow']
+INDIV_STAGES = {'read_indiv_proba_chunked': 'c', 'read_indiv_proba_pyarrow': 'pyarrow'}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark the m6anet interogater on synthetic data",
+                                     add_help=False)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("--transcripts", dest='transcripts',
+                          action="store", default=20000, type=int,
+                          help="number of synthetic transcripts. Default 20000")
+    optional.add_argument("--exons", dest='exons',
+                          action="store", default=5, type=float,
+                          help="mean CDS exons per transcript. Default 5")
+    optional.add_argument("--site_density", dest='site_density',
+                          action="store", default=0.01, type=float,
+                          help="m6anet sites per transcript nucleotide. Default 0.01")
+    optional.add_argument("--indiv_reads", dest='indiv_reads',
+                          action="store", default=10, type=int,
+                          help="reads per site of the synthetic data.indiv_proba.csv. Default 10")
+    optional.add_argument("--chunksize", dest='chunksize',
+                          action="store", default=DEFAULT_CHUNKSIZE, type=int,
+                          help=f"rows per chunk of the chunked indiv_proba reader. Default {DEFAULT_CHUNKSIZE}")
+    optional.add_argument("--queries", dest='queries',
+                          action="store", default=100000, type=int,
+                          help="single site query_transcript_exon calls to time. Default 100000")
+    optional.add_argument("--seed", dest='seed',
+                          action="store", default=0, type=int,
+                          help="random seed")
+    optional.add_argument("--stages", dest='stages',
+                          action="store", nargs='+', default=STAGES, choices=STAGES,
+                          help="stages to run (default all)")
+    optional.add_argument("--workdir", dest='workdir',
+                          action="store", default=None, type=str,
+                          help="directory for the synthetic inputs and outputs, " +
+                          "a temporary one by default")
+    optional.add_argument("--no_memory", dest='no_memory',
+                          action="store_true", default=False,
+                          help="do not trace memory (tracemalloc slows the stages down)")
+    optional.add_argument("-o", "--output", dest='output',
+                          action="store", default="benchmark_results.json", type=str,
+                          help="JSON file for the results")
+    optional.add_argument("--compare", dest='compare',
+                          action="store", default=None, type=str,
+                          help="an earlier results JSON to print the speed up against")
+    optional.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                          help="Show this help message and exit")
+    return parser.parse_args()
+
+
+def run_benchmarks(dataset, stages, profiler, queries=100000, seed=0, out_dir='.',
+                   chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Run the wanted stages on a synthetic dataset, recording them in profiler.
+
+    Later stages reuse what the earlier ones built (e.g. the annotation), so
+    each is timed on its own.
+
+    Parameters:
+    dataset (dict): The output of write_synthetic_dataset.
+    stages (list): Names from STAGES.
+    profiler (StageProfiler): Records the time and memory of each stage.
+    queries (int): Number of query_transcript_exon calls.
+    seed (int): Random seed for the queries.
+    out_dir (str): Directory for the summary and plot outputs.
+    chunksize (int): Rows per chunk of the chunked indiv_proba reader.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from interogate.parse_gtf import parse_gff_gft
+    from interogate.parse_trans_len import parse_transcript_lengths
+    from interogate.return_dict import generate_transcript_coordinates, \
+        transcript_coordinates_from_file, query_transcript_exon
+    from interogate.parse_m6a_site_proba import read_methylated_sites
+    from interogate.annotate import annotate_sites
+    from interogate.summary_stats import summarise_methylation_sites
+    from interogate.plot import plot_methylation_distribution
+
+    logger = logging.getLogger('benchmarks')
+    transcript_lengths = parse_transcript_lengths(dataset['length'])
+    m6a_file = dataset['m6a'][0]
+    features = None
+
+    if 'parse_gff_gft' in stages or 'generate_transcript_coordinates' in stages:
+        with profiler.stage('parse_gff_gft', m6a_file) as record:
+            features = parse_gff_gft(dataset['gtf'])
+            record['rows'] = len(features)
+    if 'generate_transcript_coordinates' in stages:
+        with profiler.stage('generate_transcript_coordinates', m6a_file) as record:
+            annotation = generate_transcript_coordinates(features, transcript_lengths)
+            record['rows'] = len(annotation[0])
+    del features
+    with profiler.stage('transcript_coordinates_from_file', m6a_file) as record:
+        transcript_dict, _, gene_exon_counts, _, transcript_strands = \
+            transcript_coordinates_from_file(dataset['gtf'], transcript_lengths)
+        record['rows'] = len(transcript_dict)
+
+    if 'query_transcript_exon' in stages:
+        rng = random.Random(seed)
+        transcript_ids = list(transcript_dict.keys())
+        targets = [(rng.choice(transcript_ids), rng.randint(1, 3000)) for _ in range(queries)]
+        with profiler.stage('query_transcript_exon', m6a_file) as record:
+            for transcript_id, position in targets:
+                query_transcript_exon(transcript_dict, transcript_id, position)
+            record['rows'] = queries
+
+    with profiler.stage('read_methylated_sites', m6a_file) as record:
+        sites = read_methylated_sites(m6a_file, 0.9, set(transcript_dict.keys()))
+        record['rows'] = len(sites)
+    with profiler.stage('annotate_sites', m6a_file) as record:
+        results_df = annotate_sites(sites, transcript_dict, gene_exon_counts)
+        record['rows'] = len(results_df)
+
+    if 'summarise_methylation_sites' in stages:
+        with profiler.stage('summarise_methylation_sites', m6a_file) as record:
+            summarise_methylation_sites(results_df, os.path.join(out_dir, "benchmark_summary.tab"),
+                                        logger)
+            record['rows'] = len(results_df)
+    if 'plot_methylation_distribution' in stages:
+        with profiler.stage('plot_methylation_distribution', m6a_file) as record:
+            plot_methylation_distribution(results_df, os.path.join(out_dir, "benchmark_plot.pdf"),
+                                          transcript_lengths, transcript_strands, m6a_file, logger)
+            record['rows'] = len(results_df)
+
+    # the per read files, read in chunks by each engine
+    for stage, engine in INDIV_STAGES.items():
+        if stage in stages:
+            with profiler.stage(stage, dataset['indiv'][0]) as record:
+                indiv_sites = read_methylated_sites(dataset['indiv'][0], 0.9, set(transcript_dict.keys()),
+                                                    chunksize, engine)
+                record['rows'] = len(indiv_sites)
+            del indiv_sites
+
+    # the setup stages always run, keep only the ones asked for
+    profiler.records = [record for record in profiler.records if record['stage'] in stages]
+
+
+def compare_results(baseline_file, results_file):
+    """Print the wall time of each stage against an earlier results file."""
+    with open(baseline_file) as in_file:
+        baseline = {record['stage']: record for record in json.load(in_file)['stages']}
+    with open(results_file) as in_file:
+        results = json.load(in_file)['stages']
+    print(f"{'stage':35s}{'baseline_s':>12s}{'now_s':>12s}{'speed_up':>10s}")
+    for record in results:
+        before = baseline.get(record['stage'])
+        if before is None:
+            continue
+        speed_up = before['wall_s'] / record['wall_s'] if record['wall_s'] else float('inf')
+        print(f"{record['stage']:35s}{before['wall_s']:12.3f}{record['wall_s']:12.3f}{speed_up:10.2f}")
+
+
+def main():
+    args = get_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        workdir = args.workdir or tmp_dir
+        print(f"Writing synthetic data to {workdir}")
+        indiv_reads = args.indiv_reads if any(stage in INDIV_STAGES for stage in args.stages) else 0
+        dataset = write_synthetic_dataset(workdir, args.transcripts, args.exons,
+                                          args.site_density, seed=args.seed, indiv_reads=indiv_reads)
+        input_bytes = {name: os.path.getsize(dataset[name]) for name in ('gtf', 'length')}
+        if dataset['indiv']:
+            input_bytes['indiv'] = os.path.getsize(dataset['indiv'][0])
+        profiler = StageProfiler(enabled=True, trace_memory=not args.no_memory)
+        run_benchmarks(dataset, args.stages, profiler, args.queries, args.seed, workdir,
+                       args.chunksize)
+        profiler.write(args.output, {'command': ' '.join(sys.argv),
+                                     'config': {'transcripts': args.transcripts,
+                                                'exons': args.exons,
+                                                'site_density': args.site_density,
+                                                'queries': args.queries,
+                                                'indiv_reads': indiv_reads,
+                                                'chunksize': args.chunksize,
+                                                'seed': args.seed},
+                                     'input_bytes': input_bytes})
+    for record in profiler.records:
+        print(f"{record['stage']:35s}{record['wall_s']:10.3f} s  rows {record['rows']}")
+    print(f"Results saved to {args.output}")
+    if args.compare:
+        compare_results(args.compare, args.output)
+
+
+if __name__ == '__main__':
+    main()
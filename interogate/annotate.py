@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# annotate.py
+
+import numpy as np
+import pandas as pd
+
+
+RESULT_COLUMNS = ['transcript_id', 'position', 'exon_number', 'total_exons_in_transcript',
+                  'total_exons_in_gene', 'is_last_exon']
+
+
+def _mixed_column(values, mask, fill):
+    """
+    Return values where mask is True and fill elsewhere, keeping a plain
+    numeric column when nothing needs filling (as building from dicts did).
+    """
+    if mask.all():
+        return values
+    column = values.astype(object)
+    column[~mask] = fill
+    return column
+
+
+def five_prime_utr_mask(rows, positions, transcript_dict):
+    """
+    Return which sites lie before exon 1 of their transcript (5' UTR).
+
+    Parameters:
+    rows (array): Row of each site's transcript in the model, -1 if unknown.
+    positions (array): Transcript position of each site.
+    transcript_dict (TranscriptModel): The transcript exon coordinates.
+
+    Returns:
+    array: True for the 5' UTR sites.
+    """
+    first_exon_starts = np.where(rows >= 0, transcript_dict.first_exon_starts[np.clip(rows, 0, None)]
+                                 if len(transcript_dict) else 0, 0)
+    return (first_exon_starts > 0) & (positions < first_exon_starts)
+
+
+def log_five_prime_utr_sites(transcript_ids, positions, logger, infile_name):
+    """Log each 5' UTR site, these are not part of the annotated output."""
+    for transcript_id, position in zip(transcript_ids, positions):
+        logger.info(f"file:\t{infile_name}\t{transcript_id}\thas 5_prime m6a modification at\t{position}")
+
+
+def annotate_sites(methylated_sites, transcript_dict, gene_exon_counts,
+                   logger=None, infile_name=None):
+    """
+    Annotate a whole DataFrame of methylated sites with their exon in one pass.
+
+    Sites are located with a single NumPy searchsorted over the flattened exon
+    boundaries of the TranscriptModel instead of one lookup per row.
+
+    Parameters:
+    methylated_sites (DataFrame): Sites with 'transcript_id' and 'transcript_position' columns.
+    transcript_dict (TranscriptModel): The transcript exon coordinates.
+    gene_exon_counts (dict): Maps each gene ID to its total number of unique exons.
+    logger (Logger): Optional logger, 5' UTR sites are reported to it.
+    infile_name (str): Name of the m6a file, used in the log messages.
+
+    Returns:
+    DataFrame: One row per site with the columns 'transcript_id', 'position',
+               'exon_number' (or 'UTR'), 'total_exons_in_transcript',
+               'total_exons_in_gene' and 'is_last_exon'.
+    """
+    transcript_ids = pd.Categorical(methylated_sites['transcript_id'])
+    positions = methylated_sites['transcript_position'].to_numpy()
+
+    # map each distinct transcript once, then broadcast through the codes
+    category_rows = np.array([transcript_dict.index.get(transcript_id, -1)
+                              for transcript_id in transcript_ids.categories] + [-1], dtype=np.int64)
+    category_genes = [gene_exon_counts.get(str(transcript_id).split('.')[0], 'Unknown')
+                      for transcript_id in transcript_ids.categories] + ['Unknown']
+    codes = transcript_ids.codes.astype(np.int64)
+    codes[codes < 0] = len(transcript_ids.categories)
+    rows = category_rows[codes]
+
+    exon_numbers, found, is_last_exon, total_exons = transcript_dict.locate(rows, positions)
+
+    # determine if this is a 5prime UTR modification
+    is_5prime_utr = five_prime_utr_mask(rows, positions, transcript_dict)
+    if logger is not None and is_5prime_utr.any():
+        log_five_prime_utr_sites(methylated_sites['transcript_id'].to_numpy()[is_5prime_utr],
+                                 positions[is_5prime_utr], logger, infile_name)
+
+    gene_counts = np.array(category_genes, dtype=object)[codes]
+    known_genes = gene_counts != 'Unknown'
+    gene_counts = _mixed_column(np.where(known_genes, gene_counts, 0).astype(np.int64), known_genes, 'Unknown')
+
+    results_df = pd.DataFrame({
+        'transcript_id': methylated_sites['transcript_id'].to_numpy(),
+        'position': positions,
+        'exon_number': _mixed_column(exon_numbers.astype(np.int64), found, 'UTR'),
+        'total_exons_in_transcript': total_exons if found.all() else np.where(found, total_exons, np.nan),
+        'total_exons_in_gene': gene_counts,
+        'is_last_exon': is_last_exon,
+    }, columns=RESULT_COLUMNS)
+    return results_df
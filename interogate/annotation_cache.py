@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+#
+# annotation_cache.py
+
+import os
+import hashlib
+import tempfile
+from collections import defaultdict
+import numpy as np
+from interogate.return_dict import transcript_coordinates_from_file
+from interogate.parse_trans_len import parse_transcript_lengths
+from interogate.transcript_model import TranscriptModel
+
+
+# bump this when the layout of the cached arrays or the annotation logic changes
+CACHE_VERSION = "1"
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "interogate_m6anet")
+DEFAULT_CACHE_SIZE = 500 * 1024 * 1024  # bytes
+
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """
+    Return a content hash of a file, read in chunks.
+
+    Parameters:
+    file_path (str): Path to the file.
+    chunk_size (int): Bytes to read at a time.
+
+    Returns:
+    str: Hex digest of the file content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(gtf_file, length_file):
+    """
+    Return the cache key for a GTF and transcript length file pair.
+
+    Parameters:
+    gtf_file (str): Path to the GTF/GFF file.
+    length_file (str): Path to the transcript length file.
+
+    Returns:
+    str: A key that changes whenever either file's content changes.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(CACHE_VERSION.encode())
+    digest.update(file_digest(gtf_file).encode())
+    digest.update(file_digest(length_file).encode())
+    return digest.hexdigest()
+
+
+def _string_array(values):
+    """Fixed width unicode array, so the cache loads without pickle."""
+    values = list(values)
+    return np.array(values, dtype=str) if values else np.zeros(0, dtype='<U1')
+
+
+def save_annotation(cache_file, transcript_lengths, transcript_dict, gene_exon_counts,
+                    transcript_strands):
+    """
+    Write the annotation to a compressed .npz file, atomically.
+
+    Parameters:
+    cache_file (str): Path of the .npz file to write.
+    transcript_lengths (dict): Maps transcript IDs to their lengths.
+    transcript_dict (TranscriptModel): The transcript exon coordinates.
+    gene_exon_counts (dict): Maps each gene ID to its total number of unique exons.
+    transcript_strands (dict): Maps transcript IDs to their strand.
+    """
+    cache_dir = os.path.dirname(cache_file) or '.'
+    os.makedirs(cache_dir, exist_ok=True)
+    handle, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as out_file:
+            np.savez_compressed(
+                out_file,
+                transcript_ids=_string_array(transcript_dict.transcript_ids),
+                offsets=transcript_dict.offsets,
+                exon_starts=transcript_dict.exon_starts,
+                exon_ends=transcript_dict.exon_ends,
+                exon_numbers=transcript_dict.exon_numbers,
+                strands=transcript_dict.strands,
+                gene_ids=_string_array(gene_exon_counts.keys()),
+                gene_exon_counts=np.array(list(gene_exon_counts.values()), dtype=np.int32),
+                strand_ids=_string_array(transcript_strands.keys()),
+                strand_values=_string_array(transcript_strands.values()),
+                length_ids=_string_array(transcript_lengths.keys()),
+                lengths=np.array(list(transcript_lengths.values()), dtype=np.int64))
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def read_annotation(cache_file):
+    """
+    Load an annotation written by save_annotation.
+
+    Parameters:
+    cache_file (str): Path of the .npz file.
+
+    Returns:
+    tuple: transcript_lengths, transcript_dict, transcript_exon_counts,
+           gene_exon_counts, last_exon_for_transcript, transcript_strands
+    """
+    with np.load(cache_file, allow_pickle=False) as data:
+        transcript_dict = TranscriptModel(data['transcript_ids'].tolist(), data['offsets'],
+                                          data['exon_starts'], data['exon_ends'],
+                                          data['exon_numbers'], data['strands'])
+        gene_exon_counts = dict(zip(data['gene_ids'].tolist(), data['gene_exon_counts'].tolist()))
+        transcript_strands = defaultdict(str, zip(data['strand_ids'].tolist(),
+                                                  data['strand_values'].tolist()))
+        transcript_lengths = defaultdict(int, zip(data['length_ids'].tolist(),
+                                                  data['lengths'].tolist()))
+
+    transcript_ids = transcript_dict.transcript_ids
+    transcript_exon_counts = dict(zip(transcript_ids, transcript_dict.exon_counts.tolist()))
+    last_exon_for_transcript = dict(zip(transcript_ids, transcript_dict.last_exon_numbers.tolist()))
+    return transcript_lengths, transcript_dict, transcript_exon_counts, \
+        gene_exon_counts, last_exon_for_transcript, transcript_strands
+
+
+def evict_cache(cache_dir, max_bytes=DEFAULT_CACHE_SIZE, keep=None):
+    """
+    Remove the least recently used cache files until the directory fits max_bytes.
+
+    Parameters:
+    cache_dir (str): The cache directory.
+    max_bytes (int): Size limit for all cache files together.
+    keep (str): A cache file that must not be removed (the one in use).
+
+    Returns:
+    list: The removed files.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.startswith('annotation_') and name.endswith('.npz'):
+            path = os.path.join(cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        os.remove(path)
+        total -= size
+        removed.append(path)
+    return removed
+
+
+def load_annotation(gtf_file, length_file, cache_dir=DEFAULT_CACHE_DIR,
+                    max_bytes=DEFAULT_CACHE_SIZE, logger=None, transcripts=None, key=None):
+    """
+    Return the parsed annotation, from the cache when the inputs are unchanged.
+
+    On a miss the GTF and length files are parsed as usual and the result is
+    stored under a key made from their content hashes. Pass cache_dir=None to
+    always parse.
+
+    With transcripts given, a miss only models those transcripts (and counts
+    the exons of their genes) and the partial result is not cached; a cached
+    full annotation is still used when there is one.
+
+    Parameters:
+    gtf_file (str): Path to the GTF/GFF file.
+    length_file (str): Path to the transcript length file.
+    cache_dir (str): Directory holding the cache files, or None.
+    max_bytes (int): Size limit of the cache directory.
+    logger (Logger): Optional logger.
+    transcripts (set): Only the transcripts that are needed, or None for all.
+    key (str): The cache_key of the two files if the caller already has it,
+               so they are not hashed again.
+
+    Returns:
+    tuple: transcript_lengths, transcript_dict, transcript_exon_counts,
+           gene_exon_counts, last_exon_for_transcript, transcript_strands
+    """
+    cache_file = None
+    if cache_dir:
+        key = key or cache_key(gtf_file, length_file)
+        cache_file = os.path.join(cache_dir, f"annotation_{key}.npz")
+        if os.path.exists(cache_file):
+            try:
+                annotation = read_annotation(cache_file)
+                os.utime(cache_file)  # mark as recently used
+                if logger:
+                    logger.info("loaded annotation from cache: %s", cache_file)
+                return annotation
+            except Exception as e:
+                if logger:
+                    logger.warning(f"Could not read annotation cache {cache_file}: {e}")
+
+    transcript_lengths = parse_transcript_lengths(length_file, transcripts)
+    transcript_dict, transcript_exon_counts, gene_exon_counts, last_exon_for_transcript, \
+        transcript_strands = transcript_coordinates_from_file(gtf_file, transcript_lengths, transcripts)
+    if transcripts is not None:
+        if logger:
+            logger.info("modelled %d of the %d transcripts in the inputs",
+                        len(transcript_dict), len(transcripts))
+        return transcript_lengths, transcript_dict, transcript_exon_counts, \
+            gene_exon_counts, last_exon_for_transcript, transcript_strands
+
+    if cache_file:
+        try:
+            save_annotation(cache_file, transcript_lengths, transcript_dict,
+                            gene_exon_counts, transcript_strands)
+            removed = evict_cache(cache_dir, max_bytes, keep=cache_file)
+            if logger:
+                logger.info("saved annotation to cache: %s", cache_file)
+                for path in removed:
+                    logger.info("evicted stale annotation cache: %s", path)
+        except OSError as e:
+            if logger:
+                logger.warning(f"Could not write annotation cache {cache_file}: {e}")
+
+    return transcript_lengths, transcript_dict, transcript_exon_counts, \
+        gene_exon_counts, last_exon_for_transcript, transcript_strands
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+#
+# annotation_server.py
+
+# A long lived localhost HTTP service holding the transcript model, so that
+# notebooks and scripts can annotate sites without rebuilding the annotation,
+# and the client to talk to it.
+
+import json
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from interogate.annotate import five_prime_utr_mask
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+ANNOTATION_FIELDS = ['transcript_id', 'position', 'exon_number', 'total_exons_in_transcript',
+                     'total_exons_in_gene', 'is_last_exon', 'is_utr', 'is_5prime_utr', 'in_annotation']
+
+
+def annotate_batch(transcript_ids, positions, transcript_dict, gene_exon_counts):
+    """
+    Annotate a batch of sites with the same rules as annotate_sites.
+
+    Parameters:
+    transcript_ids (list): Transcript ID of each site.
+    positions (list): Transcript position of each site.
+    transcript_dict (TranscriptModel): The transcript exon coordinates.
+    gene_exon_counts (dict): Maps each gene ID to its total number of unique exons.
+
+    Returns:
+    dict: One list per field of ANNOTATION_FIELDS. exon_number is 'UTR' and
+          total_exons_in_transcript None outside the exons, total_exons_in_gene
+          is 'Unknown' for genes not in the annotation.
+    """
+    transcript_ids = [str(transcript_id) for transcript_id in transcript_ids]
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(transcript_ids) != len(positions):
+        raise ValueError("transcript_id and position must have the same length")
+    rows = np.array([transcript_dict.index.get(transcript_id, -1) for transcript_id in transcript_ids],
+                    dtype=np.int64)
+    exon_numbers, found, is_last_exon, total_exons = transcript_dict.locate(rows, positions)
+    is_5prime_utr = five_prime_utr_mask(rows, positions, transcript_dict)
+    return {
+        'transcript_id': transcript_ids,
+        'position': positions.tolist(),
+        'exon_number': [int(number) if hit else 'UTR' for number, hit in zip(exon_numbers, found)],
+        'total_exons_in_transcript': [int(total) if hit else None for total, hit in zip(total_exons, found)],
+        'total_exons_in_gene': [gene_exon_counts.get(transcript_id.split('.')[0], 'Unknown')
+                                for transcript_id in transcript_ids],
+        'is_last_exon': is_last_exon.tolist(),
+        'is_utr': (~found).tolist(),
+        'is_5prime_utr': is_5prime_utr.tolist(),
+        'in_annotation': (rows >= 0).tolist(),
+    }
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /health returns the annotation details, POST /annotate takes
+    {"transcript_id": [...], "position": [...]} and returns the columns of
+    annotate_batch.
+    """
+
+    # keep the connection open between requests, a new TCP connection per
+    # lookup would cost more than the lookup itself, and send small replies
+    # at once instead of waiting on Nagle's algorithm
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.details)
+        else:
+            self._send_json(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/annotate":
+            self._send_json(404, {'error': f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            result = annotate_batch(request['transcript_id'], request['position'],
+                                    self.server.transcript_dict, self.server.gene_exon_counts)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': f"bad request: {e}"})
+            return
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        if self.server.logger:
+            self.server.logger.debug("%s %s", self.address_string(), format % args)
+
+
+def make_server(transcript_dict, gene_exon_counts, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                logger=None, details=None):
+    """
+    Create the annotation server (call serve_forever on it to start).
+
+    Parameters:
+    transcript_dict (TranscriptModel): The transcript exon coordinates.
+    gene_exon_counts (dict): Maps each gene ID to its total number of unique exons.
+    host (str): Address to listen on, localhost by default.
+    port (int): Port to listen on, 0 picks a free one.
+    logger (Logger): Optional logger for the requests.
+    details (dict): Extra information returned by /health, e.g. the GTF used.
+
+    Returns:
+    ThreadingHTTPServer: The server.
+    """
+    server = ThreadingHTTPServer((host, port), AnnotationRequestHandler)
+    server.daemon_threads = True
+    server.transcript_dict = transcript_dict
+    server.gene_exon_counts = gene_exon_counts
+    server.logger = logger
+    server.details = dict(details or {}, transcripts=len(transcript_dict))
+    return server
+
+
+class AnnotationClient:
+    """
+    Client of the annotation server, keeping one connection open.
+
+    Use annotate for lists of sites or annotate_frame for a DataFrame with
+    'transcript_id' and 'transcript_position' (or 'position') columns.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _request(self, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        result = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(f"annotation server error {response.status}: {result.get('error')}")
+        return result
+
+    def health(self):
+        """Return the server's details, e.g. the number of transcripts."""
+        return self._request("GET", "/health")
+
+    def annotate(self, transcript_ids, positions):
+        """
+        Annotate sites, see annotate_batch.
+
+        Parameters:
+        transcript_ids (list): Transcript ID of each site.
+        positions (list): Transcript position of each site.
+
+        Returns:
+        dict: One list per field of ANNOTATION_FIELDS.
+        """
+        return self._request("POST", "/annotate",
+                             {'transcript_id': [str(transcript_id) for transcript_id in transcript_ids],
+                              'position': [int(position) for position in positions]})
+
+    def annotate_frame(self, sites):
+        """Annotate a DataFrame of sites, returning a DataFrame of ANNOTATION_FIELDS."""
+        import pandas as pd
+
+        position_column = 'transcript_position' if 'transcript_position' in sites.columns else 'position'
+        result = self.annotate(sites['transcript_id'].tolist(), sites[position_column].tolist())
+        return pd.DataFrame(result, columns=ANNOTATION_FIELDS)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+#
+# equivalence.py
+
+# The original (row by row) implementations of the annotation and summary,
+# kept as the reference the faster code paths are checked against, and a
+# cell by cell diff of the tables they write.
+
+import os
+import re
+import logging
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+
+DIFF_COLUMNS = ['table', 'row', 'column', 'expected', 'actual']
+
+
+def legacy_generate_transcript_coordinates(features, transcript_lengths):
+    """
+    The original per nucleotide list expansion of the CDS features.
+
+    Parameters:
+    features (list): Tuples of the fields of each GFF/GTF feature.
+    transcript_lengths (dict): Unused, kept for the original signature.
+
+    Returns:
+    tuple: transcript_dict (exon number to list of positions, per transcript),
+           the exon count per transcript, the exon count per gene, the last
+           exon of each transcript and the strand of each transcript.
+    """
+    transcript_dict = defaultdict(lambda: defaultdict(list))
+    transcript_exon_sets = defaultdict(set)
+    gene_exon_sets = defaultdict(set)
+    transcript_strands = defaultdict(str)
+    nucleotide_counter = defaultdict(int)
+
+    for seqname, source, feature_type, start, end, score, strand, frame, attribute in features:
+        if feature_type in ['CDS', 'three_prime_UTR']:
+            transcript_id = None
+            exon_number = None
+            for attr in attribute.split(';'):
+                if 'Parent' in attr:
+                    transcript_id = attr.split('=')[1].strip() if '=' in attr else attr.split()[1].strip().strip('"')
+                    transcript_strands[transcript_id] = strand
+                if 'ID' in attr:
+                    exon_match = re.search(r'CDS:(\d+)', attr)
+                    if exon_match:
+                        exon_number = int(exon_match.group(1))
+
+            if transcript_id and exon_number:
+                exon_positions = []
+                for pos in range(start, end + 1):
+                    nucleotide_counter[transcript_id] += 1
+                    exon_positions.append(nucleotide_counter[transcript_id])
+                if strand == '-':
+                    exon_positions = exon_positions[::-1]
+                transcript_dict[transcript_id][exon_number] = exon_positions
+                transcript_exon_sets[transcript_id].add(exon_number)
+                gene_exon_sets[transcript_id.split('.')[0]].add(exon_number)
+
+    gene_exon_counts = {gene: len(exons) for gene, exons in gene_exon_sets.items()}
+    trans_exon_counts = {trans: len(exons) for trans, exons in transcript_exon_sets.items()}
+    last_exon_for_transcript = {trans: max(exons) for trans, exons in transcript_exon_sets.items() if exons}
+    return transcript_dict, trans_exon_counts, gene_exon_counts, \
+        last_exon_for_transcript, transcript_strands
+
+
+def legacy_query_transcript_exon(transcript_dict, transcript_id, position):
+    """The original linear scan lookup of the exon holding a position."""
+    if transcript_id in transcript_dict:
+        for exon_number, coordinates in transcript_dict[transcript_id].items():
+            if position in coordinates:
+                return exon_number, len(transcript_dict[transcript_id])
+    return None, None
+
+
+def legacy_annotate_sites(methylated_sites, transcript_dict, gene_exon_counts, last_exon_for_transcript):
+    """
+    The original iterrows annotation loop of interogate_m6anet.py.
+
+    Parameters:
+    methylated_sites (DataFrame): Sites with 'transcript_id' and 'transcript_position' columns.
+    transcript_dict (dict): From legacy_generate_transcript_coordinates.
+    gene_exon_counts (dict): Maps each gene ID to its total number of unique exons.
+    last_exon_for_transcript (dict): Maps each transcript ID to its last exon.
+
+    Returns:
+    tuple: The annotated DataFrame and a list of the (transcript_id, position)
+           of the sites found in a 5' UTR (these were only logged).
+    """
+    results = []
+    five_prime_sites = []
+    for index, row in methylated_sites.iterrows():
+        transcript_id = row['transcript_id']
+        position = row['transcript_position']
+        exon_number, total_exons = legacy_query_transcript_exon(transcript_dict, transcript_id, position)
+        exons = transcript_dict.get(transcript_id, {})
+        if exons:
+            first_exon_start = min(exons[1]) if 1 in exons else None
+            if first_exon_start and position < first_exon_start:
+                five_prime_sites.append((transcript_id, position))
+
+        result = {
+            'transcript_id': transcript_id,
+            'position': position,
+            'exon_number': exon_number if exon_number is not None else 'UTR',
+            'total_exons_in_transcript': total_exons,
+            'total_exons_in_gene': gene_exon_counts.get(transcript_id.split('.')[0], 'Unknown'),
+            'is_last_exon': (exon_number == last_exon_for_transcript.get(transcript_id, None))
+            if exon_number is not None else False
+        }
+        results.append(result)
+    return pd.DataFrame(results), five_prime_sites
+
+
+def legacy_benjamini_hochberg(p_values):
+    """The original loop implementation of the Benjamini-Hochberg correction."""
+    p_values = np.array(p_values)
+    n = len(p_values)
+    sorted_indices = np.argsort(p_values)
+    sorted_p_values = p_values[sorted_indices]
+    adjusted_p_values = np.zeros(n)
+    cummin = sorted_p_values[-1]
+    adjusted_p_values[sorted_indices[-1]] = cummin
+    for i in range(n-2, -1, -1):
+        cummin = min(cummin, sorted_p_values[i] * n / (i + 1))
+        adjusted_p_values[sorted_indices[i]] = cummin
+    return adjusted_p_values
+
+
+def legacy_summarise_methylation_sites(results_df, output_file):
+    """
+    The original groupby/apply and per transcript chi2_contingency summary,
+    writing the same two tables as summarise_methylation_sites.
+
+    Parameters:
+    results_df (DataFrame): DataFrame containing the methylation site annotations.
+    output_file (str): Path to the output file for the summary.
+    """
+    from scipy.stats import chi2_contingency
+
+    summary = results_df.groupby('transcript_id').apply(lambda df: pd.Series({
+        'total_sites': len(df),
+        'non_last_exon_sites': len(df[(df['exon_number'] != 'UTR') & (df['is_last_exon'] == False)]),
+        'last_exon_sites': len(df[df['is_last_exon'] == True]),
+        'utr_sites': len(df[df['exon_number'] == 'UTR']),
+        'last_exon_and_utr_sites': len(df[(df['exon_number'] == 'UTR') | (df['is_last_exon'] == True)])
+    })).reset_index()
+
+    summary['ratio_non_last_to_last_and_utr'] = summary.apply(
+        lambda row: row['non_last_exon_sites'] / row['last_exon_and_utr_sites'] if row['last_exon_and_utr_sites'] != 0 else 0,
+        axis=1
+    )
+
+    summary['chi2'] = np.nan
+    summary['p_value'] = np.nan
+    for index, row in summary.iterrows():
+        non_last_exon_sites = row['non_last_exon_sites']
+        last_exon_and_utr_sites = row['last_exon_and_utr_sites']
+        total_sites = row['total_sites']
+        if total_sites == 0:
+            continue
+        observed = [non_last_exon_sites, last_exon_and_utr_sites]
+        expected = [total_sites * (non_last_exon_sites / total_sites),
+                    total_sites * (last_exon_and_utr_sites / total_sites)]
+        if any(e == 0 for e in expected):
+            continue
+        chi2, p, _, _ = chi2_contingency([observed, expected])
+        summary.at[index, 'chi2'] = chi2
+        summary.at[index, 'p_value'] = p
+
+    p_values = summary['p_value'].dropna().tolist()
+    if p_values:
+        summary.loc[summary['p_value'].notna(), 'adjusted_p_value'] = legacy_benjamini_hochberg(p_values)
+    summary.to_csv(output_file, index=False, sep="\t")
+
+    overall_summary = {
+        'total_transcripts': len(summary),
+        'total_sites': summary['total_sites'].sum(),
+        'mean_sites_per_transcript': summary['total_sites'].mean(),
+        'median_sites_per_transcript': summary['total_sites'].median(),
+        'std_sites_per_transcript': summary['total_sites'].std(),
+        'max_sites_per_transcript': summary['total_sites'].max(),
+        'mean_ratio_non_last_to_last_and_utr': summary['ratio_non_last_to_last_and_utr'].mean(),
+        'median_ratio_non_last_to_last_and_utr': summary['ratio_non_last_to_last_and_utr'].median(),
+        'std_ratio_non_last_to_last_and_utr': summary['ratio_non_last_to_last_and_utr'].std(),
+        'total_non_last_exon_sites': summary['non_last_exon_sites'].sum(),
+        'mean_non_last_exon_sites': summary['non_last_exon_sites'].mean(),
+        'median_non_last_exon_sites': summary['non_last_exon_sites'].median(),
+        'std_non_last_exon_sites': summary['non_last_exon_sites'].std(),
+        'max_non_last_exon_sites': summary['non_last_exon_sites'].max(),
+        'total_last_exon_sites': summary['last_exon_sites'].sum(),
+        'mean_last_exon_sites': summary['last_exon_sites'].mean(),
+        'median_last_exon_sites': summary['last_exon_sites'].median(),
+        'std_last_exon_sites': summary['last_exon_sites'].std(),
+        'max_last_exon_sites': summary['last_exon_sites'].max(),
+        'total_utr_sites': summary['utr_sites'].sum(),
+        'mean_utr_sites': summary['utr_sites'].mean(),
+        'median_utr_sites': summary['utr_sites'].median(),
+        'std_utr_sites': summary['utr_sites'].std(),
+        'max_utr_sites': summary['utr_sites'].max()
+    }
+
+    overall_summary_df = pd.DataFrame(overall_summary.items(), columns=['Statistic', 'Value'])
+    overall_summary_df.to_csv(output_file + ".overall.summary", index=False, sep="\t")
+
+
+def diff_tables(expected, actual, name='table', rtol=1e-9, atol=1e-12):
+    """
+    Compare two tables cell by cell.
+
+    Cells that are numbers on both sides are compared with np.isclose (so 1
+    and 1.0 agree and floats may differ within the tolerances), all other
+    cells as their text. Missing values only match missing values.
+
+    Parameters:
+    expected (DataFrame): The reference table.
+    actual (DataFrame): The table to check.
+    name (str): Name of the table, for the report.
+    rtol (float): Relative tolerance for numbers.
+    atol (float): Absolute tolerance for numbers.
+
+    Returns:
+    DataFrame: One row per differing cell with the columns 'table', 'row',
+               'column', 'expected' and 'actual' (empty when they agree).
+    """
+    differences = []
+    if list(expected.columns) != list(actual.columns):
+        differences.append((name, -1, 'columns', list(expected.columns), list(actual.columns)))
+    if len(expected) != len(actual):
+        differences.append((name, -1, 'rows', len(expected), len(actual)))
+    n_rows = min(len(expected), len(actual))
+    for column in expected.columns:
+        if column not in actual.columns:
+            continue
+        expected_values = expected[column].iloc[:n_rows].reset_index(drop=True)
+        actual_values = actual[column].iloc[:n_rows].reset_index(drop=True)
+        expected_missing = expected_values.isna().to_numpy()
+        actual_missing = actual_values.isna().to_numpy()
+        expected_numbers = pd.to_numeric(expected_values, errors='coerce').to_numpy(dtype=float)
+        actual_numbers = pd.to_numeric(actual_values, errors='coerce').to_numpy(dtype=float)
+        numeric = ~np.isnan(expected_numbers) & ~np.isnan(actual_numbers)
+        same = np.where(numeric,
+                        np.isclose(expected_numbers, actual_numbers, rtol=rtol, atol=atol),
+                        expected_values.astype(str).to_numpy() == actual_values.astype(str).to_numpy())
+        same = np.where(expected_missing | actual_missing, expected_missing & actual_missing, same)
+        for row in np.flatnonzero(~same):
+            differences.append((name, int(row), column, expected_values[row], actual_values[row]))
+    return pd.DataFrame(differences, columns=DIFF_COLUMNS)
+
+
+def _read_tab(path):
+    return pd.read_csv(path, sep="\t")
+
+
+def legacy_outputs(gtf_file, length_file, m6a_file, threshold, out_dir):
+    """
+    Write the annotated sites and summaries with the original code paths.
+
+    Returns:
+    dict: Paths of the 'exon_annotated', 'summary' and 'overall_summary'
+          tables and the 5' UTR sites as 'five_prime_utr'.
+    """
+    from interogate.parse_gtf import parse_gff_gft
+    from interogate.parse_trans_len import parse_transcript_lengths
+    from interogate.parse_m6a_site_proba import identify_methylated_sites
+
+    transcript_lengths = parse_transcript_lengths(length_file)
+    transcript_dict, _, gene_exon_counts, last_exon_for_transcript, _ = \
+        legacy_generate_transcript_coordinates(parse_gff_gft(gtf_file), transcript_lengths)
+    methylated_sites = identify_methylated_sites(m6a_file, threshold)
+    methylated_sites = methylated_sites[methylated_sites['transcript_id'].isin(set(transcript_dict.keys()))]
+    results_df, five_prime_sites = legacy_annotate_sites(methylated_sites, transcript_dict,
+                                                         gene_exon_counts, last_exon_for_transcript)
+    outputs = {'exon_annotated': os.path.join(out_dir, "legacy_exon_annotated.tab"),
+               'summary': os.path.join(out_dir, "legacy_summary_per_transcript.tab"),
+               'five_prime_utr': five_prime_sites}
+    results_df.to_csv(outputs['exon_annotated'], index=False, sep="\t")
+    legacy_summarise_methylation_sites(results_df, outputs['summary'])
+    outputs['overall_summary'] = outputs['summary'] + ".overall.summary"
+    return outputs
+
+
+def current_outputs(gtf_file, length_file, m6a_file, threshold, out_dir):
+    """
+    Write the annotated sites and summaries with the current code paths.
+
+    Returns:
+    dict: As legacy_outputs.
+    """
+    from interogate.parse_trans_len import parse_transcript_lengths
+    from interogate.return_dict import transcript_coordinates_from_file
+    from interogate.parse_m6a_site_proba import read_methylated_sites
+    from interogate.annotate import annotate_sites, five_prime_utr_mask
+    from interogate.summary_stats import summarise_methylation_sites
+
+    logger = logging.getLogger('interogate_equivalence')
+    transcript_lengths = parse_transcript_lengths(length_file)
+    transcript_dict, _, gene_exon_counts, _, _ = \
+        transcript_coordinates_from_file(gtf_file, transcript_lengths)
+    methylated_sites = read_methylated_sites(m6a_file, threshold, set(transcript_dict.keys()))
+    results_df = annotate_sites(methylated_sites, transcript_dict, gene_exon_counts)
+
+    rows = np.array([transcript_dict.index.get(transcript_id, -1)
+                     for transcript_id in methylated_sites['transcript_id']], dtype=np.int64)
+    positions = methylated_sites['transcript_position'].to_numpy()
+    is_5prime_utr = five_prime_utr_mask(rows, positions, transcript_dict)
+
+    outputs = {'exon_annotated': os.path.join(out_dir, "current_exon_annotated.tab"),
+               'summary': os.path.join(out_dir, "current_summary_per_transcript.tab"),
+               'five_prime_utr': list(zip(methylated_sites['transcript_id'].to_numpy()[is_5prime_utr],
+                                          positions[is_5prime_utr]))}
+    results_df.to_csv(outputs['exon_annotated'], index=False, sep="\t")
+    summarise_methylation_sites(results_df, outputs['summary'], logger)
+    outputs['overall_summary'] = outputs['summary'] + ".overall.summary"
+    return outputs
+
+
+def compare_code_paths(gtf_file, length_file, m6a_file, threshold, out_dir, rtol=1e-9, atol=1e-12):
+    """
+    Run the original and current code paths on one m6a file and diff their tables.
+
+    Parameters:
+    gtf_file (str): The GTF/GFF annotation.
+    length_file (str): The transcript length file.
+    m6a_file (str): The m6anet data.site_proba.csv.
+    threshold (float): Probability threshold for the sites.
+    out_dir (str): Directory for both sets of outputs.
+    rtol (float): Relative tolerance for numbers.
+    atol (float): Absolute tolerance for numbers.
+
+    Returns:
+    DataFrame: The differing cells of all the tables (see diff_tables).
+    """
+    legacy = legacy_outputs(gtf_file, length_file, m6a_file, threshold, out_dir)
+    current = current_outputs(gtf_file, length_file, m6a_file, threshold, out_dir)
+    differences = [diff_tables(_read_tab(legacy[table]), _read_tab(current[table]), table, rtol, atol)
+                   for table in ('exon_annotated', 'summary', 'overall_summary')]
+    five_prime_columns = ['transcript_id', 'position']
+    differences.append(diff_tables(pd.DataFrame(legacy['five_prime_utr'], columns=five_prime_columns),
+                                   pd.DataFrame(current['five_prime_utr'], columns=five_prime_columns),
+                                   'five_prime_utr'))
+    return pd.concat(differences, ignore_index=True)
+
+
+def compare_benjamini_hochberg(p_values, rtol=1e-9, atol=1e-12):
+    """Diff the vectorised Benjamini-Hochberg correction against the loop."""
+    from interogate.summary_stats import benjamini_hochberg
+
+    return diff_tables(pd.DataFrame({'adjusted_p_value': legacy_benjamini_hochberg(p_values)}),
+                       pd.DataFrame({'adjusted_p_value': benjamini_hochberg(p_values)}),
+                       'benjamini_hochberg', rtol, atol)
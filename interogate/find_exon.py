@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os
 from collections import defaultdict
+from interogate.transcript_model import TranscriptModel
 
 
 def generate_transcript_coordinates(features):
@@ -11,12 +12,12 @@ def generate_transcript_coordinates(features):
     features (list): A list of tuples, each containing the fields of a feature.
 
     Returns:
-    dict: A nested dictionary mapping each transcript ID to a dictionary of exons,
-          where each exon maps to a list of nucleotide positions.
+    TranscriptModel: Maps each transcript ID to a dictionary of exons,
+                     where each exon maps to a range of nucleotide positions.
     """
-    transcript_dict = defaultdict(lambda: defaultdict(list))
+    transcript_exons = defaultdict(dict)
+    transcript_strands = {}
     exon_nucleotide_counters = defaultdict(int)  # To count the nucleotide positions within exons
-    exon_counters = defaultdict(int)  # To count the number of exons per transcript
     
     for feature in features:
         seqname, source, feature_type, start, end, score, strand, frame, attribute = feature
@@ -31,16 +32,15 @@ def generate_transcript_coordinates(features):
                     transcript_id = attr.split('=')[1].strip() if '=' in attr else attr.split()[1].strip().strip('"')
                     break  # Exit the loop once Parent is found
             
-            # If transcript ID is found, add the coordinates to the dictionary
+            # If transcript ID is found, add the exon interval to the dictionary
             if transcript_id:
-                exon_counters[transcript_id] += 1  # Increment exon counter
-                exon_number = exon_counters[transcript_id]  # Current exon number
-                
-                for pos in range(start, end + 1):
-                    transcript_dict[transcript_id][exon_number].append(exon_nucleotide_counters[transcript_id] + 1)
-                    exon_nucleotide_counters[transcript_id] += 1
+                exon_number = len(transcript_exons[transcript_id]) + 1  # Current exon number
+                exon_start = exon_nucleotide_counters[transcript_id] + 1
+                exon_nucleotide_counters[transcript_id] += max(end - start + 1, 0)
+                transcript_exons[transcript_id][exon_number] = (exon_start, exon_nucleotide_counters[transcript_id])
+                transcript_strands[transcript_id] = strand
     
-    return transcript_dict
+    return TranscriptModel.from_exons(transcript_exons, transcript_strands)
 
 
 def query_transcript_exon(transcript_dict, transcript_id, position):
@@ -48,18 +48,13 @@ def query_transcript_exon(transcript_dict, transcript_id, position):
     Query the exon and total number of exons for a given transcript ID and coordinate.
 
     Parameters:
-    transcript_dict (dict): A nested dictionary mapping each transcript ID to a dictionary of exons,
-                            where each exon maps to a list of nucleotide positions.
+    transcript_dict (TranscriptModel): Maps each transcript ID to a dictionary of exons,
+                                       where each exon maps to a range of nucleotide positions.
     transcript_id (str): The ID of the transcript to query.
     position (int): The nucleotide position to query.
 
     Returns:
     tuple: The exon number that the coordinate belongs to and the total number of exons for the transcript.
     """
-    if transcript_id in transcript_dict:
-        for exon_number, coordinates in transcript_dict[transcript_id].items():
-            if position in coordinates:
-                total_exons = len(transcript_dict[transcript_id])
-                return exon_number, total_exons
-    return None, None
-
+    exon_number, total_exons, _ = transcript_dict.query(transcript_id, position)
+    return exon_number, total_exons
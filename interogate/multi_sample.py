@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# multi_sample.py
+
+import numpy as np
+import pandas as pd
+from interogate.annotate import annotate_sites, five_prime_utr_mask
+from interogate.parse_m6a_site_proba import read_methylated_sites
+from interogate.site_categories import CATEGORIES, category_counts
+
+
+def read_samples(m6a_files, threshold=0.9, valid_transcripts=None, keep_probability=False,
+                 logger=None):
+    """
+    Read the methylated sites of several m6anet files into one long table.
+
+    Parameters:
+    m6a_files (list): Paths to the CSV files, one per sample.
+    threshold (float): Probability threshold to consider for methylation prediction.
+    valid_transcripts (set): If given, only sites on these transcripts are kept.
+    keep_probability (bool): Also keep the 'probability_modified' column.
+    logger (Logger): Optional logger, files that cannot be read are reported
+                     to it and left out.
+
+    Returns:
+    DataFrame: The sites of every sample in file order, with a categorical
+               'sample' column (the file path) first.
+    """
+    frames = []
+    samples = []
+    for m6a_file in m6a_files:
+        try:
+            sites = read_methylated_sites(m6a_file, threshold, valid_transcripts,
+                                          keep_probability=keep_probability)
+        except Exception as m6a_file_e:
+            if logger:
+                logger.error(f"An error occurred while processing the file {m6a_file}: {m6a_file_e}")
+            continue
+        if sites.empty and logger:
+            logger.warning(f"No valid methylated sites after filtering for file: {m6a_file}")
+        frames.append(sites)
+        samples.append(m6a_file)
+
+    if not frames:
+        empty = pd.DataFrame({'sample': pd.Categorical([]),
+                              'transcript_id': pd.Categorical([]),
+                              'transcript_position': np.zeros(0, dtype=np.int32)})
+        if keep_probability:
+            empty['probability_modified'] = np.zeros(0, dtype=np.float64)
+        return empty
+    long_df = pd.DataFrame({
+        'sample': pd.Categorical.from_codes(np.repeat(np.arange(len(frames)), [len(f) for f in frames]),
+                                            categories=samples),
+        'transcript_id': pd.api.types.union_categoricals([f['transcript_id'] for f in frames],
+                                                         ignore_order=True)})
+    for column in frames[0].columns[1:]:
+        long_df[column] = np.concatenate([f[column].to_numpy() for f in frames])
+    return long_df
+
+
+def annotate_unique_sites(long_df, transcript_dict, gene_exon_counts):
+    """
+    Annotate each distinct (transcript, position) pair of a long table once.
+
+    Replicates share most of their sites, so this is a fraction of the work
+    of annotating every sample separately.
+
+    Parameters:
+    long_df (DataFrame): Sites with 'transcript_id' (categorical) and 'transcript_position'.
+    transcript_dict (TranscriptModel): The transcript exon coordinates.
+    gene_exon_counts (dict): Maps each gene ID to its total number of unique exons.
+
+    Returns:
+    tuple: The annotation of the distinct sites (DataFrame, as annotate_sites),
+           the row of that table for each site of long_df, and whether each
+           distinct site is in a 5' UTR.
+    """
+    transcript_ids = long_df['transcript_id'].cat
+    codes = transcript_ids.codes.to_numpy().astype(np.int64)
+    keys = (codes << 32) + long_df['transcript_position'].to_numpy().astype(np.int64)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    # keep the distinct sites in order of first appearance
+    appearance = np.argsort(first, kind='stable')
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[appearance] = np.arange(len(first))
+    inverse = rank[inverse.ravel()]
+    first = first[appearance]
+
+    unique_sites = long_df.iloc[first][['transcript_id', 'transcript_position']]
+    annotated = annotate_sites(unique_sites, transcript_dict, gene_exon_counts)
+
+    category_rows = np.array([transcript_dict.index.get(transcript_id, -1)
+                              for transcript_id in transcript_ids.categories], dtype=np.int64)
+    is_5prime_utr = five_prime_utr_mask(category_rows[codes[first]],
+                                        unique_sites['transcript_position'].to_numpy(), transcript_dict)
+    return annotated, inverse, is_5prime_utr
+
+
+def sample_matrix(results_df, samples):
+    """
+    Count the sites of each transcript in each sample.
+
+    Parameters:
+    results_df (DataFrame): Annotated sites with a 'sample' column.
+    samples (list): The samples, in column order.
+
+    Returns:
+    DataFrame: transcript_id then one column of site counts per sample.
+    """
+    matrix = pd.crosstab(pd.Series(results_df['transcript_id'].to_numpy(), name='transcript_id'),
+                         pd.Categorical(results_df['sample'].to_numpy(), categories=samples),
+                         dropna=False)
+    matrix.columns = [str(sample) for sample in matrix.columns]
+    return matrix.reset_index()
+
+
+def category_totals(results_df, samples):
+    """
+    Count the non last exon, last exon and UTR sites of each sample.
+
+    Parameters:
+    results_df (DataFrame): Annotated sites with a 'sample' column.
+    samples (list): The samples, in row order.
+
+    Returns:
+    DataFrame: sample, total_sites and one column per category.
+    """
+    rows = []
+    sample_column = results_df['sample'].to_numpy()
+    for sample in samples:
+        sites = results_df[sample_column == sample]
+        rows.append({'sample': sample, 'total_sites': len(sites), **category_counts(sites)})
+    return pd.DataFrame(rows, columns=['sample', 'total_sites'] + CATEGORIES)
@@ -29,9 +29,9 @@ def parse_gff_gft(file_path):
     with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
         for line in file:
             # Skip comment lines
-            if not test_line(line):
-                continue
             line = test_line(line)
+            if not line:
+                continue
            
             # Split the line into fields
             fields = line.strip().split('\t')
@@ -52,3 +52,41 @@ def parse_gff_gft(file_path):
     
     return features
 
+
+def iter_gff_gft(file_path, feature_types=None, extractor=None):
+    """
+    Stream a GFF/GTF file, yielding only the wanted features one line at a time.
+
+    Only the first three columns are split off to read the feature type, so
+    lines that are not wanted are skipped before the rest of the line is
+    split or any field converted, and the attribute column is handed to the
+    extractor, so only the fields a caller needs are ever built.
+
+    Parameters:
+    file_path (str): Path to the GFF or GTF file.
+    feature_types (set): Feature types to keep, e.g. {'CDS', 'three_prime_UTR'}.
+                         None keeps every feature.
+    extractor (callable): Called with the attribute string, its return value is
+                          yielded in place of the attribute. None yields the string.
+
+    Yields:
+    tuple: (seqname, feature, start, end, strand, attribute or extractor(attribute))
+    """
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+        for line in file:
+            line = test_line(line)
+            if not line:
+                continue
+            if feature_types is None:
+                fields = line.strip().split('\t')
+                rest = fields[3:]
+            else:
+                # split off the first three columns only, the rest of a line
+                # is split once its feature type is known to be wanted
+                fields = line.strip().split('\t', 3)
+                if fields[2] not in feature_types:
+                    continue
+                rest = fields[3].split('\t')
+            attribute = rest[5]
+            yield (fields[0], fields[2], int(rest[0]), int(rest[1]), rest[3],
+                   extractor(attribute) if extractor is not None else attribute)
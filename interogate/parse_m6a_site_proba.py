@@ -1,37 +1,170 @@
 #!/usr/bin/env python3
 #
-# interogate_m6anet.py 
+# interogate_m6anet.py
 
+import numpy as np
 import pandas as pd
 
 
-def identify_methylated_sites(m6a_site_proba, threshold=0.9):
+REQUIRED_COLUMNS = ['transcript_id', 'transcript_position', 'probability_modified']
+# compact dtypes, the probability stays float64. The C parser is asked for
+# correctly rounded floats (float_precision='round_trip'), like pyarrow, as
+# its default parser can be 1 ulp off and flip a site sitting at the threshold
+SITE_DTYPES = {'transcript_id': 'category',
+               'transcript_position': np.int32,
+               'probability_modified': np.float64}
+DEFAULT_CHUNKSIZE = 1000000  # rows per chunk
+DEFAULT_BLOCK_SIZE = 64 * 1024 * 1024  # bytes per pyarrow block
+
+
+def _check_columns(m6a_site_proba):
+    """Read only the header and make sure the required columns are present."""
+    columns = pd.read_csv(m6a_site_proba, nrows=0).columns
+    if not all(col in columns for col in REQUIRED_COLUMNS):
+        raise ValueError(f"The input file must contain the following columns: {REQUIRED_COLUMNS}")
+
+
+def _pandas_chunks(m6a_site_proba, chunksize):
+    """Read the required columns in chunks with the pandas C parser."""
+    return pd.read_csv(m6a_site_proba, usecols=REQUIRED_COLUMNS, dtype=SITE_DTYPES,
+                       float_precision='round_trip', chunksize=chunksize)
+
+
+def _pyarrow_chunks(m6a_site_proba, block_size):
+    """Stream the required columns in record batches with the pyarrow CSV reader."""
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    read_options = pa_csv.ReadOptions(block_size=block_size)
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=REQUIRED_COLUMNS,
+        column_types={'transcript_id': pa.dictionary(pa.int32(), pa.string()),
+                      'transcript_position': pa.int32(),
+                      'probability_modified': pa.float64()})
+    with pa_csv.open_csv(m6a_site_proba, read_options=read_options,
+                         convert_options=convert_options) as reader:
+        for batch in reader:
+            yield batch.to_pandas()
+
+
+def iter_methylated_sites(m6a_site_proba, threshold=0.9, valid_transcripts=None,
+                          chunksize=DEFAULT_CHUNKSIZE, engine=None, keep_probability=False):
     """
-    Identify methylated sites with probability greater than the threshold.
+    Stream methylated sites from a data.site_proba.csv or data.indiv_proba.csv file.
+
+    Only the transcript ID, position and probability columns are read, and the
+    threshold and transcript filters are applied to each chunk as it is read,
+    so memory is bounded by the chunk size rather than the file size.
+
+    Parameters:
+    m6a_site_proba (str): Path to the CSV file.
+    threshold (float): Probability threshold to consider for methylation prediction.
+    valid_transcripts (set): If given, only sites on these transcripts are kept.
+    chunksize (int): Rows per chunk for the pandas reader.
+    engine (str): 'pyarrow' or 'c'. None uses pyarrow when it is installed.
+    keep_probability (bool): Also keep the 'probability_modified' column.
+
+    Yields:
+    pd.DataFrame: 'transcript_id' (categorical) and 'transcript_position' (int32)
+                  of the sites above the threshold in each chunk.
+    """
+    _check_columns(m6a_site_proba)
+    if engine is None:
+        try:
+            import pyarrow.csv  # noqa: F401
+            engine = 'pyarrow'
+        except ImportError:
+            engine = 'c'
+
+    if engine == 'pyarrow':
+        chunks = _pyarrow_chunks(m6a_site_proba, DEFAULT_BLOCK_SIZE)
+    else:
+        chunks = _pandas_chunks(m6a_site_proba, chunksize)
+
+    for chunk in chunks:
+        keep = chunk['probability_modified'].to_numpy() > threshold
+        if valid_transcripts is not None:
+            keep &= chunk['transcript_id'].isin(valid_transcripts).to_numpy()
+        columns = REQUIRED_COLUMNS if keep_probability else REQUIRED_COLUMNS[:2]
+        sites = chunk.loc[keep, columns]
+        if len(sites):
+            sites['transcript_id'] = sites['transcript_id'].cat.remove_unused_categories()
+            yield sites
+
+
+def read_methylated_sites(m6a_site_proba, threshold=0.9, valid_transcripts=None,
+                          chunksize=DEFAULT_CHUNKSIZE, engine=None, iterator=False,
+                          keep_probability=False):
+    """
+    Read the methylated sites of a file in chunks, returning one compact frame.
 
     Parameters:
     m6a_site_proba (str): Path to the CSV file.
     threshold (float): Probability threshold to consider for methylation prediction.
+    valid_transcripts (set): If given, only sites on these transcripts are kept.
+    chunksize (int): Rows per chunk for the pandas reader.
+    engine (str): 'pyarrow' or 'c'. None uses pyarrow when it is installed.
+    iterator (bool): Return the chunk iterator instead of a concatenated frame.
+    keep_probability (bool): Also keep the 'probability_modified' column, e.g.
+                             to apply higher thresholds to the result later.
 
     Returns:
-    pd.DataFrame: DataFrame containing transcript ID and positions of methylated sites above the threshold.
+    pd.DataFrame: 'transcript_id' (categorical) and 'transcript_position' (int32)
+                  of the sites above the threshold, or an iterator of such frames.
     """
-    # Load the CSV file into a DataFrame
-    df = pd.read_csv(m6a_site_proba)
+    chunks = iter_methylated_sites(m6a_site_proba, threshold, valid_transcripts,
+                                   chunksize, engine, keep_probability)
+    if iterator:
+        return chunks
+    chunks = list(chunks)
+    columns = REQUIRED_COLUMNS if keep_probability else REQUIRED_COLUMNS[:2]
+    if not chunks:
+        empty = {'transcript_id': pd.Categorical([]),
+                 'transcript_position': np.zeros(0, dtype=np.int32),
+                 'probability_modified': np.zeros(0, dtype=np.float64)}
+        return pd.DataFrame({column: empty[column] for column in columns})
+    result = {'transcript_id': pd.api.types.union_categoricals([chunk['transcript_id'] for chunk in chunks])}
+    for column in columns[1:]:
+        result[column] = np.concatenate([chunk[column].to_numpy() for chunk in chunks])
+    return pd.DataFrame(result)
 
-    # Ensure the necessary columns exist
-    required_columns = ['transcript_id', 'transcript_position', 'probability_modified']
-    if not all(col in df.columns for col in required_columns):
-        raise ValueError(f"The input file must contain the following columns: {required_columns}")
 
-    # Filter rows where the probability is greater than the threshold
-    methylated_sites = df[df['probability_modified'] > threshold]
+def scan_transcript_ids(m6a_files, threshold=0.9, logger=None):
+    """
+    Collect the transcripts with sites above the threshold in some m6anet files.
 
-    # Select and return the relevant columns
-    result = methylated_sites[['transcript_id', 'transcript_position']]
-    return result
+    Parameters:
+    m6a_files (list): Paths to the CSV files.
+    threshold (float): Probability threshold to consider for methylation prediction.
+    logger (Logger): Optional logger, files that cannot be read are reported
+                     to it and skipped (they fail again when processed).
 
+    Returns:
+    set: The transcript IDs.
+    """
+    transcript_ids = set()
+    for m6a_file in m6a_files:
+        try:
+            for chunk in iter_methylated_sites(m6a_file, threshold):
+                transcript_ids.update(chunk['transcript_id'].cat.categories)
+        except Exception as e:
+            if logger:
+                logger.warning(f"Could not scan {m6a_file} for transcript IDs: {e}")
+    return transcript_ids
 
 
+def identify_methylated_sites(m6a_site_proba, threshold=0.9):
+    """
+    Identify methylated sites with probability greater than the threshold.
 
+    Parameters:
+    m6a_site_proba (str): Path to the CSV file.
+    threshold (float): Probability threshold to consider for methylation prediction.
 
+    Returns:
+    pd.DataFrame: DataFrame containing transcript ID and positions of methylated sites above the threshold.
+    """
+    result = read_methylated_sites(m6a_site_proba, threshold)
+    # plain string IDs and int64 positions, as a full pd.read_csv gives
+    return pd.DataFrame({'transcript_id': result['transcript_id'].astype(str),
+                         'transcript_position': result['transcript_position'].astype(np.int64)})
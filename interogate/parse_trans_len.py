@@ -17,12 +17,13 @@ def test_line(line):
     return line.rstrip()
 
 
-def parse_transcript_lengths(length_file):
+def parse_transcript_lengths(length_file, transcripts=None):
     """
     Parse the length file and return a defaultdict mapping transcript IDs to their lengths.
 
     Parameters:
     length_file (str): Path to the length file.
+    transcripts (set): If given, only the lengths of these transcripts are kept.
 
     Returns:
     defaultdict: defaultdict mapping transcript IDs to their lengths.
@@ -35,6 +36,8 @@ def parse_transcript_lengths(length_file):
                 parts = line.strip().split('\t')
                 if len(parts) == 2:
                     transcript_id, length = parts
+                    if transcripts is not None and transcript_id not in transcripts:
+                        continue
                     transcript_lengths[transcript_id] = int(length)
 
     return transcript_lengths
\ No newline at end of file
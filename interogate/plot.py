@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 #
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.figure import Figure
+from interogate.site_categories import CATEGORIES, bin_sites, normalise_positions
+
+
+COLOURS = ['blue', 'green', 'red']
 
 
 def normalise_position(row, transcript_lengths, transcript_strands):
@@ -16,26 +21,66 @@ def normalise_position(row, transcript_lengths, transcript_strands):
 
     Returns:
     float: normalised position.
+
+    The row at a time version of normalise_positions, which it calls.
+    """
+    return float(normalise_positions([row['transcript_id']], [row['position']],
+                                      transcript_lengths, transcript_strands)[0])
+
+
+def plot_binned_distribution(binned, output_file):
     """
-    transcript_id = row['transcript_id']
-    # print("heeerrrrree:")
-    # print(transcript_lengths)
-    # print(transcript_lengths[transcript_id])
-    if transcript_id in transcript_lengths:
-        length = transcript_lengths[transcript_id]
-        strand = transcript_strands.get(transcript_id, '+')
-        if length != 0:
-            if strand == '+':
-                normalised_position = row['position'] / length
-            else:  # For negative strand
-                normalised_position = (length - row['position'] + 1) / length
-            # print(f"Transcript ID: {transcript_id}, Position: {row['position']}, Length: {length}, normalised Position: {normalised_position}, Strand: {strand}")
-            return normalised_position
-    return 0
+    Draw the category counts and the distribution of normalised positions.
+
+    The violins are drawn from the pre-binned histograms (see
+    site_categories.bin_sites) with the quartiles marked, and the filled
+    areas are rasterised, so the time and PDF size do not grow with the
+    number of sites. Uses a Figure directly rather than pyplot, so it can run
+    in a background thread.
+
+    Parameters:
+    binned (dict): The output of bin_sites.
+    output_file (str): Path to the output PDF file for the plot.
+    """
+    fig = Figure(figsize=(12, 6))
+
+    # Create a bar plot
+    counts = binned['counts']
+    ax = fig.add_subplot(1, 2, 1)
+    ax.bar(list(counts.keys()), list(counts.values()), color=COLOURS)
+    ax.set_xlabel('Category')
+    ax.set_ylabel('Frequency')
+    ax.set_title('Frequency Distribution of Methylation Sites')
+
+    # Create a violin plot from the histograms
+    ax = fig.add_subplot(1, 2, 2)
+    bin_edges = binned['bin_edges']
+    centres = (bin_edges[:-1] + bin_edges[1:]) / 2
+    for x, (category, colour) in enumerate(zip(CATEGORIES, COLOURS)):
+        histogram = binned['histograms'][category]
+        if category not in binned['quantiles'] or not histogram.max():
+            continue
+        half_width = 0.4 * histogram / histogram.max()
+        ax.fill_betweenx(centres, x - half_width, x + half_width, color=colour,
+                         alpha=0.7, linewidth=0, rasterized=True)
+        low, q1, median, q3, high = binned['quantiles'][category]
+        ax.vlines(x, low, high, color='black', linewidth=1)
+        ax.vlines(x, q1, q3, color='black', linewidth=5)
+        ax.scatter([x], [median], color='white', s=15, zorder=3)
+    ax.set_xticks(range(len(CATEGORIES)))
+    ax.set_xticklabels(CATEGORIES)
+    ax.set_xlabel('Category')
+    ax.set_ylabel('Normalised Position')
+    ax.set_title('Distribution of Methylation Sites (normalised)')
+
+    fig.tight_layout()
+
+    # Save the plot to a PDF file
+    fig.savefig(output_file)
 
 
 def plot_methylation_distribution(results_df, output_file, transcript_lengths, 
-                                  transcript_strands, infile_name, logger):
+                                  transcript_strands, infile_name, logger, binned=None):
     """
     Plot the frequency distribution of methylation sites in non-last exons, last exons, and UTRs.
 
@@ -44,56 +89,51 @@ def plot_methylation_distribution(results_df, output_file, transcript_lengths,
     output_file (str): Path to the output PDF file for the plot.
     transcript_lengths (dict): Dictionary mapping transcript IDs to their lengths.
     transcript_strands (dict): Dictionary mapping transcript IDs to their strands.
+    binned (dict): The output of bin_sites, if it has already been computed.
     """
-    # Debugging: Print unique values in 'exon_number'
-    print("Unique values in 'exon_number':", results_df['exon_number'].unique())
-
-    # Debugging: Print the DataFrame before filtering
-    print("DataFrame before filtering:")
-    print(results_df)
-
     # Check if the required columns exist
     if 'exon_number' not in results_df.columns or 'is_last_exon' not in results_df.columns:
         raise KeyError("'exon_number' or 'is_last_exon' column not found in the DataFrame.")
 
-    # Count the occurrences of each category
-    category_counts = {
-        'non_last_exon': len(results_df[(results_df['exon_number'] != 'UTR') & (results_df['is_last_exon'] == False)]),
-        'last_exon': len(results_df[results_df['is_last_exon'] == True]),
-        'UTR': len(results_df[results_df['exon_number'] == 'UTR'])
-    }
+    if binned is None:
+        binned = bin_sites(results_df, transcript_lengths, transcript_strands)
 
-    # Debugging: Print category counts
-    out_info = f"{infile_name}\tCategory counts:\t{category_counts}\n"
+    out_info = f"{infile_name}\tCategory counts:\t{binned['counts']}\n"
     logger.info(out_info)
-    # print("Category counts:", category_counts)
 
-    # Normalize positions by transcript length
-    results_df['normalised_position'] = results_df.apply(normalise_position, axis=1, transcript_lengths=transcript_lengths, transcript_strands=transcript_strands)
+    plot_binned_distribution(binned, output_file)
 
-    # Create a bar plot
-    categories = list(category_counts.keys())
-    counts = list(category_counts.values())
-
-    plt.figure(figsize=(12, 6))
-    
-    plt.subplot(1, 2, 1)  # Create subplot for bar plot
-    plt.bar(categories, counts, color=['blue', 'green', 'red'])
-    plt.xlabel('Category')
-    plt.ylabel('Frequency')
-    plt.title('Frequency Distribution of Methylation Sites')
-    
-    # Create a violin plot
-    plt.subplot(1, 2, 2)  # Create subplot for violin plot
-    results_df['category'] = results_df.apply(
-        lambda row: 'last_exon' if row['is_last_exon'] else ('UTR' if row['exon_number'] == 'UTR' else 'non_last_exon'), axis=1)
-    sns.violinplot(x='category', y='normalised_position', data=results_df, palette=['blue', 'green', 'red'])
-    plt.xlabel('Category')
-    plt.ylabel('Normalised Position')
-    plt.title('Distribution of Methylation Sites (normalised)')
-    
-    plt.tight_layout()
 
-    # Save the plot to a PDF file
-    plt.savefig(output_file)
-    plt.close()
+class PlotWorker:
+    """
+    Draw plots in a background thread so the pipeline does not wait on matplotlib.
+
+    Use as a context manager; leaving it waits for the outstanding plots and
+    logs, rather than raises, any that failed.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(__name__)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+
+    def submit(self, function, *args, **kwargs):
+        """Queue function(*args, **kwargs), usually plot_binned_distribution."""
+        self.pending.append(self.executor.submit(function, *args, **kwargs))
+
+    def wait(self):
+        """Wait for the queued plots, logging any errors."""
+        for future in self.pending:
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.error(f"An error occurred while plotting the methylation distribution: {e}")
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.wait()
+        self.executor.shutdown()
+        return False
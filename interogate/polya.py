@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+#
+# polya.py
+
+# Poly(A) site extraction from direct RNA BAM files, shared by the
+# extract_polyA_sites scripts. The BAM is split by reference (long references
+# into chunks) and the pieces are scanned by a pool of processes, each with
+# its own BAM and FASTA handles, writing its sites to a shard file. The shards
+# are merged in reference order, so the output is the same as one pass of
+# bam.fetch() over the whole file.
+
+import os
+import csv
+import shutil
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+
+POLYA_COLUMNS = ['Read_Name', 'TranscriptID', 'Genomic_Coordinate', 'PolyA_Start', 'PolyA_Length',
+                 'Pre_PolyA_Sequence']
+DISTANCE_COLUMN = 'Distance_From_Stop'
+# references longer than this are scanned in several pieces
+DEFAULT_CHUNK_SIZE = 5_000_000
+# shortest poly(A) tail reported
+DEFAULT_MIN_TAIL_LENGTH = 10
+# CIGAR operations consuming the read (M, I, S, =, X) and the reference (M, D, N, =, X)
+QUERY_OPERATIONS = frozenset((0, 1, 4, 7, 8))
+REFERENCE_OPERATIONS = frozenset((0, 2, 3, 7, 8))
+# shards per process, so that one busy reference does not hold up the others
+SHARDS_PER_THREAD = 4
+
+# the stop codons of the pool workers, set once per process by _init_worker
+_worker_stop_codons = None
+
+
+def bam_regions(references, lengths, mapped_counts=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Split the references of a BAM file into regions to scan.
+
+    Parameters:
+    references (list): Reference names, in BAM header order.
+    lengths (list): Length of each reference.
+    mapped_counts (dict): Optional number of mapped reads per reference (from
+                          the index), references without any are left out.
+    chunk_size (int): Largest region, longer references are split.
+
+    Returns:
+    list: (reference, start, end, expected reads) tuples in header order.
+    """
+    regions = []
+    for reference, length in zip(references, lengths):
+        mapped = mapped_counts.get(reference, 0) if mapped_counts is not None else length
+        if mapped_counts is not None and mapped == 0:
+            continue
+        for start in range(0, max(length, 1), chunk_size):
+            end = min(start + chunk_size, length)
+            regions.append((reference, start, end, mapped * (end - start) / max(length, 1)))
+    return regions
+
+
+def shard_regions(regions, n_shards):
+    """
+    Group consecutive regions into about n_shards shards of similar size.
+
+    Parameters:
+    regions (list): As returned by bam_regions.
+    n_shards (int): Number of shards wanted.
+
+    Returns:
+    list: One list of (reference, start, end) per shard, in region order.
+    """
+    total = sum(region[3] for region in regions)
+    target = total / max(n_shards, 1)
+    shards, shard, size = [], [], 0
+    for reference, start, end, expected in regions:
+        shard.append((reference, start, end))
+        size += expected
+        if size >= target and len(shards) < n_shards - 1:
+            shards.append(shard)
+            shard, size = [], 0
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+def find_polyA_tail(seq, min_length=DEFAULT_MIN_TAIL_LENGTH, max_mismatches=0):
+    """
+    Find the poly(A) tail at the 3' end of a read.
+
+    Only the tail is looked at, walking back from the last base, so the cost
+    is the length of the tail rather than of the read. With max_mismatches 0
+    this is the run of A matched by re.search(r'(A{10,})$', seq).
+
+    Parameters:
+    seq (str): The read sequence, read.query_sequence as stored in the BAM.
+    min_length (int): Shortest tail reported.
+    max_mismatches (int): Number of single non-A bases, each between two A,
+                          allowed inside the tail (basecalling errors).
+
+    Returns:
+    tuple: Start of the tail in seq and its length, or None.
+    """
+    end = len(seq)
+    start = end
+    mismatches = 0
+    i = end - 1
+    while i >= 0:
+        if seq[i] == 'A':
+            start = i
+        elif start < end and mismatches < max_mismatches and i > 0 and seq[i - 1] == 'A':
+            mismatches += 1
+        else:
+            break
+        i -= 1
+    if end - start < min_length:
+        return None
+    return start, end - start
+
+
+def tail_reference_position(cigartuples, reference_end, query_length, tail_start):
+    """
+    Return the reference position of the first base of a poly(A) tail.
+
+    The CIGAR is walked back from the 3' end, so a soft clipped tail (the
+    usual case, poly(A) is not in the reference) is placed just after the
+    last aligned base, and a tail starting in an aligned block at the base it
+    is aligned to, whatever the clipping, insertions and deletions upstream.
+
+    Parameters:
+    cigartuples (list): The (operation, length) pairs of the alignment.
+    reference_end (int): The 0-based end (exclusive) of the alignment.
+    query_length (int): Length of the read sequence (soft clips included).
+    tail_start (int): Start of the tail in the read sequence.
+
+    Returns:
+    int: The 0-based reference position.
+    """
+    reference = reference_end
+    query_end = query_length
+    for operation, length in reversed(cigartuples):
+        if operation in QUERY_OPERATIONS:
+            query_start = query_end - length
+            if tail_start >= query_start:
+                if operation in REFERENCE_OPERATIONS:
+                    return reference - (query_end - tail_start)
+                # soft clip or insertion, after the last aligned base
+                return reference
+            query_end = query_start
+        if operation in REFERENCE_OPERATIONS:
+            reference -= length
+    return reference
+
+
+def scan_regions(bam_file, fasta_file, regions, shard_path, stop_codons=None,
+                 min_length=DEFAULT_MIN_TAIL_LENGTH, max_mismatches=0):
+    """
+    Write the poly(A) sites of the reads starting in the regions to a shard.
+
+    Reads are only reported by the region they start in, so a read overlapping
+    two regions is not counted twice.
+
+    Parameters:
+    bam_file (str): Path to the indexed BAM file.
+    fasta_file (str): Path to the reference FASTA file.
+    regions (list): (reference, start, end) tuples.
+    shard_path (str): Path of the TSV shard to write, without a header.
+    stop_codons (dict): Optional transcript ID to (stop codon position, strand).
+                        If given, only reads on these transcripts are kept and
+                        their distance from the stop codon is added.
+    min_length (int): Shortest poly(A) tail, see find_polyA_tail.
+    max_mismatches (int): Non-A bases allowed in the tail, see find_polyA_tail.
+
+    Returns:
+    int: Number of sites written.
+    """
+    import pysam
+
+    n_sites = 0
+    with pysam.AlignmentFile(bam_file, "rb") as bam, pysam.FastaFile(fasta_file) as fasta, \
+            open(shard_path, 'w', newline='') as shard:
+        writer = csv.writer(shard, delimiter='\t', lineterminator='\n')
+        for reference, start, end in regions:
+            for read in bam.fetch(reference, start, end):
+                if read.is_unmapped or read.reference_start < start:
+                    continue
+                seq = read.query_sequence
+                if seq is None:
+                    continue
+                tail = find_polyA_tail(seq, min_length, max_mismatches)
+                if tail is None:
+                    continue
+                coordinate = tail_reference_position(read.cigartuples, read.reference_end, len(seq), tail[0])
+                if stop_codons is not None and reference not in stop_codons:
+                    continue
+                try:
+                    pre_polyA_seq = fasta.fetch(reference, max(coordinate - 20, 0), coordinate)
+                except KeyError:
+                    logging.error(f"Chromosome '{reference}' not found in FASTA file.")
+                    continue
+                row = [read.query_name, reference, coordinate, coordinate, tail[1], pre_polyA_seq]
+                if stop_codons is not None:
+                    stop_codon_pos, strand = stop_codons[reference]
+                    row.append(coordinate - stop_codon_pos if strand == '+' else stop_codon_pos - coordinate)
+                writer.writerow(row)
+                n_sites += 1
+    return n_sites
+
+
+def _init_worker(stop_codons):
+    global _worker_stop_codons
+    _worker_stop_codons = stop_codons
+
+
+def _scan_task(task):
+    bam_file, fasta_file, regions, shard_path, min_length, max_mismatches = task
+    return scan_regions(bam_file, fasta_file, regions, shard_path, _worker_stop_codons,
+                        min_length, max_mismatches)
+
+
+def plan_shards(bam_file, shard_prefix, n_shards, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Split a BAM file into shards using its header and index statistics.
+
+    Parameters:
+    bam_file (str): Path to the indexed BAM file.
+    shard_prefix (str): Path prefix of the shard files.
+    n_shards (int): Number of shards wanted.
+    chunk_size (int): Largest region, longer references are split.
+
+    Returns:
+    list: (regions, shard path) per shard.
+    """
+    import pysam
+
+    with pysam.AlignmentFile(bam_file, "rb") as bam:
+        mapped_counts = {stat.contig: stat.mapped for stat in bam.get_index_statistics()}
+        regions = bam_regions(bam.references, bam.lengths, mapped_counts, chunk_size)
+    return [(regions, f"{shard_prefix}.{number}.tsv")
+            for number, regions in enumerate(shard_regions(regions, n_shards))]
+
+
+def scan_bam_files(bam_files, fasta_file, shard_dir, threads=1, stop_codons=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, min_length=DEFAULT_MIN_TAIL_LENGTH, max_mismatches=0):
+    """
+    Scan BAM files for poly(A) sites, the references of every file in parallel.
+
+    Parameters:
+    bam_files (list): Paths to the indexed BAM files.
+    fasta_file (str): Path to the reference FASTA file.
+    shard_dir (str): Directory for the shard files.
+    threads (int): Number of processes.
+    stop_codons (dict): See scan_regions.
+    chunk_size (int): Largest region, longer references are split.
+    min_length (int): Shortest poly(A) tail, see find_polyA_tail.
+    max_mismatches (int): Non-A bases allowed in the tail, see find_polyA_tail.
+
+    Returns:
+    list: For each BAM file, its shard paths in order and its number of sites.
+    """
+    n_shards = threads * SHARDS_PER_THREAD if threads > 1 else 1
+    tasks, owners = [], []
+    for index, bam_file in enumerate(bam_files):
+        shard_prefix = os.path.join(shard_dir, f"{index}_{os.path.basename(bam_file)}")
+        for regions, shard_path in plan_shards(bam_file, shard_prefix, n_shards, chunk_size):
+            tasks.append((bam_file, fasta_file, regions, shard_path, min_length, max_mismatches))
+            owners.append(index)
+
+    if threads <= 1:
+        counts = [scan_regions(bam_file, fasta_file, regions, shard_path, stop_codons, min_length, max_mismatches)
+                  for bam_file, fasta_file, regions, shard_path, _, _ in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=threads, initializer=_init_worker,
+                                 initargs=(stop_codons,)) as executor:
+            counts = list(executor.map(_scan_task, tasks))
+
+    results = [([], 0) for _ in bam_files]
+    for task, owner, n_sites in zip(tasks, owners, counts):
+        shard_paths, total = results[owner]
+        results[owner] = (shard_paths + [task[3]], total + n_sites)
+    return results
+
+def merge_shards(shard_paths, output_file, columns):
+    """
+    Concatenate shard files, in order, into one TSV with a header.
+
+    Parameters:
+    shard_paths (list): Shard files written by scan_regions.
+    output_file (str): Path to the merged TSV.
+    columns (list): Column names of the header.
+    """
+    with open(output_file, 'w', newline='') as out_file:
+        out_file.write('\t'.join(columns) + '\n')
+        for shard_path in shard_paths:
+            with open(shard_path) as shard:
+                shutil.copyfileobj(shard, out_file)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+#
+# profiling.py
+
+import os
+import sys
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageProfiler:
+    """
+    Record wall time, CPU time, memory and row counts for pipeline stages.
+
+    Use ``with profiler.stage("annotate", m6a_file) as record:`` around a stage
+    and set ``record['rows']`` inside it. When disabled the stages cost nothing
+    but a context manager call.
+    """
+
+    def __init__(self, enabled=False, trace_memory=False, cprofile_stages=(), cprofile_prefix=None):
+        """
+        Parameters:
+        enabled (bool): Record stages at all.
+        trace_memory (bool): Also record the tracemalloc peak of each stage (slower).
+        cprofile_stages (list): Stage names to run under cProfile.
+        cprofile_prefix (str): Path prefix for the cProfile .prof files.
+        """
+        self.records = []
+        self.started = time.time()
+        self.configure(enabled, trace_memory, cprofile_stages, cprofile_prefix)
+
+    def configure(self, enabled=False, trace_memory=False, cprofile_stages=(), cprofile_prefix=None):
+        """Change the settings, see __init__."""
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.cprofile_stages = set(cprofile_stages or ())
+        self.cprofile_prefix = cprofile_prefix or "profile"
+
+    def settings(self):
+        """Return the settings as keyword arguments for configure."""
+        return {'enabled': self.enabled, 'trace_memory': self.trace_memory,
+                'cprofile_stages': sorted(self.cprofile_stages),
+                'cprofile_prefix': self.cprofile_prefix}
+
+    @contextmanager
+    def stage(self, name, m6a_file=None, threshold=None, background=False):
+        """
+        Time one stage.
+
+        Parameters:
+        name (str): Name of the stage, e.g. 'annotate'.
+        m6a_file (str): The m6a file the stage worked on, if any.
+        threshold (float): The threshold the stage worked on, if any.
+        background (bool): The stage runs in another thread alongside the
+                           other stages. CPU time, RSS and tracemalloc are
+                           process wide, so only its wall time is recorded,
+                           and it is never run under cProfile: only one
+                           profiler can be active at a time (Python 3.12+
+                           refuses a second one) and it would clash with
+                           the cProfile of a foreground stage.
+
+        Yields:
+        dict: The record for this stage; add 'rows' or other counts to it.
+        """
+        record = {'stage': name, 'file': m6a_file, 'threshold': threshold, 'rows': None}
+        if not self.enabled:
+            yield record
+            return
+
+        profiler = None
+        if name in self.cprofile_stages and not background:
+            profiler = cProfile.Profile()
+        trace_memory = self.trace_memory and not background
+        tracing = trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif trace_memory:
+            tracemalloc.reset_peak()
+        rss_before = peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record['wall_s'] = time.perf_counter() - wall_start
+            if not background:
+                record['cpu_s'] = time.process_time() - cpu_start
+                record['peak_rss_mb'] = peak_rss_mb()
+                if rss_before is not None:
+                    record['peak_rss_delta_mb'] = record['peak_rss_mb'] - rss_before
+            if trace_memory:
+                record['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            if tracing:
+                tracemalloc.stop()
+            record['pid'] = os.getpid()
+            if profiler:
+                label = os.path.splitext(m6a_file)[0].replace(os.sep, '_').strip('_.') if m6a_file else "all"
+                if threshold is not None:
+                    label = f"{label}.t{threshold:g}"
+                prof_file = f"{self.cprofile_prefix}.{name}.{label}.prof"
+                profiler.dump_stats(prof_file)
+                record['cprofile'] = prof_file
+            self.records.append(record)
+
+    def pop_records(self):
+        """Return and clear the records collected so far (e.g. in a worker process)."""
+        records, self.records = self.records, []
+        return records
+
+    def write(self, output_file, extra=None):
+        """
+        Write the collected records as JSON.
+
+        Parameters:
+        output_file (str): Path of the JSON report.
+        extra (dict): Extra top level fields, e.g. the command line.
+        """
+        report = {'started': time.asctime(time.localtime(self.started)),
+                  'total_wall_s': time.time() - self.started,
+                  'python': sys.version.split()[0]}
+        report.update(extra or {})
+        report['stages'] = self.records
+        with open(output_file, 'w') as out_file:
+            json.dump(report, out_file, indent=2)
@@ -2,69 +2,134 @@
 import os
 from collections import defaultdict
 import re
+from interogate.parse_gtf import iter_gff_gft
+from interogate.transcript_model import TranscriptModel
 
 
 
+CDS_FEATURES = {'CDS', 'three_prime_UTR'}
+CDS_EXON_NUMBER = re.compile(r'CDS:(\d+)')
+
+
+def cds_attribute_extractor(attribute):
+    """
+    Pull the transcript ID and CDS exon number out of a GFF/GTF attribute column.
+
+    Parameters:
+    attribute (str): The attribute (9th) column of a feature.
+
+    Returns:
+    tuple: The transcript ID (from Parent) and exon number (from a CDS:N ID),
+           either may be None.
+    """
+    transcript_id = None
+    exon_number = None
+    for attr in attribute.split(';'):
+        if 'Parent' in attr:
+            transcript_id = attr.split('=')[1].strip() if '=' in attr else attr.split()[1].strip().strip('"')
+        if 'ID' in attr:
+            exon_match = CDS_EXON_NUMBER.search(attr)
+            if exon_match:
+                exon_number = int(exon_match.group(1))
+    return transcript_id, exon_number
+
+
 def generate_transcript_coordinates(features, transcript_lengths):
     """
     Generate transcript coordinates with continuous nucleotide positions for exons.
     Also, mark the last exon for each transcript.
 
+    Each exon is stored as its cumulative transcript-space start and end in a
+    compact TranscriptModel, rather than as a list of every nucleotide position.
+
     Parameters:
     features (list): A list of tuples, each containing the fields of a feature.
     transcript_lengths (dict): A dictionary mapping transcript IDs to their lengths.
 
     Returns:
-    tuple: A nested dictionary mapping each transcript ID to a dictionary of exons,
-           where each exon maps to a list of nucleotide positions,
+    tuple: A TranscriptModel mapping each transcript ID to a dictionary of exons,
+           where each exon maps to a range of nucleotide positions,
            a dictionary mapping each transcript ID to the number of exons in the transcript,
            and a dictionary mapping each gene ID to the total number of unique exons,
            and a dictionary marking the last exon for each transcript.
     """
-    transcript_dict = defaultdict(lambda: defaultdict(list))
-    transcript_exon_sets = defaultdict(set)
+    records = ((start, end, strand) + cds_attribute_extractor(attribute)
+               for seqname, source, feature_type, start, end, score, strand, frame, attribute in features
+               if feature_type in CDS_FEATURES)
+    return build_transcript_coordinates(records)
+
+
+def transcript_coordinates_from_file(file_path, transcript_lengths, transcripts=None):
+    """
+    Stream a GFF/GTF file straight into transcript coordinates.
+
+    Same result as generate_transcript_coordinates(parse_gff_gft(file_path), ...)
+    but only CDS and three_prime_UTR lines are parsed and no feature list is kept.
+
+    Parameters:
+    file_path (str): Path to the GFF or GTF file.
+    transcript_lengths (dict): A dictionary mapping transcript IDs to their lengths.
+    transcripts (set): If given, only model these transcripts (see
+                       build_transcript_coordinates).
+
+    Returns:
+    tuple: As generate_transcript_coordinates.
+    """
+    records = ((start, end, strand) + transcript_exon
+               for seqname, feature_type, start, end, strand, transcript_exon
+               in iter_gff_gft(file_path, CDS_FEATURES, cds_attribute_extractor))
+    return build_transcript_coordinates(records, transcripts)
+
+
+def build_transcript_coordinates(records, transcripts=None):
+    """
+    Build the TranscriptModel and exon counts from CDS records.
+
+    Parameters:
+    records (iterable): (start, end, strand, transcript_id, exon_number) per
+                        CDS/three_prime_UTR feature, in file order.
+    transcripts (set): If given, only these transcripts are modelled. The
+                       other transcripts of their genes are still counted, so
+                       gene_exon_counts is the same as for the whole file for
+                       every gene that is kept.
+
+    Returns:
+    tuple: As generate_transcript_coordinates.
+    """
+    if transcripts is not None:
+        genes = {transcript_id.split('.')[0] for transcript_id in transcripts}
+        records = (record for record in records
+                   if record[3] and record[3].split('.')[0] in genes)
+
+    transcript_exons = defaultdict(dict)
     gene_exon_sets = defaultdict(set)
-    last_exon_for_transcript = {}
     transcript_strands = defaultdict(str)
     nucleotide_counter = defaultdict(int)  # Initialize the counter to start from 0 for each transcript
 
-    for feature in features:
-        seqname, source, feature_type, start, end, score, strand, frame, attribute = feature
-        
-        if feature_type in ['CDS', 'three_prime_UTR']:
-            transcript_id = None
-            exon_number = None
-            attributes = attribute.split(';')
-            for attr in attributes:
-                if 'Parent' in attr:
-                    transcript_id = attr.split('=')[1].strip() if '=' in attr else attr.split()[1].strip().strip('"')
-                    transcript_strands[transcript_id] = strand
-                if 'ID' in attr:
-                    exon_match = re.search(r'CDS:(\d+)', attr)
-                    if exon_match:
-                        exon_number = int(exon_match.group(1))
-
-            if transcript_id and exon_number:
-                gene_id = transcript_id.split('.')[0]
-                exon_positions = []
-
-                for pos in range(start, end + 1):
-                    nucleotide_counter[transcript_id] += 1
-                    exon_positions.append(nucleotide_counter[transcript_id])
-
-                if strand == '-':
-                    exon_positions = exon_positions[::-1]
-
-                transcript_dict[transcript_id][exon_number] = exon_positions
-                transcript_exon_sets[transcript_id].add(exon_number)
-                gene_exon_sets[gene_id].add(exon_number)
-
-                if transcript_id not in last_exon_for_transcript or exon_number > last_exon_for_transcript[transcript_id]:
-                    last_exon_for_transcript[transcript_id] = exon_number
+    for start, end, strand, transcript_id, exon_number in records:
+        if transcript_id:
+            transcript_strands[transcript_id] = strand
 
+        if transcript_id and exon_number:
+            gene_id = transcript_id.split('.')[0]
+            if transcripts is not None and transcript_id not in transcripts:
+                # another transcript of a wanted gene, it only adds to the gene
+                gene_exon_sets[gene_id].add(exon_number)
+                continue
+            # the exon covers the next (end - start + 1) transcript positions
+            exon_start = nucleotide_counter[transcript_id] + 1
+            nucleotide_counter[transcript_id] += max(end - start + 1, 0)
+            transcript_exons[transcript_id][exon_number] = (exon_start, nucleotide_counter[transcript_id])
+            gene_exon_sets[gene_id].add(exon_number)
+
+    if transcripts is not None:
+        transcript_strands = defaultdict(str, {transcript_id: strand
+                                               for transcript_id, strand in transcript_strands.items()
+                                               if transcript_id in transcripts})
     gene_exon_counts = {gene: len(exons) for gene, exons in gene_exon_sets.items()}
-    trans_exon_counts = {trans: len(exons) for trans, exons in transcript_exon_sets.items()}
-    last_exon_for_transcript = {trans: max(exons) for trans, exons in transcript_exon_sets.items() if exons}
+    trans_exon_counts = {trans: len(exons) for trans, exons in transcript_exons.items()}
+    last_exon_for_transcript = {trans: max(exons) for trans, exons in transcript_exons.items() if exons}
+    transcript_dict = TranscriptModel.from_exons(transcript_exons, transcript_strands)
 
     return transcript_dict, trans_exon_counts, gene_exon_counts, \
           last_exon_for_transcript, transcript_strands
@@ -76,18 +141,24 @@ def query_transcript_exon(transcript_dict, transcript_id, position):
     """
     Query the exon and total number of exons for a given transcript ID and coordinate.
 
+    A TranscriptModel is searched with a binary search over its exon
+    boundaries; a plain nested dict of position lists falls back to a scan.
+
     Parameters:
-    transcript_dict (dict): A nested dictionary mapping each transcript ID to a dictionary of exons,
-                            where each exon maps to a list of nucleotide positions.
+    transcript_dict (TranscriptModel): Maps each transcript ID to a dictionary of exons,
+                                       where each exon maps to a range of nucleotide positions.
     transcript_id (str): The ID of the transcript to query.
     position (int): The nucleotide position to query.
 
     Returns:
     tuple: The exon number that the coordinate belongs to and the total number of exons for the transcript.
     """
+    if isinstance(transcript_dict, TranscriptModel):
+        exon_number, total_exons, _ = transcript_dict.query(transcript_id, position)
+        return exon_number, total_exons
     if transcript_id in transcript_dict:
         for exon_number, coordinates in transcript_dict[transcript_id].items():
             if position in coordinates:
                 total_exons = len(transcript_dict[transcript_id])
                 return exon_number, total_exons
-    return None, None
\ No newline at end of file
+    return None, None
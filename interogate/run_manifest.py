@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# run_manifest.py
+
+import os
+import glob
+import json
+import hashlib
+import tempfile
+from interogate.annotation_cache import file_digest
+
+
+MANIFEST_NAME = "interogate_m6anet.manifest.json"
+MANIFEST_VERSION = 1
+
+
+def code_version():
+    """
+    Return a hash of the interogate sources and the entry script, so outputs
+    made by a different version of the code are not taken as up to date.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sources = sorted(glob.glob(os.path.join(package_dir, "*.py")))
+    sources.append(os.path.join(os.path.dirname(package_dir), "interogate_m6anet.py"))
+    digest = hashlib.blake2b(digest_size=16)
+    for source in sources:
+        if os.path.exists(source):
+            digest.update(os.path.basename(source).encode())
+            digest.update(file_digest(source).encode())
+    return digest.hexdigest()
+
+
+def manifest_path(m6a_file):
+    """Return the manifest of the directory the outputs of m6a_file go to."""
+    return os.path.join(os.path.dirname(os.path.abspath(m6a_file)), MANIFEST_NAME)
+
+
+def read_manifest(path):
+    """
+    Read a manifest, an empty one if it is missing or unreadable.
+
+    Parameters:
+    path (str): Path of the manifest.
+
+    Returns:
+    dict: Maps the m6a file names of the directory to their entries.
+    """
+    try:
+        with open(path) as in_file:
+            manifest = json.load(in_file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('entries', {})
+
+
+def write_manifest(path, entries):
+    """Write the manifest entries atomically."""
+    directory = os.path.dirname(path) or '.'
+    handle, tmp_file = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as out_file:
+            json.dump({'version': MANIFEST_VERSION, 'entries': entries}, out_file, indent=2, sort_keys=True)
+        os.replace(tmp_file, path)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def input_state(m6a_file, previous=None):
+    """
+    Return the size, modification time and content hash of an input file.
+
+    The hash is reused from the previous entry when the size and modification
+    time have not changed, so unchanged inputs are not read again.
+
+    Parameters:
+    m6a_file (str): Path to the m6anet result file.
+    previous (dict): The file's previous manifest entry, if any.
+
+    Returns:
+    dict: 'size', 'mtime_ns' and 'digest'.
+    """
+    stat = os.stat(m6a_file)
+    state = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if previous and all(previous.get(key) == value for key, value in state.items()):
+        state['digest'] = previous['digest']
+    else:
+        state['digest'] = file_digest(m6a_file)
+    return state
+
+
+def is_up_to_date(m6a_file, annotation_key, parameters, version):
+    """
+    Check whether the outputs of an m6a file were made from the same input,
+    annotation, parameters and code, and still exist.
+
+    Parameters:
+    m6a_file (str): Path to the m6anet result file.
+    annotation_key (str): Content key of the GTF and length files (cache_key).
+    parameters (dict): The run parameters that change the outputs.
+    version (str): The code_version.
+
+    Returns:
+    bool: True if the file can be skipped.
+    """
+    entry = read_manifest(manifest_path(m6a_file)).get(os.path.basename(m6a_file))
+    if not entry or not os.path.exists(m6a_file):
+        return False
+    if (entry.get('annotation') != annotation_key or entry.get('parameters') != parameters
+            or entry.get('code_version') != version):
+        return False
+    if input_state(m6a_file, entry['input'])['digest'] != entry['input']['digest']:
+        return False
+    return all(os.path.exists(output) for output in entry.get('outputs', []))
+
+
+def record_outputs(m6a_file, outputs, annotation_key, parameters, version):
+    """
+    Record in the manifest that m6a_file was processed into outputs.
+
+    Parameters:
+    m6a_file (str): Path to the m6anet result file.
+    outputs (list): The output files written.
+    annotation_key (str): Content key of the GTF and length files (cache_key).
+    parameters (dict): The run parameters that change the outputs.
+    version (str): The code_version.
+    """
+    path = manifest_path(m6a_file)
+    entries = read_manifest(path)
+    name = os.path.basename(m6a_file)
+    entries[name] = {'input': input_state(m6a_file, entries.get(name, {}).get('input')),
+                     'annotation': annotation_key,
+                     'parameters': parameters,
+                     'code_version': version,
+                     'outputs': [os.path.abspath(output) for output in outputs]}
+    write_manifest(path, entries)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# site_categories.py
+
+import numpy as np
+import pandas as pd
+
+
+CATEGORIES = ['non_last_exon', 'last_exon', 'UTR']
+
+
+def category_masks(results_df):
+    """
+    Return boolean masks of the UTR and last exon sites.
+
+    Parameters:
+    results_df (DataFrame): DataFrame containing the methylation site annotations.
+
+    Returns:
+    tuple: NumPy arrays is_utr and is_last_exon. Sites that are neither are
+           in a non-last exon.
+    """
+    is_utr = (results_df['exon_number'] == 'UTR').to_numpy(dtype=bool)
+    is_last_exon = results_df['is_last_exon'].to_numpy(dtype=bool)
+    return is_utr, is_last_exon
+
+
+def category_counts(results_df):
+    """Return the number of non last exon, last exon and UTR sites."""
+    is_utr, is_last_exon = category_masks(results_df)
+    return {'non_last_exon': int((~is_utr & ~is_last_exon).sum()),
+            'last_exon': int(is_last_exon.sum()),
+            'UTR': int(is_utr.sum())}
+
+
+def assign_categories(results_df):
+    """
+    Label every site 'last_exon', 'UTR' or 'non_last_exon'.
+
+    Parameters:
+    results_df (DataFrame): DataFrame containing the methylation site annotations.
+
+    Returns:
+    array: The category of each site (last exon wins over UTR).
+    """
+    is_utr, is_last_exon = category_masks(results_df)
+    labels = np.array(CATEGORIES, dtype=object)
+    return labels[np.where(is_last_exon, 1, np.where(is_utr, 2, 0))]
+
+
+def normalise_positions(transcript_ids, positions, transcript_lengths, transcript_strands):
+    """
+    Normalise many positions by their transcript length at once.
+
+    Each distinct transcript is looked up once and the length and strand are
+    broadcast to its sites. Positions on the - strand are measured from the
+    other end, (length - position + 1) / length. Sites on transcripts without
+    a (non zero) length get 0.
+
+    Parameters:
+    transcript_ids (array): Transcript ID of each site.
+    positions (array): Transcript position of each site.
+    transcript_lengths (dict): Dictionary mapping transcript IDs to their lengths.
+    transcript_strands (dict): Dictionary mapping transcript IDs to their strands.
+
+    Returns:
+    array: The normalised position of each site.
+    """
+    codes, unique_ids = pd.factorize(np.asarray(transcript_ids))
+    positions = np.asarray(positions, dtype=np.float64)
+    lengths = np.array([transcript_lengths[transcript_id] if transcript_id in transcript_lengths else 0
+                        for transcript_id in unique_ids], dtype=np.float64)
+    minus = np.array([transcript_strands.get(transcript_id, '+') != '+'
+                      for transcript_id in unique_ids], dtype=bool)
+
+    site_lengths = lengths[codes]
+    known = site_lengths != 0
+    safe_lengths = np.where(known, site_lengths, 1)
+    normalised = np.where(minus[codes], (site_lengths - positions + 1) / safe_lengths,
+                          positions / safe_lengths)
+    return np.where(known, normalised, 0.0)
+
+
+DEFAULT_BINS = 100
+QUANTILES = [0.0, 0.25, 0.5, 0.75, 1.0]
+
+
+def bin_sites(results_df, transcript_lengths, transcript_strands, bins=DEFAULT_BINS):
+    """
+    Reduce the sites to what the distribution plot needs.
+
+    The normalised positions of each category are binned into a histogram
+    over [0, 1] and summarised by their quantiles, so drawing the plot costs
+    the same however many sites there are. Sites outside [0, 1] (a position
+    past the annotated transcript length) are left out of both and counted
+    instead of being piled into the edge bins.
+
+    Parameters:
+    results_df (DataFrame): DataFrame containing the methylation site annotations.
+    transcript_lengths (dict): Dictionary mapping transcript IDs to their lengths.
+    transcript_strands (dict): Dictionary mapping transcript IDs to their strands.
+    bins (int): Number of histogram bins.
+
+    Returns:
+    dict: 'counts' (sites per category), 'bin_edges', 'histograms',
+          'quantiles' (per category, QUANTILES of the normalised positions,
+          only for categories with sites in range) and 'out_of_range' (sites
+          per category left out of the histograms).
+    """
+    normalised = normalise_positions(results_df['transcript_id'].to_numpy(),
+                                     results_df['position'].to_numpy(),
+                                     transcript_lengths, transcript_strands)
+    categories = assign_categories(results_df)
+    in_range = (normalised >= 0.0) & (normalised <= 1.0)
+    bin_edges = np.linspace(0.0, 1.0, bins + 1)
+    histograms = {}
+    quantiles = {}
+    out_of_range = {}
+    for category in CATEGORIES:
+        in_category = categories == category
+        values = normalised[in_category & in_range]
+        out_of_range[category] = int(in_category.sum()) - len(values)
+        histograms[category] = np.histogram(values, bins=bin_edges)[0]
+        if len(values):
+            quantiles[category] = np.quantile(values, QUANTILES)
+    return {'counts': category_counts(results_df), 'bin_edges': bin_edges,
+            'histograms': histograms, 'quantiles': quantiles, 'out_of_range': out_of_range}
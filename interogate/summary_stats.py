@@ -2,8 +2,10 @@
 #
 
 import pandas as pd
-from scipy.stats import chi2_contingency
+from scipy.stats import chi2 as chi2_dist
 import numpy as np
+from interogate.site_categories import category_masks
+from interogate.table_io import write_table
 
 
     # chi-squared test can be used to compare the observed distribution 
@@ -19,10 +21,6 @@ import numpy as np
 # A p-value of 1.0 indicates that there is no evidence to reject the null hypothesis, 
 
 
-import pandas as pd
-from scipy.stats import chi2_contingency
-import numpy as np
-
 def benjamini_hochberg(p_values):
     """
     Apply the Benjamini-Hochberg correction for multiple hypothesis testing.
@@ -31,87 +29,116 @@ def benjamini_hochberg(p_values):
     p_values (list): List of p-values to correct.
 
     Returns:
-    list: List of adjusted p-values.
+    array: Adjusted p-values, in the order of the input.
     """
-    p_values = np.array(p_values)
+    p_values = np.asarray(p_values, dtype=float)
     n = len(p_values)
-    sorted_indices = np.argsort(p_values)
-    sorted_p_values = p_values[sorted_indices]
-    adjusted_p_values = np.zeros(n)
-    
-    cummin = sorted_p_values[-1]
-    adjusted_p_values[sorted_indices[-1]] = cummin
-    for i in range(n-2, -1, -1):
-        cummin = min(cummin, sorted_p_values[i] * n / (i + 1))
-        adjusted_p_values[sorted_indices[i]] = cummin
-    
+    if n == 0:
+        return np.zeros(0)
+    sorted_indices = np.argsort(p_values, kind='stable')
+    scaled = p_values[sorted_indices] * n / np.arange(1, n + 1)
+    # running minimum from the largest p-value down
+    adjusted = np.minimum.accumulate(scaled[::-1])[::-1]
+    adjusted_p_values = np.empty(n)
+    adjusted_p_values[sorted_indices] = adjusted
     return adjusted_p_values
 
-def summarise_methylation_sites(results_df, output_file, logger):
+
+def chi2_2x2(table, correction=True):
+    """
+    Chi-squared test of many 2x2 contingency tables at once.
+
+    Gives the same statistic and p-value as scipy's chi2_contingency on each
+    table (including the Yates continuity correction), in closed form.
+
+    Parameters:
+    table (array): Shape (n, 2, 2), one contingency table per row.
+    correction (bool): Apply the Yates continuity correction.
+
+    Returns:
+    tuple: Arrays of the chi-squared statistics and the p-values.
+    """
+    table = np.asarray(table, dtype=float)
+    total = table.sum(axis=(1, 2))
+    row_sums = table.sum(axis=2)
+    col_sums = table.sum(axis=1)
+    expected = row_sums[:, :, None] * col_sums[:, None, :] / total[:, None, None]
+    deviation = np.abs(table - expected)
+    if correction:
+        deviation = deviation - np.minimum(0.5, deviation)
+    chi2 = (deviation ** 2 / expected).sum(axis=(1, 2))
+    return chi2, chi2_dist.sf(chi2, 1)
+
+
+def site_counts_per_transcript(results_df):
+    """
+    Count the site categories of each transcript.
+
+    Parameters:
+    results_df (DataFrame): DataFrame containing the methylation site annotations.
+
+    Returns:
+    DataFrame: One row per transcript (sorted by ID) with 'total_sites',
+               'non_last_exon_sites', 'last_exon_sites', 'utr_sites' and
+               'last_exon_and_utr_sites'.
+    """
+    codes, transcript_ids = pd.factorize(results_df['transcript_id'], sort=True)
+    n_transcripts = len(transcript_ids)
+    is_utr, is_last = category_masks(results_df)
+
+    def count(mask=None):
+        return np.bincount(codes, weights=mask, minlength=n_transcripts).astype(np.int64)
+
+    return pd.DataFrame({
+        'transcript_id': np.asarray(transcript_ids, dtype=object),
+        'total_sites': count(),
+        'non_last_exon_sites': count(~is_utr & ~is_last),
+        'last_exon_sites': count(is_last),
+        'utr_sites': count(is_utr),
+        'last_exon_and_utr_sites': count(is_utr | is_last),
+    })
+
+
+def summarise_methylation_sites(results_df, output_file, logger, output_format='tsv'):
     """
     Summarize the number of methylation sites per transcript and perform statistical comparison.
 
     Parameters:
     results_df (DataFrame): DataFrame containing the methylation site annotations.
-    output_file (str): Path to the output file for the summary.
+    output_file (str): Path to the output file for the summary (its TSV name).
     logger (Logger): Logger for logging information.
+    output_format (str): One of table_io.OUTPUT_FORMATS.
     """
     # Summarize the data
-    summary = results_df.groupby('transcript_id').apply(lambda df: pd.Series({
-        'total_sites': len(df),
-        'non_last_exon_sites': len(df[(df['exon_number'] != 'UTR') & (df['is_last_exon'] == False)]),
-        'last_exon_sites': len(df[df['is_last_exon'] == True]),
-        'utr_sites': len(df[df['exon_number'] == 'UTR']),
-        'last_exon_and_utr_sites': len(df[(df['exon_number'] == 'UTR') | (df['is_last_exon'] == True)])
-    })).reset_index()
+    summary = site_counts_per_transcript(results_df)
+    non_last_exon_sites = summary['non_last_exon_sites'].to_numpy()
+    last_exon_and_utr_sites = summary['last_exon_and_utr_sites'].to_numpy()
 
     # Calculate ratios for each transcript
-    summary['ratio_non_last_to_last_and_utr'] = summary.apply(
-        lambda row: row['non_last_exon_sites'] / row['last_exon_and_utr_sites'] if row['last_exon_and_utr_sites'] != 0 else 0,
-        axis=1
-    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summary['ratio_non_last_to_last_and_utr'] = np.where(
+            last_exon_and_utr_sites != 0, non_last_exon_sites / last_exon_and_utr_sites, 0.0)
 
-    # Initialize columns for chi-squared test results
+    # Chi-squared test for each transcript with both kinds of site.
+    # The expected frequencies are based on the transcript's own distribution
+    # (total_sites * category / total_sites), i.e. the observed counts.
     summary['chi2'] = np.nan
     summary['p_value'] = np.nan
-
-    # Perform chi-squared test for each transcript
-    for index, row in summary.iterrows():
-        non_last_exon_sites = row['non_last_exon_sites']
-        last_exon_and_utr_sites = row['last_exon_and_utr_sites']
-        total_sites = row['total_sites']
-        if total_sites == 0:
-            continue
-
-        # Define observed frequencies
-        observed = [non_last_exon_sites, last_exon_and_utr_sites]
-
-        # Calculate the expected frequencies based on the overall distribution
-        expected_non_last_exon = total_sites * (non_last_exon_sites / total_sites)
-        expected_last_exon_and_utr = total_sites * (last_exon_and_utr_sites / total_sites)
-        
-        expected = [expected_non_last_exon, expected_last_exon_and_utr]
-
-        # Check if expected frequencies have zero elements
-        if any(e == 0 for e in expected):
-            continue
-        
-        try:
-            chi2, p, _, _ = chi2_contingency([observed, expected])
-            summary.at[index, 'chi2'] = chi2
-            summary.at[index, 'p_value'] = p
-        except ValueError as e:
-            logger.warning(f"Chi-squared test could not be performed for transcript {row['transcript_id']}: {e}")
-
-    # Apply Benjamini-Hochberg correction to the p-values
-    p_values = summary['p_value'].dropna().tolist()
-    if p_values:
-        adjusted_p_values = benjamini_hochberg(p_values)
-        summary.loc[summary['p_value'].notna(), 'adjusted_p_value'] = adjusted_p_values
+    testable = (non_last_exon_sites > 0) & (last_exon_and_utr_sites > 0)
+    if testable.any():
+        observed = np.stack([non_last_exon_sites[testable], last_exon_and_utr_sites[testable]], axis=1)
+        total_sites = summary['total_sites'].to_numpy()[testable][:, None]
+        expected = total_sites * (observed / total_sites)
+        chi2, p_values = chi2_2x2(np.stack([observed, expected], axis=1))
+        summary.loc[testable, 'chi2'] = chi2
+        summary.loc[testable, 'p_value'] = p_values
+
+        # Apply Benjamini-Hochberg correction to the p-values
+        summary.loc[testable, 'adjusted_p_value'] = benjamini_hochberg(p_values)
 
     # Write summary to a file
-    summary.to_csv(output_file, index=False, sep="\t")
-    out_note = f"Summary saved to {output_file}"
+    summary_file = write_table(summary, output_file, output_format)
+    out_note = f"Summary saved to {summary_file}"
     logger.info(out_note)
 
     # Print the summary DataFrame for visual confirmation
@@ -147,8 +174,8 @@ def summarise_methylation_sites(results_df, output_file, logger):
 
     overall_summary_df = pd.DataFrame(overall_summary.items(), columns=['Statistic', 'Value'])
 
-    output_summary_file = output_file + ".overall.summary"
-    overall_summary_df.to_csv(output_summary_file, index=False, sep="\t")
+    output_summary_file = write_table(overall_summary_df, output_file + ".overall.summary",
+                                      output_format)
     logger.info(f"Overall summary saved to {output_summary_file}")
     logger.info(overall_summary_df)
 
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+#
+# synthetic.py
+
+import os
+import numpy as np
+
+
+SITE_PROBA_COLUMNS = ['transcript_id', 'transcript_position', 'n_reads', 'probability_modified',
+                      'kmer', 'mod_ratio']
+INDIV_PROBA_COLUMNS = ['transcript_id', 'transcript_position', 'read_index', 'probability_modified']
+KMERS = ['GGACT', 'GGACA', 'GAACT', 'AGACT', 'TGACA', 'GGACC']
+
+
+def _attributes(gene_id, transcript_id, feature, number):
+    """Araport11 style attribute column of a CDS or UTR line."""
+    feature_id = f"{gene_id}:{feature}:{number}"
+    return f"ID={feature_id};Parent={transcript_id};Name={feature_id}"
+
+
+def write_synthetic_annotation(gtf_file, length_file, n_transcripts=1000, mean_exons=5,
+                               transcripts_per_gene=2, seed=0):
+    """
+    Write a synthetic Araport11 style GFF and the matching transcript length file.
+
+    Every transcript gets a 5' UTR, a number of CDS exons (Poisson around
+    mean_exons, at least one) and a 3' UTR, on a random strand, laid out the
+    way the Araport11 GFF is so the normal parsers read it. Features are in
+    ascending coordinate order, so - strand transcripts list their last
+    exon first, as in the real file.
+
+    Parameters:
+    gtf_file (str): Path of the GFF to write.
+    length_file (str): Path of the transcript length file to write.
+    n_transcripts (int): Number of transcripts.
+    mean_exons (float): Mean number of CDS exons per transcript.
+    transcripts_per_gene (int): Transcripts (isoforms) per gene.
+    seed (int): Random seed.
+
+    Returns:
+    dict: Maps each transcript ID to its length.
+    """
+    rng = np.random.default_rng(seed)
+    transcript_lengths = {}
+    with open(gtf_file, 'w') as gtf, open(length_file, 'w') as lengths:
+        gtf.write("##gff-version 3\n")
+        for transcript in range(n_transcripts):
+            gene_number = transcript // transcripts_per_gene
+            gene_id = f"SYN{gene_number:07d}"
+            transcript_id = f"{gene_id}.{transcript % transcripts_per_gene + 1}"
+            seqname = str(gene_number % 5 + 1)
+            strand = '+' if rng.random() < 0.5 else '-'
+            n_exons = max(1, int(rng.poisson(mean_exons)))
+            exon_lengths = rng.integers(30, 400, size=n_exons)
+            intron_lengths = rng.integers(50, 1000, size=n_exons)
+            utr5, utr3 = (int(x) for x in rng.integers(20, 300, size=2))
+
+            # features in 5' to 3' transcript order: 5' UTR, CDS 1..n, 3' UTR
+            features = [('five_prime_UTR', 1, utr5)]
+            features += [('CDS', n + 1, int(exon_lengths[n])) for n in range(n_exons)]
+            features += [('three_prime_UTR', 1, utr3)]
+            gaps = [0] + [int(gap) for gap in intron_lengths[:n_exons]] + [0]
+
+            start = gene_number * 100000 + 1000
+            placed = []
+            for (feature, number, length), gap in zip(features, gaps):
+                start += gap
+                placed.append((feature, number, start, start + length - 1))
+                start += length
+            if strand == '-':
+                # mirror so the 5' end is at the highest coordinate, and list the
+                # features by ascending coordinate as a sorted GFF does
+                end = placed[-1][3]
+                offset = placed[0][2]
+                placed = [(feature, number, end - (stop - offset), end - (first - offset))
+                          for feature, number, first, stop in placed][::-1]
+
+            gene_start = min(first for _, _, first, _ in placed)
+            gene_end = max(stop for _, _, _, stop in placed)
+            if transcript % transcripts_per_gene == 0:
+                gtf.write(f"{seqname}\tSynthetic\tgene\t{gene_start}\t{gene_end}\t.\t{strand}\t.\t"
+                          f"ID={gene_id};Name={gene_id}\n")
+            gtf.write(f"{seqname}\tSynthetic\tmRNA\t{gene_start}\t{gene_end}\t.\t{strand}\t.\t"
+                      f"ID={transcript_id};Parent={gene_id};Name={transcript_id}\n")
+            for feature, number, first, stop in placed:
+                gtf.write(f"{seqname}\tSynthetic\t{feature}\t{first}\t{stop}\t.\t{strand}\t.\t"
+                          f"{_attributes(gene_id, transcript_id, feature, number)}\n")
+
+            length = sum(stop - first + 1 for _, _, first, stop in placed)
+            transcript_lengths[transcript_id] = length
+            lengths.write(f"{transcript_id}\t{length}\n")
+    return transcript_lengths
+
+
+def write_synthetic_sites(m6a_file, transcript_lengths, site_density=0.01, seed=0,
+                          individual=False, reads_per_site=5):
+    """
+    Write a synthetic m6anet data.site_proba.csv (or data.indiv_proba.csv).
+
+    Parameters:
+    m6a_file (str): Path of the CSV to write.
+    transcript_lengths (dict): Maps each transcript ID to its length.
+    site_density (float): Sites per transcript nucleotide.
+    seed (int): Random seed.
+    individual (bool): Write the per read data.indiv_proba.csv layout.
+    reads_per_site (int): Reads per site for the per read layout.
+
+    Returns:
+    int: The number of rows written.
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    transcript_ids = np.array(list(transcript_lengths.keys()), dtype=object)
+    lengths = np.array(list(transcript_lengths.values()), dtype=np.int64)
+    counts = rng.poisson(lengths * site_density)
+    site_transcripts = np.repeat(transcript_ids, counts)
+    positions = (rng.random(len(site_transcripts)) * np.repeat(lengths, counts)).astype(np.int64) + 1
+    n_sites = len(site_transcripts)
+
+    if individual:
+        sites = pd.DataFrame({
+            'transcript_id': np.repeat(site_transcripts, reads_per_site),
+            'transcript_position': np.repeat(positions, reads_per_site),
+            'read_index': rng.integers(0, 100000, size=n_sites * reads_per_site),
+            'probability_modified': rng.beta(0.5, 0.5, size=n_sites * reads_per_site)},
+            columns=INDIV_PROBA_COLUMNS)
+    else:
+        sites = pd.DataFrame({
+            'transcript_id': site_transcripts,
+            'transcript_position': positions,
+            'n_reads': rng.integers(20, 500, size=n_sites),
+            'probability_modified': rng.beta(0.5, 0.5, size=n_sites),
+            'kmer': rng.choice(KMERS, size=n_sites),
+            'mod_ratio': rng.random(n_sites)},
+            columns=SITE_PROBA_COLUMNS)
+    sites.to_csv(m6a_file, index=False)
+    return len(sites)
+
+
+def write_synthetic_dataset(out_dir, n_transcripts=1000, mean_exons=5, site_density=0.01,
+                            n_samples=1, seed=0, indiv_reads=0):
+    """
+    Write a synthetic GFF, length file and one site_proba CSV per sample, and
+    optionally the per read indiv_proba CSV of each sample too.
+
+    Parameters:
+    out_dir (str): Directory to write into (created if needed).
+    n_transcripts (int): Number of transcripts.
+    mean_exons (float): Mean number of CDS exons per transcript.
+    site_density (float): Sites per transcript nucleotide.
+    n_samples (int): Number of site_proba files.
+    seed (int): Random seed.
+    indiv_reads (int): Reads per site of the data.indiv_proba.csv files, 0 to
+                       not write them.
+
+    Returns:
+    dict: 'gtf', 'length', 'm6a' and 'indiv' (lists of CSV paths, 'indiv'
+          is empty without indiv_reads).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    gtf_file = os.path.join(out_dir, "synthetic.gff")
+    length_file = os.path.join(out_dir, "synthetic.cdna.len")
+    transcript_lengths = write_synthetic_annotation(gtf_file, length_file, n_transcripts,
+                                                    mean_exons, seed=seed)
+    m6a_files = []
+    indiv_files = []
+    for sample in range(n_samples):
+        m6a_file = os.path.join(out_dir, f"sample{sample + 1}.site_proba.csv")
+        write_synthetic_sites(m6a_file, transcript_lengths, site_density, seed + sample + 1)
+        m6a_files.append(m6a_file)
+        if indiv_reads:
+            indiv_file = os.path.join(out_dir, f"sample{sample + 1}.indiv_proba.csv")
+            write_synthetic_sites(indiv_file, transcript_lengths, site_density, seed + sample + 1,
+                                  individual=True, reads_per_site=indiv_reads)
+            indiv_files.append(indiv_file)
+    return {'gtf': gtf_file, 'length': length_file, 'm6a': m6a_files, 'indiv': indiv_files}
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+#
+# table_io.py
+
+import os
+import csv
+import gzip
+
+
+OUTPUT_FORMATS = ['tsv', 'tsv.gz', 'tsv.zst', 'parquet', 'feather']
+# columns that mix numbers and labels ('UTR', 'Unknown'), always written as
+# strings in the columnar formats so every file has the same schema
+STRING_COLUMNS = {'transcript_id', 'exon_number', 'total_exons_in_gene', 'sample'}
+FLOAT_COLUMNS = {'total_exons_in_transcript'}
+
+
+def output_path(path, output_format='tsv'):
+    """
+    Return the file name a table is written to in a format.
+
+    TSV keeps the given name, compressed TSV adds .gz/.zst and the columnar
+    formats drop the .tab part of the name and add .parquet/.feather, e.g.
+    a_summary_per_transcript.tab.overall.summary becomes
+    a_summary_per_transcript.overall.summary.parquet.
+
+    Parameters:
+    path (str): The TSV name of the table, e.g. sample_exon_annotated.tab.
+    output_format (str): One of OUTPUT_FORMATS.
+
+    Returns:
+    str: The path to write.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format}, use one of {OUTPUT_FORMATS}")
+    if output_format == 'tsv':
+        return path
+    if output_format.startswith('tsv.'):
+        return f"{path}.{output_format.split('.')[1]}"
+    directory, name = os.path.split(path)
+    parts = name.split('.')
+    if 'tab' in parts[1:]:
+        del parts[len(parts) - 1 - parts[::-1].index('tab')]
+    return os.path.join(directory, f"{'.'.join(parts)}.{output_format}")
+
+
+def stable_dtypes(df):
+    """
+    Return a copy of df with the same column types whatever the data held.
+
+    The mixed int/'UTR' and int/'Unknown' columns (and any other object
+    column) become strings and total_exons_in_transcript is always float.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if column in FLOAT_COLUMNS:
+            df[column] = df[column].astype('float64')
+        elif column in STRING_COLUMNS or df[column].dtype == object:
+            df[column] = df[column].astype(str)
+    return df
+
+
+def write_table(df, path, output_format='tsv'):
+    """
+    Write a table as TSV (optionally compressed), Parquet or Feather.
+
+    Parameters:
+    df (DataFrame): The table.
+    path (str): The TSV name of the table, see output_path.
+    output_format (str): One of OUTPUT_FORMATS.
+
+    Returns:
+    str: The path written.
+    """
+    path = output_path(path, output_format)
+    if output_format == 'tsv':
+        df.to_csv(path, index=False, sep="\t")
+    elif output_format == 'tsv.gz':
+        df.to_csv(path, index=False, sep="\t", compression='gzip')
+    elif output_format == 'tsv.zst':
+        try:
+            df.to_csv(path, index=False, sep="\t", compression='zstd')
+        except ImportError as e:
+            raise ImportError(f"tsv.zst output needs the zstandard package: {e}")
+    elif output_format == 'parquet':
+        stable_dtypes(df).to_parquet(path, index=False)
+    else:
+        stable_dtypes(df).reset_index(drop=True).to_feather(path)
+    return path
+
+
+def table_format(path):
+    """Return the format of a table file from its name."""
+    if path.endswith('.parquet'):
+        return 'parquet'
+    if path.endswith('.feather'):
+        return 'feather'
+    if path.endswith('.gz'):
+        return 'tsv.gz'
+    if path.endswith('.zst'):
+        return 'tsv.zst'
+    return 'tsv'
+
+
+def read_table(path):
+    """
+    Read a table written by write_table (any format) into a DataFrame.
+
+    Parameters:
+    path (str): Path to the table.
+
+    Returns:
+    DataFrame: The table.
+    """
+    import pandas as pd
+
+    file_format = table_format(path)
+    if file_format == 'parquet':
+        return pd.read_parquet(path)
+    if file_format == 'feather':
+        return pd.read_feather(path)
+    return pd.read_csv(path, sep="\t")
+
+
+def iter_table_rows(path):
+    """
+    Yield the rows of a table as dicts of strings, like csv.DictReader.
+
+    Plain and gzipped TSV are read with csv.DictReader itself, so the
+    downstream scripts see exactly the values they always did; the other
+    formats go through pandas and missing values become ''.
+
+    Parameters:
+    path (str): Path to the table.
+
+    Yields:
+    dict: Column name to value for each row.
+    """
+    file_format = table_format(path)
+    if file_format in ('tsv', 'tsv.gz'):
+        opener = gzip.open if file_format == 'tsv.gz' else open
+        with opener(path, mode='rt') as file:
+            yield from csv.DictReader(file, delimiter='\t')
+        return
+    if file_format == 'tsv.zst':
+        import pandas as pd
+        df = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+    else:
+        df = read_table(path)
+    columns = list(df.columns)
+    values = [['' if value is None or value != value else str(value) for value in df[column].tolist()]
+              for column in columns]
+    for row in zip(*values):
+        yield dict(zip(columns, row))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+#
+# transcript_model.py
+
+from bisect import bisect_right
+from collections.abc import Mapping
+import numpy as np
+
+
+class TranscriptModel(Mapping):
+    """
+    Compact, array-backed store of transcript exon coordinates.
+
+    Each exon is held as its cumulative transcript-space interval (1-based,
+    inclusive start and end) instead of a list holding every nucleotide
+    position. The exons of all transcripts live in flat NumPy arrays and
+    ``offsets[i]:offsets[i + 1]`` is the slice belonging to transcript ``i``,
+    ordered by transcript-space start.
+
+    The model can be used wherever the old nested ``transcript_dict`` was:
+    ``model[transcript_id]`` returns a dict of exon number to a ``range`` of
+    positions, so ``position in exons[n]`` and ``min(exons[n])`` behave as
+    before but run in constant time and memory.
+    """
+
+    def __init__(self, transcript_ids, offsets, exon_starts, exon_ends,
+                 exon_numbers, strands):
+        """
+        Parameters:
+        transcript_ids (list): Transcript IDs, one per transcript.
+        offsets (array): Exon slice boundaries, length len(transcript_ids) + 1.
+        exon_starts (array): Transcript-space start of every exon.
+        exon_ends (array): Transcript-space end of every exon (inclusive).
+        exon_numbers (array): Exon number of every exon.
+        strands (array): Strand ('+' or '-') of every transcript.
+        """
+        self.transcript_ids = list(transcript_ids)
+        self.index = {transcript_id: i for i, transcript_id in enumerate(self.transcript_ids)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.exon_starts = np.asarray(exon_starts, dtype=np.int32)
+        self.exon_ends = np.asarray(exon_ends, dtype=np.int32)
+        self.exon_numbers = np.asarray(exon_numbers, dtype=np.int32)
+        self.strands = np.asarray(strands, dtype='<U1')
+
+        # the last exon is the highest exon number in each transcript
+        self.exon_counts = np.diff(self.offsets)
+        if len(self.transcript_ids):
+            self.last_exon_numbers = np.maximum.reduceat(self.exon_numbers, self.offsets[:-1])
+        else:
+            self.last_exon_numbers = np.zeros(0, dtype=np.int32)
+        self.is_last_exon = self.exon_numbers == np.repeat(self.last_exon_numbers, self.exon_counts)
+
+        # one sorted key per exon, (transcript row << 32) + start, so that sites
+        # of many transcripts can be located with a single searchsorted
+        exon_transcripts = np.repeat(np.arange(len(self.transcript_ids), dtype=np.int64), self.exon_counts)
+        self.boundary_keys = (exon_transcripts << 32) + self.exon_starts
+
+        # transcript-space start of exon 1, 0 where a transcript has no exon 1
+        self.first_exon_starts = np.zeros(len(self.transcript_ids), dtype=np.int32)
+        first = self.exon_numbers == 1
+        self.first_exon_starts[exon_transcripts[first]] = self.exon_starts[first]
+
+    @classmethod
+    def from_exons(cls, transcript_exons, transcript_strands):
+        """
+        Build a model from per-transcript exon intervals.
+
+        Parameters:
+        transcript_exons (dict): Maps each transcript ID to a dict of
+                                 exon number -> (start, end) in transcript space.
+        transcript_strands (dict): Maps each transcript ID to its strand.
+
+        Returns:
+        TranscriptModel: The flattened model.
+        """
+        transcript_ids = list(transcript_exons.keys())
+        offsets = [0]
+        exon_starts = []
+        exon_ends = []
+        exon_numbers = []
+        for transcript_id in transcript_ids:
+            exons = sorted(transcript_exons[transcript_id].items(), key=lambda item: item[1][0])
+            for exon_number, (start, end) in exons:
+                exon_numbers.append(exon_number)
+                exon_starts.append(start)
+                exon_ends.append(end)
+            offsets.append(len(exon_numbers))
+        strands = [transcript_strands.get(transcript_id, '+') or '+' for transcript_id in transcript_ids]
+        return cls(transcript_ids, offsets, exon_starts, exon_ends, exon_numbers, strands)
+
+    def __getitem__(self, transcript_id):
+        i = self.index[transcript_id]
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return {int(exon_number): range(int(start), int(end) + 1)
+                for exon_number, start, end in zip(self.exon_numbers[lo:hi],
+                                                   self.exon_starts[lo:hi],
+                                                   self.exon_ends[lo:hi])}
+
+    def __contains__(self, transcript_id):
+        return transcript_id in self.index
+
+    def __iter__(self):
+        return iter(self.transcript_ids)
+
+    def __len__(self):
+        return len(self.transcript_ids)
+
+    def exon_count(self, transcript_id):
+        """Return the number of exons in the transcript."""
+        return int(self.exon_counts[self.index[transcript_id]])
+
+    def last_exon(self, transcript_id):
+        """Return the highest exon number of the transcript."""
+        return int(self.last_exon_numbers[self.index[transcript_id]])
+
+    def strand(self, transcript_id):
+        """Return the strand of the transcript."""
+        return str(self.strands[self.index[transcript_id]])
+
+    def query(self, transcript_id, position):
+        """
+        Find the exon containing a transcript position by binary search.
+
+        The exon starts of each transcript are sorted, so the candidate exon is
+        the last one starting at or before the position: O(log exons).
+
+        Parameters:
+        transcript_id (str): The ID of the transcript to query.
+        position (int): The nucleotide position to query.
+
+        Returns:
+        tuple: The exon number, the total number of exons in the transcript and
+               whether it is the last exon. (None, None, False) if the transcript
+               is unknown or the position is not within an exon.
+        """
+        i = self.index.get(transcript_id)
+        if i is None:
+            return None, None, False
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        k = bisect_right(self.exon_starts, position, lo, hi) - 1
+        if k < lo or position > self.exon_ends[k]:
+            return None, None, False
+        return int(self.exon_numbers[k]), int(self.exon_counts[i]), bool(self.is_last_exon[k])
+
+    def locate(self, transcript_indices, positions):
+        """
+        Find the exons containing many sites at once.
+
+        Parameters:
+        transcript_indices (array): Row of each site's transcript in the model
+                                    (see ``index``), -1 for unknown transcripts.
+        positions (array): Transcript position of each site.
+
+        Returns:
+        tuple: NumPy arrays of exon number (0 where not found), whether the site
+               is within an exon, whether that exon is the last exon, and the
+               total number of exons in the transcript (0 for unknown transcripts).
+        """
+        transcript_indices = np.asarray(transcript_indices, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        known = transcript_indices >= 0
+        rows = np.where(known, transcript_indices, 0)
+        total_exons = np.where(known, self.exon_counts[rows] if len(self.exon_counts) else 0, 0)
+        if not len(self.exon_starts):
+            empty = np.zeros(len(positions), dtype=bool)
+            return np.zeros(len(positions), dtype=np.int32), empty, empty.copy(), total_exons
+
+        k = np.searchsorted(self.boundary_keys, (rows << 32) + positions, side='right') - 1
+        candidate = np.clip(k, 0, None)
+        found = known & (k >= self.offsets[rows]) & (positions <= self.exon_ends[candidate])
+        exon_numbers = np.where(found, self.exon_numbers[candidate], 0)
+        is_last_exon = found & self.is_last_exon[candidate]
+        return exon_numbers, found, is_last_exon, total_exons
+
+    def nbytes(self):
+        """Return the memory held by the coordinate arrays, in bytes."""
+        return sum(array.nbytes for array in (self.offsets, self.exon_starts, self.exon_ends,
+                                              self.exon_numbers, self.strands,
+                                              self.exon_counts, self.last_exon_numbers,
+                                              self.is_last_exon, self.boundary_keys,
+                                              self.first_exon_starts))
@@ -8,22 +8,33 @@ import shutil
 import errno
 import time
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from collections import defaultdict
 import logging
 import logging.handlers
-import argparse
-import matplotlib.pyplot as plt
-import pandas as pd
-from interogate.parse_gtf import parse_gff_gft
-from interogate.return_dict import generate_transcript_coordinates, query_transcript_exon
-from interogate.parse_m6a_site_proba import identify_methylated_sites
-from interogate.plot import plot_methylation_distribution
-from interogate.summary_stats import summarise_methylation_sites
-from interogate.parse_trans_len import parse_transcript_lengths
-from scipy.stats import chi2_contingency
+from interogate.profiling import StageProfiler
+from interogate.table_io import OUTPUT_FORMATS
+
+# pandas, numpy, scipy and matplotlib/seaborn are imported inside the stages
+# that use them, so --help and small runs do not pay for them up front
+
+
+def load_plotting():
+    """Import the plotting module on first use, with the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg')
+    from interogate import plot
+    return plot
 
 
-print(" ...   libs loaded ...")
+def draw_plot(binned, output_plot, m6a_file, threshold):
+    """Draw one distribution plot from binned sites (runs in the plot thread)."""
+    # wall time only, the main thread is timing its own stages meanwhile
+    with PROFILER.stage("plot", m6a_file, threshold, background=True) as record:
+        record['rows'] = sum(binned['counts'].values())
+        load_plotting().plot_binned_distribution(binned, output_plot)
+
 
 def get_args():
     parser = argparse.ArgumentParser(description="m6anet interogater:  " +
@@ -42,15 +53,19 @@ def get_args():
                           help="(data.site_proba.csv) List of m6anet result files to be parsed e.g. --m6a file1.csv file2.csv file3.csv")
  
     optional.add_argument("--thread", dest='threads',
-                          action="store", default="1",
-                          type=str,
-                          help="number of threads: currently does nothing yet")
+                          action="store", default=1,
+                          type=int,
+                          help="number of m6a files to process in parallel, " +
+                          "one process each. Default 1")
     
 
     optional.add_argument("--threshold", dest='threshold',
-                          action="store", default=0.9,
+                          action="store", default=[0.9],
+                          nargs='+',
                           type=float,
-                          help="theshold for m6a dat filtering. Default is recommended 0.9")
+                          help="theshold for m6a dat filtering. Default is recommended 0.9. " +
+                          "Give several e.g. --threshold 0.7 0.8 0.9 0.95 to sweep them " +
+                          "in one pass, outputs are named <file>_t<threshold>_...")
     
     optional.add_argument("-o", "--out", dest='out',
                           action="store",
@@ -72,19 +87,500 @@ def get_args():
                           type=str,
                           help="input gtf file to get the transcript coordinates")
     
+    optional.add_argument("--cache_dir", dest='cache_dir',
+                          action="store",
+                          default=None,
+                          type=str,
+                          help="directory to cache the parsed GTF and length files in. " +
+                          "Reused while their content is unchanged. " +
+                          "Default ~/.cache/interogate_m6anet")
+
+    optional.add_argument("--cache_size", dest='cache_size',
+                          action="store", default=500,
+                          type=float,
+                          help="maximum size of the cache directory in MB, " +
+                          "least recently used entries are removed. Default 500")
+
+    optional.add_argument("--no_cache", dest='no_cache',
+                          action="store_true",
+                          default=False,
+                          help="always parse the GTF and length files, do not use the cache")
+
+    optional.add_argument("--output_format", dest='output_format',
+                          action="store",
+                          default="tsv",
+                          choices=OUTPUT_FORMATS,
+                          help="format of the output tables. tsv (default) keeps the .tab files, " +
+                          "tsv.gz/tsv.zst compress them, parquet/feather write columnar files " +
+                          "with fixed column types")
+
+    optional.add_argument("--combined", dest='combined',
+                          action="store",
+                          default=None,
+                          type=str,
+                          help="process all the --m6a files (e.g. replicates) together, " +
+                          "annotating each distinct site once, and also write " +
+                          "<combined>_sample_matrix.tab and <combined>_category_totals.tab")
+
+    optional.add_argument("--only_input_transcripts", dest='only_input_transcripts',
+                          action="store_true",
+                          default=False,
+                          help="scan the m6a files first and only model the transcripts they " +
+                          "have sites on (and count the exons of their genes). Quick for small " +
+                          "runs against a large GTF when it is not already cached")
+
+    optional.add_argument("--skip_unchanged", dest='skip_unchanged',
+                          action="store_true",
+                          default=False,
+                          help="skip m6a files whose outputs are up to date: same input content, " +
+                          "GTF, length file, thresholds and code as recorded in the " +
+                          "interogate_m6anet.manifest.json of their directory")
+
+    optional.add_argument("--profile", dest='profile',
+                          action="store",
+                          default=None,
+                          type=str,
+                          help="write wall time, CPU time, peak memory and row counts " +
+                          "of each stage and m6a file to this JSON file")
+
+    optional.add_argument("--profile_memory", dest='profile_memory',
+                          action="store_true",
+                          default=False,
+                          help="with --profile, also record the tracemalloc peak of each " +
+                          "stage. Slows the run down")
+
+    optional.add_argument("--cprofile", dest='cprofile',
+                          action="store",
+                          nargs='+',
+                          default=[],
+                          type=str,
+                          help="with --profile, run these stages under cProfile and save " +
+                          "<profile>.<stage>.<file>.prof. Stages: load_annotation read_sites " +
+                          "annotate write_table summarise")
+
     optional.add_argument("-l", "--logfile", dest='logfile',
                           action="store",
                           default="pipeline.log",
                           type=str,
                           help="log file name")
+    optional.add_argument("--no_plot", "--no-plot", dest='no_plot',
+                          action="store_true",
+                          default=False,
+                          help="do not draw the m6a distribution plots " +
+                          "(matplotlib is then never imported)")
+
     optional.add_argument("--test", dest='test',
                           action="store",
                           default=False,
                           type=str,
                           help="extra printing for testing, add true if required")
+
+    optional.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                          help="Show this help message and exit")
     return parser.parse_args()
     
 
+# The annotation used by process_m6a_file. Filled once in the parent; worker
+# processes inherit it copy-on-write when the pool forks, or receive it
+# through init_worker where fork is not available.
+ANNOTATION = {}
+
+
+# Stage timings for --profile, disabled unless requested.
+PROFILER = StageProfiler()
+
+
+def init_worker(annotation, profiler_settings):
+    """Set up a spawned worker process with the annotation, profiler and a stderr logger."""
+    ANNOTATION.update(annotation)
+    PROFILER.configure(**profiler_settings)
+    logger = logging.getLogger('interogate_m6anet')
+    if not logger.handlers:
+        logger.setLevel(logging.DEBUG)
+        err_handler = logging.StreamHandler(sys.stderr)
+        err_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        logger.addHandler(err_handler)
+
+
+def write_outputs(results_df, output_prefix, m6a_file, threshold=None, plotter=None,
+                  output_format='tsv'):
+    """
+    Write the annotated table, distribution plot and per transcript summary.
+
+    Parameters:
+    results_df (DataFrame): The annotated methylation sites.
+    output_prefix (str): Output path prefix, e.g. the m6a file without extension.
+    m6a_file (str): Path to the m6anet result file, used in log messages.
+    threshold (float): The threshold of a sweep these outputs are for, if any.
+    plotter (PlotWorker): Draws the distribution plot in the background,
+                          None to skip the plot.
+    output_format (str): Format of the tables, see table_io.OUTPUT_FORMATS.
+    """
+    from interogate.summary_stats import summarise_methylation_sites
+    from interogate.site_categories import category_counts, bin_sites
+    from interogate.table_io import write_table
+
+    logger = logging.getLogger('interogate_m6anet')
+    print("Results DataFrame:", results_df)
+    logger.info("Results DataFrame: ")
+    logger.info(results_df)
+
+    with PROFILER.stage("write_table", m6a_file, threshold) as record:
+        output_file = write_table(results_df, f"{output_prefix}_exon_annotated.tab", output_format)
+        record['rows'] = len(results_df)
+    print(f"Results saved to {output_file}")
+    output_plot = f"{output_prefix}_m6a_distribution.pdf"
+
+    if plotter is not None:
+        try:
+            # only the histograms go to the plot thread, not the sites
+            with PROFILER.stage("bin_sites", m6a_file, threshold) as record:
+                record['rows'] = len(results_df)
+                binned = bin_sites(results_df, ANNOTATION['transcript_lengths'],
+                                   ANNOTATION['transcript_strands'])
+            logger.info(f"{m6a_file}\tCategory counts:\t{binned['counts']}\n")
+            n_out_of_range = sum(binned['out_of_range'].values())
+            if n_out_of_range:
+                logger.warning(f"{m6a_file}\t{n_out_of_range} sites lie outside their transcript length "
+                               f"and are left out of the position distribution")
+            plotter.submit(draw_plot, binned, output_plot, m6a_file, threshold)
+            logger.info(f"Plot saved to {output_plot}")
+        except Exception as e:
+            logger.error(f"An error occurred while plotting the methylation distribution: {e}")
+        # Continue with the rest of the script
+    else:
+        # the plot normally reports these
+        logger.info(f"{m6a_file}\tCategory counts:\t{category_counts(results_df)}\n")
+
+    # write out a summary per transcript usage
+    output_summary = f"{output_prefix}_summary_per_transcript.tab"
+    with PROFILER.stage("summarise", m6a_file, threshold) as record:
+        record['rows'] = len(results_df)
+        summarise_methylation_sites(results_df, output_summary, 
+                                    logger, output_format)
+
+
+def write_file_outputs(annotated_df, probabilities, m6a_file, thresholds, plotter=None,
+                       output_format='tsv'):
+    """
+    Write the outputs of one m6a file, for each threshold of a sweep.
+
+    Parameters:
+    annotated_df (DataFrame): The annotated sites above the lowest threshold.
+    probabilities (array): probability_modified of each site, needed for a sweep.
+    m6a_file (str): Path to the m6anet result file the outputs are named after.
+    thresholds (list): Sorted probability thresholds.
+    plotter (PlotWorker): Draws the distribution plots, None to skip them.
+    output_format (str): Format of the tables, see table_io.OUTPUT_FORMATS.
+    """
+    import pandas as pd
+    from interogate.site_categories import category_counts
+    from interogate.table_io import write_table
+
+    logger = logging.getLogger('interogate_m6anet')
+    base = os.path.splitext(m6a_file)[0]
+    if len(thresholds) == 1:
+        write_outputs(annotated_df, base, m6a_file, plotter=plotter, output_format=output_format)
+        return
+    sweep_rows = []
+    for threshold in thresholds:
+        results_df = annotated_df[probabilities > threshold].reset_index(drop=True)
+        sweep_rows.append({'threshold': threshold, 'total_sites': len(results_df),
+                           **category_counts(results_df)})
+        if results_df.empty:
+            logger.warning(f"No methylated sites above {threshold} for file: {m6a_file}")
+            continue
+        logger.info("Threshold %s: %d sites", threshold, len(results_df))
+        write_outputs(results_df, f"{base}_t{threshold:g}", m6a_file, threshold, plotter,
+                      output_format)
+    sweep_file = write_table(pd.DataFrame(sweep_rows), f"{base}_threshold_sweep.tab", output_format)
+    logger.info(f"Threshold sweep saved to {sweep_file}")
+
+
+def process_m6a_file(m6a_file, thresholds, plot=True, output_format='tsv'):
+    """
+    Annotate, plot and summarise one m6anet result file.
+
+    With several thresholds the file is read and annotated once at the lowest
+    one, and the outputs for each threshold are written from a mask of that
+    table (named <file>_t<threshold>_...). A <file>_threshold_sweep.tab with
+    the site category counts per threshold is written too.
+    Errors are logged and do not stop the other files being processed.
+
+    Parameters:
+    m6a_file (str): Path to the m6anet data.site_proba.csv file.
+    thresholds (list): Probability thresholds for methylated sites.
+    plot (bool): Draw the methylation distribution plots.
+    output_format (str): Format of the tables, see table_io.OUTPUT_FORMATS.
+
+    Returns:
+    bool: True if the file was processed.
+    """
+    return run_with_plotter(plot, _process_m6a_file, m6a_file, thresholds, output_format)
+
+
+def run_with_plotter(plot, function, *args):
+    """
+    Call function(*args, plotter) with a PlotWorker, or None when not plotting.
+
+    The plots are drawn in a background thread while the tables and summaries
+    are written, and waited for before returning.
+    """
+    logger = logging.getLogger('interogate_m6anet')
+    if plot:
+        try:
+            plot_module = load_plotting()
+        except ImportError as e:
+            logger.error(f"An error occurred while plotting the methylation distribution: {e}")
+        else:
+            with plot_module.PlotWorker(logger) as plotter:
+                return function(*args, plotter)
+    return function(*args, None)
+
+
+def _process_m6a_file(m6a_file, thresholds, output_format, plotter):
+    """process_m6a_file with the plot worker (or None) to use."""
+    from interogate.annotate import annotate_sites
+    from interogate.parse_m6a_site_proba import read_methylated_sites
+
+    logger = logging.getLogger('interogate_m6anet')
+    transcript_dict = ANNOTATION['transcript_dict']
+    gene_exon_counts = ANNOTATION['gene_exon_counts']
+    thresholds = sorted(set(thresholds))
+    sweep = len(thresholds) > 1
+
+    try:
+        logger.info("Starting processing: %s", m6a_file)
+        # Identify methylated sites, filtering out invalid transcripts as the
+        # file is read in chunks
+        valid_transcripts = set(transcript_dict.keys())
+        with PROFILER.stage("read_sites", m6a_file) as record:
+            methylated_sites = read_methylated_sites(m6a_file, thresholds[0], valid_transcripts,
+                                                     keep_probability=sweep)
+            record['rows'] = len(methylated_sites)
+        if methylated_sites.empty:
+            logger.warning(f"No valid methylated sites after filtering for file: {m6a_file}")
+            return False
+    
+        # Annotate the sites
+        with PROFILER.stage("annotate", m6a_file) as record:
+            annotated_df = annotate_sites(methylated_sites, transcript_dict, gene_exon_counts,
+                                          logger, m6a_file)
+            record['rows'] = len(annotated_df)
+
+        probabilities = methylated_sites['probability_modified'].to_numpy() if sweep else None
+        write_file_outputs(annotated_df, probabilities, m6a_file, thresholds, plotter, output_format)
+
+        logger.info("Processing finished: %s", time.asctime())
+        logger.info("########################\n")
+        return True
+    except Exception as m6a_file_e:
+        logger.error(f"An error occurred while processing the file {m6a_file}: {m6a_file_e}")
+        return False
+
+
+def process_m6a_files_combined(m6a_files, thresholds, output_prefix, plot=True, output_format='tsv'):
+    """
+    Annotate several samples (e.g. replicates) together.
+
+    All files are read into one long table and each distinct
+    (transcript, position) pair is annotated once. The usual outputs are then
+    written for every sample, plus <output_prefix>_sample_matrix.tab (sites per
+    transcript and sample) and <output_prefix>_category_totals.tab (sites per
+    category and sample), per threshold when sweeping.
+
+    Parameters:
+    m6a_files (list): Paths to the m6anet result files, one per sample.
+    thresholds (list): Probability thresholds for methylated sites.
+    output_prefix (str): Path prefix of the combined outputs.
+    plot (bool): Draw the methylation distribution plots.
+    output_format (str): Format of the tables, see table_io.OUTPUT_FORMATS.
+
+    Returns:
+    list: The files whose outputs were written.
+    """
+    return run_with_plotter(plot, _process_m6a_files_combined, m6a_files, thresholds, output_prefix,
+                            output_format)
+
+
+def _process_m6a_files_combined(m6a_files, thresholds, output_prefix, output_format, plotter):
+    """process_m6a_files_combined with the plot worker (or None) to use."""
+    from interogate.annotate import log_five_prime_utr_sites
+    from interogate.multi_sample import read_samples, annotate_unique_sites, \
+        sample_matrix, category_totals
+    from interogate.table_io import write_table
+
+    logger = logging.getLogger('interogate_m6anet')
+    thresholds = sorted(set(thresholds))
+    sweep = len(thresholds) > 1
+
+    logger.info("Starting processing %d samples together", len(m6a_files))
+    with PROFILER.stage("read_sites") as record:
+        long_df = read_samples(m6a_files, thresholds[0], set(ANNOTATION['transcript_dict'].keys()),
+                               sweep, logger)
+        record['rows'] = len(long_df)
+    if not len(long_df['sample'].cat.categories):
+        logger.error("No readable inputs: none of the %d m6a files could be read", len(m6a_files))
+        return []
+    with PROFILER.stage("annotate") as record:
+        annotated, inverse, is_5prime_utr = annotate_unique_sites(
+            long_df, ANNOTATION['transcript_dict'], ANNOTATION['gene_exon_counts'])
+        record['rows'] = len(annotated)
+    logger.info("Annotated %d distinct sites for %d sites in all samples", len(annotated), len(long_df))
+
+    samples = list(long_df['sample'].cat.categories)
+    sample_codes = long_df['sample'].cat.codes.to_numpy()
+    probabilities = long_df['probability_modified'].to_numpy() if sweep else None
+    processed_files = []
+    for code, m6a_file in enumerate(samples):
+        in_sample = sample_codes == code
+        if not in_sample.any():
+            continue
+        try:
+            logger.info("Starting processing: %s", m6a_file)
+            rows = inverse[in_sample]
+            if is_5prime_utr[rows].any():
+                utr_rows = rows[is_5prime_utr[rows]]
+                log_five_prime_utr_sites(annotated['transcript_id'].to_numpy()[utr_rows],
+                                         annotated['position'].to_numpy()[utr_rows], logger, m6a_file)
+            write_file_outputs(annotated.iloc[rows].reset_index(drop=True),
+                               probabilities[in_sample] if sweep else None,
+                               m6a_file, thresholds, plotter, output_format)
+            processed_files.append(m6a_file)
+        except Exception as m6a_file_e:
+            logger.error(f"An error occurred while processing the file {m6a_file}: {m6a_file_e}")
+
+    # the combined tables
+    all_sites = annotated.iloc[inverse].reset_index(drop=True)
+    all_sites.insert(0, 'sample', long_df['sample'].to_numpy())
+    for threshold in thresholds:
+        prefix = f"{output_prefix}_t{threshold:g}" if sweep else output_prefix
+        sites = all_sites[probabilities > threshold] if sweep else all_sites
+        matrix_file = write_table(sample_matrix(sites, samples), f"{prefix}_sample_matrix.tab",
+                                  output_format)
+        logger.info(f"Sample matrix saved to {matrix_file}")
+        totals_file = write_table(category_totals(sites, samples), f"{prefix}_category_totals.tab",
+                                  output_format)
+        logger.info(f"Category totals saved to {totals_file}")
+    logger.info("Processing finished: %s", time.asctime())
+    return processed_files
+
+
+def expected_outputs(m6a_file, thresholds, plot=True, output_format='tsv'):
+    """Return the output files process_m6a_file writes for an m6a file."""
+    from interogate.table_io import output_path
+
+    base = os.path.splitext(m6a_file)[0]
+    thresholds = sorted(set(thresholds))
+    if len(thresholds) > 1:
+        prefixes = [f"{base}_t{threshold:g}" for threshold in thresholds]
+        outputs = [f"{base}_threshold_sweep.tab"]
+    else:
+        prefixes = [base]
+        outputs = []
+    for prefix in prefixes:
+        outputs.append(f"{prefix}_exon_annotated.tab")
+        if plot:
+            outputs.append(f"{prefix}_m6a_distribution.pdf")
+        outputs.append(f"{prefix}_summary_per_transcript.tab")
+        outputs.append(f"{prefix}_summary_per_transcript.tab.overall.summary")
+    return [output if output.endswith('.pdf') else output_path(output, output_format)
+            for output in outputs]
+
+
+def recorded_outputs(m6a_file, thresholds, plot=True, output_format='tsv'):
+    """
+    Return the outputs of a processed m6a file to record in the run manifest.
+
+    These are the expected outputs that exist, plus the plot of every table
+    written even when it is missing: a plot that failed in the plot thread
+    is then redone by the next --skip_unchanged run.
+    """
+    from interogate.table_io import output_path
+
+    outputs = []
+    for output in expected_outputs(m6a_file, thresholds, plot, output_format):
+        if output.endswith("_m6a_distribution.pdf"):
+            table = output_path(f"{output[:-len('_m6a_distribution.pdf')]}_exon_annotated.tab",
+                                output_format)
+            if os.path.exists(table):
+                outputs.append(output)
+                continue
+        if os.path.exists(output):
+            outputs.append(output)
+    return outputs
+
+
+def combined_outputs(output_prefix, thresholds, output_format='tsv'):
+    """Return the tables process_m6a_files_combined writes for all the samples."""
+    from interogate.table_io import output_path
+
+    thresholds = sorted(set(thresholds))
+    if len(thresholds) > 1:
+        prefixes = [f"{output_prefix}_t{threshold:g}" for threshold in thresholds]
+    else:
+        prefixes = [output_prefix]
+    return [output_path(f"{prefix}_{table}.tab", output_format)
+            for prefix in prefixes for table in ("sample_matrix", "category_totals")]
+
+
+def process_m6a_file_in_worker(m6a_file, thresholds, plot=True, output_format='tsv'):
+    """
+    Run process_m6a_file in a pool worker.
+
+    Returns:
+    tuple: Whether the file was processed, and the profiler records of this file.
+    """
+    PROFILER.pop_records()  # drop any records inherited from the parent on fork
+    processed = process_m6a_file(m6a_file, thresholds, plot, output_format)
+    return processed, PROFILER.pop_records()
+
+
+def process_m6a_files_parallel(m6a_files, thresholds, threads, logger, plot=True,
+                               output_format='tsv'):
+    """
+    Process the m6anet result files in a pool of worker processes.
+
+    Where possible the pool forks, so the annotation built in the parent is
+    shared copy-on-write rather than pickled to every worker.
+
+    Parameters:
+    m6a_files (list): Paths to the m6anet result files.
+    thresholds (list): Probability thresholds for methylated sites.
+    threads (int): Number of worker processes.
+    logger (Logger): Logger for errors raised by the pool itself.
+    plot (bool): Draw the methylation distribution plots.
+    output_format (str): Format of the tables, see table_io.OUTPUT_FORMATS.
+
+    Returns:
+    list: The files that were processed.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        initializer, initargs = None, ()
+    else:
+        context = multiprocessing.get_context('spawn')
+        initializer, initargs = init_worker, (dict(ANNOTATION), PROFILER.settings())
+
+    logger.info("Processing %d files with %d processes", len(m6a_files), threads)
+    processed_files = []
+    with ProcessPoolExecutor(max_workers=min(threads, len(m6a_files)), mp_context=context,
+                             initializer=initializer, initargs=initargs) as pool:
+        futures = {pool.submit(process_m6a_file_in_worker, m6a_file, thresholds, plot,
+                               output_format): m6a_file
+                   for m6a_file in m6a_files}
+        for future in as_completed(futures):
+            try:
+                processed, records = future.result()
+                PROFILER.records.extend(records)
+                if processed:
+                    processed_files.append(futures[future])
+            except Exception as m6a_file_e:
+                # the worker itself died, e.g. killed for running out of memory
+                logger.error(f"An error occurred while processing the file {futures[future]}: {m6a_file_e}")
+    return processed_files
+
+
 def main():
     args = get_args()
 
@@ -112,129 +608,113 @@ def main():
     logger.info("Command-line: %s", ' '.join(sys.argv))
     logger.info("Starting processing: %s", time.asctime())
 
-    # get the transcript lenghts
-    transcript_lengths = parse_transcript_lengths(args.trans_len)
-    logger.info("processed: %s", args.trans_len)
-
-    # Example usage
+    # get the transcript lenghts, parse the GTF file and generate transcript
+    # coordinates - or load them from the cache if the inputs are unchanged
     logger.info("Starting processing: %s", args.gtf )
-    file_path = args.gtf  # Replace with the path to your GFF or GTF file
+    if args.profile:
+        PROFILER.configure(True, args.profile_memory, args.cprofile,
+                           os.path.splitext(args.profile)[0])
+        if 'plot' in args.cprofile:
+            logger.warning("The plot stage runs in a background thread and is not run under cProfile")
+    from interogate.annotation_cache import load_annotation, cache_key, DEFAULT_CACHE_DIR
+    from interogate import run_manifest
+
+    # outputs are recorded in a manifest per directory, so reruns can skip
+    # the files whose input, annotation, parameters and code are unchanged.
+    # The annotation is hashed once, when first needed
+    annotation_key = cache_key(args.gtf, args.trans_len) if args.skip_unchanged else None
+    parameters = {'thresholds': sorted(set(args.threshold)), 'plot': not args.no_plot,
+                  'output_format': args.output_format,
+                  'combined': os.path.abspath(args.combined) if args.combined else None}
+    version = run_manifest.code_version()
+    m6a_files = args.m6a
+    if args.skip_unchanged:
+        m6a_files = []
+        for m6a_file in args.m6a:
+            if run_manifest.is_up_to_date(m6a_file, annotation_key, parameters, version):
+                logger.info("Skipping up to date file: %s", m6a_file)
+            else:
+                m6a_files.append(m6a_file)
+        logger.info("%d of %d m6a files need processing", len(m6a_files), len(args.m6a))
+        if args.combined and m6a_files:
+            # the combined tables need every sample
+            m6a_files = args.m6a
 
-    # Parse GTF file and generate transcript coordinates
-    file_path = args.gtf
-    features = parse_gff_gft(file_path)
-    transcript_dict, transcript_exon_counts, gene_exon_counts, last_exon_for_transcript, \
-            transcript_strands = generate_transcript_coordinates(features, transcript_lengths)
+    if not m6a_files and not args.test:
+        logger.info("Nothing to do: all outputs are up to date")
+        if args.profile:
+            PROFILER.write(args.profile, {'command': ' '.join(sys.argv),
+                                          'm6a_files': args.m6a,
+                                          'thresholds': args.threshold})
+        return
+
+    cache_dir = None if args.no_cache else (args.cache_dir or DEFAULT_CACHE_DIR)
+    transcripts = None
+    if args.only_input_transcripts:
+        from interogate.parse_m6a_site_proba import scan_transcript_ids
+        with PROFILER.stage("scan_transcripts") as record:
+            transcripts = scan_transcript_ids(m6a_files, min(args.threshold), logger)
+            record['rows'] = len(transcripts)
+        logger.info("%d transcripts have sites in the m6a files", len(transcripts))
+    with PROFILER.stage("load_annotation") as record:
+        if cache_dir and annotation_key is None:
+            annotation_key = cache_key(args.gtf, args.trans_len)
+        transcript_lengths, transcript_dict, transcript_exon_counts, gene_exon_counts, \
+                last_exon_for_transcript, transcript_strands = \
+                load_annotation(args.gtf, args.trans_len, cache_dir,
+                                int(args.cache_size * 1024 * 1024), logger, transcripts,
+                                annotation_key)
+        record['rows'] = len(transcript_dict)
+    logger.info("processed: %s", args.trans_len)
     
 
     if args.test:
         with open(args.out, 'w') as out_file:
             for transcript, exons in transcript_dict.items():
                 for exon, coordinates in exons.items():
-                    out_data = f'{transcript} exon {exon}: {coordinates}'
+                    out_data = f'{transcript} exon {exon}: {coordinates.start}-{coordinates.stop - 1}'
                     out_file.write(out_data + '\n')
                     print(out_data)
 
    # Process each m6A result file
-    
-    for m6a_file in args.m6a:
-        # These were used in testing - useful. but not for real data. 
-        # print("Transcript Dictionary:", transcript_dict)
-        # print("Exon Counts per Transcript:", transcript_exon_counts)
-        # print("Gene Exon Counts:", gene_exon_counts)
-        ## print("Last Exon for Each Transcript:", last_exon_for_transcript)
-        # print("Transcript Lengths:", transcript_lengths)
+    ANNOTATION.update(transcript_lengths=transcript_lengths,
+                      transcript_dict=transcript_dict,
+                      gene_exon_counts=gene_exon_counts,
+                      transcript_strands=transcript_strands)
+    threads = max(1, int(args.threads))
+    if args.combined and threads > 1:
+        logger.warning("--thread is ignored with --combined, the samples are processed together")
+    if args.combined:
+        processed_files = process_m6a_files_combined(m6a_files, args.threshold, args.combined,
+                                                     not args.no_plot, args.output_format)
+    elif threads == 1 or len(m6a_files) <= 1:
+        processed_files = [m6a_file for m6a_file in m6a_files
+                           if process_m6a_file(m6a_file, args.threshold, not args.no_plot,
+                                               args.output_format)]
+    else:
+        processed_files = process_m6a_files_parallel(m6a_files, args.threshold, threads, logger,
+                                                     not args.no_plot, args.output_format)
 
+    if processed_files and annotation_key is None:
+        annotation_key = cache_key(args.gtf, args.trans_len)
+    # the combined tables are outputs of every sample, so losing them redoes the run
+    shared_outputs = combined_outputs(args.combined, args.threshold, args.output_format) \
+        if args.combined else []
+    for m6a_file in processed_files:
+        outputs = recorded_outputs(m6a_file, args.threshold, not args.no_plot,
+                                   args.output_format) + shared_outputs
         try:
-            logger.info("Starting processing: %s", m6a_file)
-            threshold = args.threshold
-            # Identify methylated sites
-            methylated_sites = identify_methylated_sites(m6a_file, threshold)
-
-            # Filter out invalid transcripts
-            valid_transcripts = set(transcript_dict.keys())
-            methylated_sites = methylated_sites[methylated_sites['transcript_id'].isin(valid_transcripts)]
-            if methylated_sites.empty:
-                logger.warning(f"No valid methylated sites after filtering for file: {m6a_file}")
-                continue
-        
-            # Annotate the sites
-            results = []
-            for index, row in methylated_sites.iterrows():
-                transcript_id = row['transcript_id']
-                position = row['transcript_position']
-                exon_number, total_exons = query_transcript_exon(transcript_dict, transcript_id, position)
-                # determine if this is a 5prime UTR modification
-                exons = transcript_dict.get(transcript_id, {})
-    
-                if exons:
-                    first_exon_start = min(exons[1]) if 1 in exons else None
-
-                    # Check if the position is in the 5' UTR
-                    if first_exon_start and position < first_exon_start:
-                        result = {
-                        'transcript_id': transcript_id,
-                        'position': position,
-                        'exon_number': '5\' UTR',
-                        'total_exons_in_transcript': len(exons),
-                        'total_exons_in_gene': gene_exon_counts.get(transcript_id.split('.')[0], 'Unknown'),
-                        'is_last_exon': False,
-                        'is_5prime_UTR': True  # New field indicating 5' UTR
-                        }
-                        logger.info(f"file:\t{m6a_file}\t{transcript_id}\thas 5_prime m6a modification at\t{position}")
-
-
-                is_last_exon = (exon_number == last_exon_for_transcript.get(transcript_id, None))
-                if exon_number is not None:
-                    result = {
-                        'transcript_id': transcript_id,
-                        'position': position,
-                        'exon_number': exon_number,
-                        'total_exons_in_transcript': total_exons,
-                        'total_exons_in_gene': gene_exon_counts.get(transcript_id.split('.')[0], 'Unknown'),
-                        'is_last_exon': is_last_exon
-                    }
-                else:
-                    result = {
-                        'transcript_id': transcript_id,
-                        'position': position,
-                        'exon_number': 'UTR',
-                        'total_exons_in_transcript': total_exons,
-                        'total_exons_in_gene': gene_exon_counts.get(transcript_id.split('.')[0], 'Unknown'),
-                        'is_last_exon': False
-                    }
-                results.append(result)
-
-            results_df = pd.DataFrame(results)
-            print("Results DataFrame:", results_df)
-            logger.info("Results DataFrame: ")
-            logger.info(results_df)
-
-            output_file = f"{os.path.splitext(m6a_file)[0]}_exon_annotated.tab"
-            results_df.to_csv(output_file, index=False, sep="\t")
-            print(f"Results saved to {output_file}")
-            output_plot = f"{os.path.splitext(m6a_file)[0]}_m6a_distribution.pdf"
+            run_manifest.record_outputs(m6a_file, outputs, annotation_key, parameters, version)
+        except OSError as e:
+            logger.warning(f"Could not update the run manifest for {m6a_file}: {e}")
 
-            try:
-                logger.info(f"Plot saved to {output_plot}")
-                plot_methylation_distribution(results_df, output_plot, 
-                                              transcript_lengths, transcript_strands,
-                                              m6a_file, logger)
-            except Exception as e:
-                logger.error(f"An error occurred while plotting the methylation distribution: {e}")
-            # Continue with the rest of the script
-
-            # write out a summary per transcript usage
-            output_summary = f"{os.path.splitext(m6a_file)[0]}_summary_per_transcript.tab"
-            summarise_methylation_sites(results_df, output_summary, 
-                                        logger)
-        
+    if args.profile:
+        PROFILER.write(args.profile, {'command': ' '.join(sys.argv),
+                                      'threads': threads,
+                                      'm6a_files': args.m6a,
+                                      'thresholds': args.threshold})
+        logger.info("Profile saved to %s", args.profile)
 
-            logger.info("Processing finished: %s", time.asctime())
-            logger.info("########################\n")
-        except Exception as m6a_file_e:
-            logger.error(f"An error occurred while processing the file {m6a_file}: {m6a_file_e}")
-            continue  # Skip to the next file
 
 if __name__ == '__main__':
     main()
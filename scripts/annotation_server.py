@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# annotation_server.py
+
+# script to load the transcript model once and answer site annotation
+# requests over localhost HTTP, see query_annotation_server.py for a client
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+# the interogate package lives one directory up from the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from interogate.annotation_server import make_server, DEFAULT_HOST, DEFAULT_PORT
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Serve exon annotations of transcript positions",
+                                     add_help=False)
+    file_directory = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("--gtf", dest='gtf',
+                          action="store",
+                          default=os.path.join(file_directory, "data", "test.gtf"),
+                          type=str,
+                          help="input gtf file to get the transcript coordinates")
+    optional.add_argument("--len", dest='trans_len',
+                          action="store",
+                          default=os.path.join(file_directory, "data",
+                                               "Araport11_genes.201606.cdna.len"),
+                          type=str,
+                          help="transcript length file")
+    optional.add_argument("--cache_dir", dest='cache_dir',
+                          action="store", default=None, type=str,
+                          help="annotation cache directory (default ~/.cache/interogate_m6anet)")
+    optional.add_argument("--no_cache", dest='no_cache',
+                          action="store_true", default=False,
+                          help="always parse the GTF instead of using the cache")
+    optional.add_argument("--host", dest='host',
+                          action="store", default=DEFAULT_HOST, type=str,
+                          help=f"address to listen on. Default {DEFAULT_HOST}")
+    optional.add_argument("--port", dest='port',
+                          action="store", default=DEFAULT_PORT, type=int,
+                          help=f"port to listen on. Default {DEFAULT_PORT}")
+    optional.add_argument("-l", "--logfile", dest='logfile',
+                          action="store", default="annotation_server.log", type=str,
+                          help="log file name")
+    optional.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                          help="Show this help message and exit")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    logger = logging.getLogger('annotation_server')
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('%(levelname)s: %(message)s')
+    err_handler = logging.StreamHandler(sys.stderr)
+    err_handler.setFormatter(formatter)
+    err_handler.setLevel(logging.INFO)
+    logger.addHandler(err_handler)
+    file_handler = logging.FileHandler(args.logfile, mode='w')
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+
+    from interogate.annotation_cache import load_annotation, DEFAULT_CACHE_DIR
+    start = time.time()
+    cache_dir = None if args.no_cache else (args.cache_dir or DEFAULT_CACHE_DIR)
+    _, transcript_dict, _, gene_exon_counts, _, _ = load_annotation(args.gtf, args.trans_len,
+                                                                    cache_dir, logger=logger)
+    logger.info("loaded %d transcripts from %s in %.1f s", len(transcript_dict), args.gtf,
+                time.time() - start)
+
+    server = make_server(transcript_dict, gene_exon_counts, args.host, args.port, logger,
+                         {'gtf': os.path.abspath(args.gtf), 'len': os.path.abspath(args.trans_len)})
+    logger.info("serving on http://%s:%d (POST /annotate, GET /health)", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("shutting down")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
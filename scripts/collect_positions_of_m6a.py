@@ -9,7 +9,16 @@
 import argparse
 import os
 import csv
-from collections import defaultdict
+import sys
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# the interogate package lives one directory up from the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from interogate.table_io import table_format, read_table
+
+POSITION_COLUMNS = {'transcript_id', 'exon_number', 'position', 'positions'}
 
 def get_args():
     parser = argparse.ArgumentParser(description="Parse exon data from file", add_help=False)
@@ -28,67 +37,182 @@ def get_args():
                           action="store", default="output.tsv",
                           type=str,
                           help="Path to the output file (default: output.tsv)")
+
+    optional.add_argument("--thread", dest='threads',
+                          action="store", default=1,
+                          type=int,
+                          help="number of files to read in parallel (default: 1)")
     
     return parser.parse_args()
 
-def parse_file(file_path, data):
+def read_positions(file_path):
+    """
+    Read the transcript_id, exon_number and position columns of an annotated file.
+
+    Values are read as the text in the file (as csv.DictReader gives them),
+    with the position as an integer.
+
+    Args:
+        file_path (str): The path to the input file.
+
+    Returns:
+        DataFrame: The three columns, with 'positions' renamed to 'position'.
+    """
+    if table_format(file_path) in ('parquet', 'feather'):
+        table = read_table(file_path).astype(str)
+    else:
+        table = pd.read_csv(file_path, sep="\t", dtype=str, keep_default_na=False,
+                            usecols=lambda column: column in POSITION_COLUMNS)
+    # Dynamically determine if 'position' or 'positions' is in the file
+    # for weird reasons I was getting both names. Maybe an old scripts output?
+    column_name = 'position' if 'position' in table.columns else 'positions'
+    table = table[['transcript_id', 'exon_number', column_name]].rename(columns={column_name: 'position'})
+    table['position'] = table['position'].astype('int64')
+    return table
+
+
+def parse_file(file_path):
     """
-    Parse exon data from a given file and update the provided dictionary.
+    Count the positions of each exon in one annotated file.
 
-    This function reads a tab-separated values (TSV) file containing exon data,
-    and updates the given defaultdict with transcript IDs, exon numbers, and positions.
+    This function reads a tab-separated values (TSV) file containing exon data
+    and counts how often each (integer) position is seen per transcript and
+    exon, so the result grows with the unique positions rather than the rows.
+    Gzip/zstd compressed TSV, Parquet and Feather tables are read too.
 
     Args:
         file_path (str): The path to the input file to be parsed.
-        data (defaultdict): A defaultdict where each key is a transcript ID,
-                            and each value is another defaultdict. The inner
-                            defaultdict's keys are exon numbers, and the values
-                            are lists of positions.
 
     Returns:
-        None: The function updates the provided defaultdict in place.
+        tuple: The (transcript_id, exon_number) pairs in the order they first
+               appear in the file, and NumPy arrays of the keys
+               (pair index << 32 | position) and their counts.
     """
-    with open(file_path, mode='r') as file:
-        csv_reader = csv.DictReader(file, delimiter='\t')
-        # Dynamically determine if 'position' or 'positions' is in the file
-        # for weird reasons I was getting both names. Maybe an old scripts output?
-        column_name = 'position' if 'position' in csv_reader.fieldnames else 'positions'
-
-        for row in csv_reader:
-            transcript_id = row['transcript_id']
-            exon_number = row['exon_number']
-            position = row[column_name]  # Use the dynamically determined name
-            data[transcript_id][exon_number].append(position)
+    table = read_positions(file_path)
+    transcript_codes, transcript_ids = pd.factorize(table['transcript_id'])
+    exon_codes, exon_numbers = pd.factorize(table['exon_number'])
+    pair_codes, pairs = pd.factorize(transcript_codes.astype(np.int64) * len(exon_numbers) + exon_codes)
+    keys = (pair_codes.astype(np.int64) << 32) | table['position'].to_numpy(dtype=np.int64)
+    keys, counts = np.unique(keys, return_counts=True)
+    transcript_ids, exon_numbers = transcript_ids.tolist(), exon_numbers.tolist()
+    pairs = [(transcript_ids[pair // len(exon_numbers)], exon_numbers[pair % len(exon_numbers)])
+             for pair in pairs.tolist()]
+    return pairs, keys, counts
 
-def main():
-    args = get_args()
-    file_paths = args.file
-    output_file = args.output
 
-    # WARNING: adds to the same dictionary for all the input files. 
-    
-    all_data = defaultdict(lambda: defaultdict(list))
-    
-    for file_path in file_paths:
-        parse_file(file_path, all_data)
-    
+class PositionCounter:
+    """
+    Running counts of (transcript, exon, position) over many files.
+
+    Each (transcript, exon) pair gets an index in the order it is first seen,
+    and the counts are held as sorted integer keys (pair index << 32 |
+    position) with a count each. The partial counts of the files are merged
+    in batches, keeping the memory within about twice the unique positions.
+    """
+
+    def __init__(self):
+        self.pairs = {}
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.pending = []
+        self.pending_rows = 0
+
+    def add(self, pairs, keys, counts):
+        """Add the output of parse_file for one more file."""
+        pair_index = np.array([self.pairs.setdefault(pair, len(self.pairs)) for pair in pairs],
+                              dtype=np.int64)
+        keys = (pair_index[keys >> 32] << 32) | (keys & 0xFFFFFFFF)
+        self.pending.append((keys, counts))
+        self.pending_rows += len(keys)
+        if self.pending_rows >= len(self.keys):
+            self.merge()
+
+    def merge(self):
+        """Fold the pending partial counts into the totals."""
+        if not self.pending:
+            return
+        keys = np.concatenate([self.keys] + [keys for keys, _ in self.pending])
+        counts = np.concatenate([self.counts] + [counts for _, counts in self.pending])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts, minlength=len(self.keys)).astype(np.int64)
+        self.pending = []
+        self.pending_rows = 0
+
+    def exons(self):
+        """
+        Yield (transcript_id, exon_number, positions, counts) per exon.
+
+        Transcripts come in the order they were first seen and the exons of a
+        transcript likewise, with the positions in numerical order.
+        """
+        self.merge()
+        if not len(self.keys):
+            return
+        pairs = list(self.pairs)
+        transcript_order = pd.factorize(pd.Index([transcript_id for transcript_id, _ in pairs]))[0]
+        pair_index = self.keys >> 32
+        order = np.lexsort((pair_index, transcript_order[pair_index]))
+        keys, counts, pair_index = self.keys[order], self.counts[order], pair_index[order]
+        boundaries = np.flatnonzero(np.diff(pair_index)) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(keys)]])
+        positions = keys & 0xFFFFFFFF
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            transcript_id, exon_number = pairs[pair_index[start]]
+            yield transcript_id, exon_number, positions[start:end].tolist(), counts[start:end].tolist()
+
+
+def collect_counts(file_paths, threads=1):
+    """
+    Count the positions of all the files, reading them in parallel.
+
+    The partial counts are merged in the order of file_paths, so the output
+    order does not depend on the number of threads.
+
+    Args:
+        file_paths (list): The annotated files.
+        threads (int): Number of files read at once.
+
+    Returns:
+        PositionCounter: The merged counts.
+    """
+    counter = PositionCounter()
+    if threads <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            counter.add(*parse_file(file_path))
+        return counter
+    with ProcessPoolExecutor(max_workers=min(threads, len(file_paths))) as executor:
+        for result in executor.map(parse_file, file_paths):
+            counter.add(*result)
+    return counter
+
+
+def write_summary(counter, output_file):
+    """
+    Write one row per transcript and exon with its positions and their counts.
+
+    Args:
+        counter (PositionCounter): The merged counts.
+        output_file (str): Path to the output file.
+    """
     with open(output_file, 'w', newline='') as out_file:
         writer = csv.writer(out_file, delimiter='\t')
         writer.writerow(['transcript_id', 'exon_number', 'positions', 'num_positions', 
                          'num_unique_positions', 'summary'])
         
-        for transcript_id, exons in all_data.items():
-            for exon_number, positions in exons.items():
-                num_positions = len(positions)
-                unique_positions = sorted(set(positions), key=int)
-                num_unique_positions = len(unique_positions)
-                positions.sort(key=int)
-                positions_str = ','.join(positions)
-                summary = ', '.join([f"{pos}({positions.count(pos)})" for pos in unique_positions])
-                writer.writerow([transcript_id, exon_number, positions_str, num_positions, num_unique_positions, summary])
-    
-    print(f"Data successfully written to {output_file}")
+        for transcript_id, exon_number, positions, counts in counter.exons():
+            positions = [str(pos) for pos in positions]
+            positions_str = ','.join([','.join([pos] * count) for pos, count in zip(positions, counts)])
+            summary = ', '.join([f"{pos}({count})" for pos, count in zip(positions, counts)])
+            writer.writerow([transcript_id, exon_number, positions_str, sum(counts),
+                             len(positions), summary])
+
+
+def main():
+    args = get_args()
+    all_counts = collect_counts(args.file, max(1, args.threads))
+    write_summary(all_counts, args.output)
+    print(f"Data successfully written to {args.output}")
 
 if __name__ == "__main__":
     main()
-
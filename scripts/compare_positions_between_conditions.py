@@ -1,7 +1,15 @@
 import argparse
 import os
 import csv
-from collections import defaultdict
+import sys
+import numpy as np
+import pandas as pd
+
+# the interogate package lives one directory up from the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from interogate.table_io import table_format, read_table
+
+COMPARE_COLUMNS = {'transcript_id', 'exon_number', 'positions'}
 
 def get_args():
     parser = argparse.ArgumentParser(description="Compare exon modification data from multiple files", add_help=False)
@@ -14,130 +22,335 @@ def get_args():
                           required=True,
                           default=[os.path.join(file_directory, "data", "test1.tsv"), os.path.join(file_directory, "data", "test2.tsv")],
                           type=str,
-                          help="List of input files to be parsed and compared e.g. --files file1.tsv file2.tsv")
- 
+                          help="List of input files to be parsed and compared e.g. --files file1.tsv file2.tsv file3.tsv")
+
+    optional.add_argument("--names", dest='names',
+                          action="store",
+                          nargs='+',
+                          default=None,
+                          type=str,
+                          help="Condition names for the files, in the same order (default: the file names)")
+
+    optional.add_argument("--window", dest='window',
+                          action="store", default=0,
+                          type=int,
+                          help="Match sites within this many nt of each other on the same transcript " +
+                          "(default: 0, the positions must be equal)")
+
     optional.add_argument("--output", dest='output',
                           action="store", default=None,
                           type=str,
                           help="Path to the output file (default: derived from input filenames)")
-    
+
     return parser.parse_args()
 
 def parse_file(file_path):
     """
-    Parse exon data from a given file and return a dictionary.
+    Parse exon data from a given file and return its distinct sites.
 
-    This function reads a tab-separated values (TSV) file containing exon data,
-    and returns a dictionary with transcript IDs, exon numbers, and positions.
+    This function reads a tab-separated values (TSV) file containing exon data
+    (the output of collect_positions_of_m6a.py) and splits the comma separated
+    positions of each transcript and exon into one row per distinct position.
+    Gzip/zstd compressed TSV, Parquet and Feather tables are read too.
 
     Args:
         file_path (str): The path to the input file to be parsed.
 
     Returns:
-        dict: A dictionary where each key is a transcript ID, and each value
-              is another dictionary. The inner dictionary's keys are exon
-              numbers, and the values are sets of unique positions.
-    """
-    data = defaultdict(lambda: defaultdict(set))  # Using set to ensure unique positions
-    
-    with open(file_path, mode='r') as file:
-        csv_reader = csv.DictReader(file, delimiter='\t')
-        for row in csv_reader:
-            transcript_id = row['transcript_id']
-            exon_number = row['exon_number']
-            positions = row['positions'].split(',')
-            positions = [pos.strip() for pos in positions if pos.strip()]  # Clean and filter positions
-            data[transcript_id][exon_number].update(positions)
-            print(f"Parsed {transcript_id} {exon_number} with positions: {positions}")  # Debug print
-    
-    print(f"Data from {file_path}: {dict(data)}")  # Debug print entire data
-    return data
-
-def compare_files(data1, data2, filename1, filename2):
-    """
-    Compare exon modification data from two files.
-
-    This function takes two dictionaries containing exon modification data
-    and compares the transcripts and positions of modifications.
+        DataFrame: The 'transcript_id', 'exon_number' and 'position' (as
+                   written in the file) of each distinct site.
+    """
+    if table_format(file_path) in ('parquet', 'feather'):
+        table = read_table(file_path).astype(str)
+    else:
+        table = pd.read_csv(file_path, sep="\t", dtype=str, keep_default_na=False,
+                            usecols=lambda column: column in COMPARE_COLUMNS)
+    table = table[['transcript_id', 'exon_number', 'positions']].copy()
+    table['position'] = table['positions'].str.split(',')
+    table = table.explode('position')
+    table['position'] = table['position'].str.strip()
+    table = table[table['position'].notna() & (table['position'] != '')]  # Clean and filter positions
+    return table[['transcript_id', 'exon_number', 'position']].drop_duplicates(ignore_index=True)
+
+def condition_names(file_paths, names=None):
+    """
+    Return a name per condition: the given names, else the file names (the
+    whole path where two files share a name).
+    """
+    if names:
+        if len(names) != len(file_paths):
+            raise ValueError(f"{len(names)} names given for {len(file_paths)} files")
+        return list(names)
+    base_names = [os.path.basename(f) for f in file_paths]
+    if len(set(base_names)) < len(base_names):
+        return list(file_paths)
+    return base_names
+
+def compare_conditions(tables):
+    """
+    Find which conditions each site is in, for any number of conditions.
+
+    Every (transcript, exon) is given an integer code, every position its
+    rank in numerical order, and each site the key (code << 32 | rank). The
+    keys of all conditions are sorted together once and the condition bits
+    of each distinct key are summed, giving a membership bitmask per site
+    (bit i set when condition i has the site).
+
+    Args:
+        tables (list): One DataFrame per condition, as returned by parse_file.
+
+    Returns:
+        DataFrame: One row per distinct site with 'transcript_id', 'exon_number',
+                   'position' and its membership 'pattern', sorted by
+                   transcript, exon and position.
+    """
+    if len(tables) > 62:
+        raise ValueError("At most 62 conditions can be compared at once")
+    sites = pd.concat(tables, ignore_index=True)
+    condition = np.repeat(np.arange(len(tables), dtype=np.int64), [len(table) for table in tables])
+
+    pairs = pd.MultiIndex.from_frame(sites[['transcript_id', 'exon_number']])
+    pair_codes, pair_values = pd.factorize(pairs, sort=True)
+    # positions are compared as the text in the files, like the sets of
+    # strings were, and ordered by their value (which may not fit in 64 bits)
+    position_codes, position_values = pd.factorize(sites['position'])
+    position_values = position_values.tolist()
+    by_value = sorted(range(len(position_values)), key=lambda i: int(position_values[i]))
+    position_rank = np.empty(len(position_values), dtype=np.int64)
+    position_rank[by_value] = np.arange(len(position_values))
+    keys = (pair_codes.astype(np.int64) << 32) | position_rank[position_codes]
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    # each condition holds a site at most once, so the sum of its bits is the OR
+    patterns = np.add.reduceat(np.left_shift(1, condition[order]), starts) if len(keys) else np.zeros(0, dtype=np.int64)
+
+    unique_keys = keys[starts]
+    pair_index = unique_keys >> 32
+    return pd.DataFrame({
+        'transcript_id': pair_values.get_level_values(0)[pair_index],
+        'exon_number': pair_values.get_level_values(1)[pair_index],
+        'position': np.array([position_values[i] for i in by_value], dtype=object)[unique_keys & 0xFFFFFFFF],
+        'pattern': patterns,
+    })
+
+def nearest_within(query_keys, target_keys, window):
+    """
+    Find the nearest target site of each query site, within window nt.
+
+    Keys are (transcript code << 32 | position), so one searchsorted over the
+    sorted target keys finds the neighbours of every query site at once and
+    sites only match on the same transcript.
+
+    Args:
+        query_keys (array): Keys of the sites to match.
+        target_keys (array): Sorted keys of the sites to match against.
+        window (int): The largest distance, in nt, of a match.
+
+    Returns:
+        tuple: Index into target_keys of each query's match (-1 for none) and
+               the offset (target position - query position). Ties go to the
+               upstream site.
+    """
+    right = np.searchsorted(target_keys, query_keys)
+    left = right - 1
+    matches = np.full(len(query_keys), -1, dtype=np.int64)
+    offsets = np.zeros(len(query_keys), dtype=np.int64)
+    if not len(target_keys):
+        return matches, offsets
+    best_distance = np.full(len(query_keys), window + 1, dtype=np.int64)
+    for candidate in (left, right):
+        valid = (candidate >= 0) & (candidate < len(target_keys))
+        candidate = np.clip(candidate, 0, len(target_keys) - 1)
+        same_transcript = valid & ((target_keys[candidate] >> 32) == (query_keys >> 32))
+        offset = target_keys[candidate] - query_keys
+        better = same_transcript & (np.abs(offset) < best_distance)
+        matches[better] = candidate[better]
+        offsets[better] = offset[better]
+        best_distance[better] = np.abs(offset[better])
+    return matches, offsets
+
+def window_keys(tables):
+    """
+    Return the sorted transcript IDs and, per condition, the sites sorted by
+    their key (transcript code << 32 | position) with those keys.
+    """
+    transcript_ids = pd.Index(pd.concat([table['transcript_id'] for table in tables]).unique()).sort_values()
+    keyed = []
+    for table in tables:
+        values = pd.to_numeric(table['position'], errors='coerce').to_numpy(dtype=np.float64)
+        bad = ~((values >= 0) & (values < 1 << 32) & (values == np.floor(values)))
+        if bad.any():
+            raise ValueError(f"--window needs whole positions between 0 and 2^32 - 1, "
+                             f"found {table['position'].iloc[np.argmax(bad)]!r}")
+        positions = values.astype(np.int64)
+        keys = (transcript_ids.get_indexer(table['transcript_id']).astype(np.int64) << 32) | positions
+        order = np.argsort(keys, kind='stable')
+        keyed.append((table.iloc[order].reset_index(drop=True), keys[order]))
+    return transcript_ids, keyed
+
+def compare_conditions_window(tables, window):
+    """
+    As compare_conditions, but a condition has a site when it has one within
+    window nt of it on the same transcript.
+
+    Args:
+        tables (list): One DataFrame per condition, as returned by parse_file.
+        window (int): The largest distance, in nt, of a match.
+
+    Returns:
+        DataFrame: One row per distinct site of any condition, see compare_conditions.
+    """
+    if len(tables) > 62:
+        raise ValueError("At most 62 conditions can be compared at once")
+    _, keyed = window_keys(tables)
+    sites = pd.concat([table for table, _ in keyed], ignore_index=True)
+    keys = np.concatenate([keys for _, keys in keyed])
+    sites['key'] = keys
+    sites = sites.drop_duplicates(['transcript_id', 'exon_number', 'position'], ignore_index=True)
+    keys = sites['key'].to_numpy()
+    patterns = np.zeros(len(sites), dtype=np.int64)
+    for condition, (_, condition_keys) in enumerate(keyed):
+        matches, _ = nearest_within(keys, condition_keys, window)
+        patterns[matches >= 0] |= 1 << condition
+    sites['pattern'] = patterns
+    sites['position_value'] = keys & 0xFFFFFFFF
+    sites = sites.sort_values(['transcript_id', 'exon_number', 'position_value'], ignore_index=True)
+    return sites[['transcript_id', 'exon_number', 'position', 'pattern']]
+
+def matched_pairs(tables, names, window):
+    """
+    List the matches of the sites of each condition in every later condition.
 
     Args:
-        data1 (dict): A dictionary containing exon modification data from the first file.
-        data2 (dict): A dictionary containing exon modification data from the second file.
-        filename1 (str): The name of the first file.
-        filename2 (str): The name of the second file.
+        tables (list): One DataFrame per condition, as returned by parse_file.
+        names (list): The condition names.
+        window (int): The largest distance, in nt, of a match.
 
     Returns:
-        dict: A dictionary containing the comparison results.
-    """
-    comparison_results = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    
-    all_transcripts = set(data1.keys()).union(data2.keys())
-    
-    for transcript_id in all_transcripts:
-        all_exons = set(data1[transcript_id].keys()).union(data2[transcript_id].keys())
-        
-        for exon_number in all_exons:
-            positions1 = data1[transcript_id][exon_number] if exon_number in data1[transcript_id] else set()
-            positions2 = data2[transcript_id][exon_number] if exon_number in data2[transcript_id] else set()
-            
-            common_positions = positions1.intersection(positions2)
-            unique_positions1 = positions1 - common_positions
-            unique_positions2 = positions2 - common_positions
-
-            comparison_results[transcript_id][exon_number]['common'] = sorted(list(common_positions), key=int)
-            comparison_results[transcript_id][exon_number][f'unique_{os.path.basename(filename1)}'] = sorted(list(unique_positions1), key=int)
-            comparison_results[transcript_id][exon_number][f'unique_{os.path.basename(filename2)}'] = sorted(list(unique_positions2), key=int)
-
-            print(f"Transcript {transcript_id} Exon {exon_number}: Common positions: {common_positions}")  # Debug print
-            print(f"Unique positions for {transcript_id} {exon_number} in file {filename1}: {unique_positions1}")  # Debug print
-            print(f"Unique positions for {transcript_id} {exon_number} in file {filename2}: {unique_positions2}")  # Debug print
-    
-    return comparison_results
+        DataFrame: One row per site of condition_a with its nearest site of
+                   condition_b (within window nt), and the 'offset' between them.
+    """
+    _, keyed = window_keys(tables)
+    pairs = []
+    for a in range(len(keyed)):
+        for b in range(a + 1, len(keyed)):
+            sites_a, keys_a = keyed[a]
+            sites_b, keys_b = keyed[b]
+            matches, offsets = nearest_within(keys_a, keys_b, window)
+            matched = matches >= 0
+            pairs.append(pd.DataFrame({
+                'transcript_id': sites_a['transcript_id'].to_numpy()[matched],
+                'condition_a': names[a],
+                'exon_number_a': sites_a['exon_number'].to_numpy()[matched],
+                'position_a': sites_a['position'].to_numpy()[matched],
+                'condition_b': names[b],
+                'exon_number_b': sites_b['exon_number'].to_numpy()[matches[matched]],
+                'position_b': sites_b['position'].to_numpy()[matches[matched]],
+                'offset': offsets[matched],
+            }))
+    columns = ['transcript_id', 'condition_a', 'exon_number_a', 'position_a',
+               'condition_b', 'exon_number_b', 'position_b', 'offset']
+    return pd.concat(pairs, ignore_index=True) if pairs else pd.DataFrame(columns=columns)
+
+def membership_table(membership, names):
+    """
+    Add the number of conditions and a 0/1 column per condition to each site.
+    """
+    table = membership.copy()
+    bits = (table['pattern'].to_numpy()[:, None] >> np.arange(len(names))) & 1
+    table['n_conditions'] = bits.sum(axis=1)
+    for i, name in enumerate(names):
+        table[name] = bits[:, i]
+    return table
+
+def pattern_counts(membership, names):
+    """
+    Count the sites of every membership pattern (the UpSet intersections).
+
+    Each site is counted once, in the pattern of exactly the conditions that
+    have it.
+
+    Args:
+        membership (DataFrame): As returned by compare_conditions.
+        names (list): The condition names.
+
+    Returns:
+        DataFrame: One row per pattern seen with 'pattern', 'conditions' (the
+                   names joined by '&'), 'n_conditions', a 0/1 column per
+                   condition, 'num_sites' and 'num_transcripts', most sites first.
+    """
+    counts = membership.groupby('pattern').agg(num_sites=('position', 'size'),
+                                               num_transcripts=('transcript_id', 'nunique')).reset_index()
+    pattern = counts['pattern'].to_numpy()
+    bits = (pattern[:, None] >> np.arange(len(names))) & 1
+    counts.insert(1, 'conditions', ['&'.join(name for name, bit in zip(names, row) if bit) for row in bits])
+    counts.insert(2, 'n_conditions', bits.sum(axis=1))
+    for i, name in enumerate(names):
+        counts.insert(3 + i, name, bits[:, i])
+    return counts.sort_values(['num_sites', 'pattern'], ascending=[False, True], ignore_index=True)
+
+def write_pairwise(membership, file_paths, output_file):
+    """
+    Write the two condition table: the common and the unique positions of each
+    transcript and exon.
+    """
+    name1, name2 = os.path.basename(file_paths[0]), os.path.basename(file_paths[1])
+    with open(output_file, 'w', newline='') as out_file:
+        writer = csv.writer(out_file, delimiter='\t')
+        header = ['transcript_id', 'exon_number', 'common_positions', 'num_common_positions',
+                  f'unique_positions_{name1}', f'num_unique_positions_{name1}',
+                  f'unique_positions_{name2}', f'num_unique_positions_{name2}']
+        writer.writerow(header)
+
+        for (transcript_id, exon_number), sites in membership.groupby(['transcript_id', 'exon_number'], sort=False):
+            positions = sites['position'].to_numpy()
+            pattern = sites['pattern'].to_numpy()
+            common_positions = positions[pattern == 3].tolist()
+            unique_positions1 = positions[pattern == 1].tolist()
+            unique_positions2 = positions[pattern == 2].tolist()
+            row = [transcript_id, exon_number, ', '.join(common_positions), len(common_positions)]
+            row.extend([', '.join(unique_positions1) if unique_positions1 else '0', len(unique_positions1),
+                        ', '.join(unique_positions2) if unique_positions2 else '0', len(unique_positions2)])
+            writer.writerow(row)
 
 def main():
     args = get_args()
     file_paths = args.files
     output_file = args.output
-    
+    names = condition_names(file_paths, args.names)
+
     if output_file is None:
         base_names = [os.path.splitext(os.path.basename(f))[0] for f in file_paths]
         output_file = "_vs_".join(base_names) + "_comparison.tsv"
-    
-    # Parse files separately
-    data1 = parse_file(file_paths[0])
-    data2 = parse_file(file_paths[1])
-    
-    # Compare data from the two files
-    comparison_results = compare_files(data1, data2, file_paths[0], file_paths[1])
-    
-    # Write comparison results to the output file
-    with open(output_file, 'w', newline='') as out_file:
-        writer = csv.writer(out_file, delimiter='\t')
-        header = ['transcript_id', 'exon_number', 'common_positions', 'num_common_positions',
-                  f'unique_positions_{os.path.basename(file_paths[0])}', f'num_unique_positions_{os.path.basename(file_paths[0])}',
-                  f'unique_positions_{os.path.basename(file_paths[1])}', f'num_unique_positions_{os.path.basename(file_paths[1])}']
-        writer.writerow(header)
-        
-        for transcript_id, exons in comparison_results.items():
-            for exon_number, positions_data in exons.items():
-                common_positions = positions_data['common']
-                num_common_positions = len(common_positions)
-                row = [transcript_id, exon_number, ', '.join(common_positions), num_common_positions]
-        
-                unique_positions1 = positions_data.get(f'unique_{os.path.basename(file_paths[0])}', [])
-                num_unique_positions1 = len(unique_positions1) if unique_positions1 else 0
-                unique_positions2 = positions_data.get(f'unique_{os.path.basename(file_paths[1])}', [])
-                num_unique_positions2 = len(unique_positions2) if unique_positions2 else 0
-        
-                unique_positions1_str = ', '.join(unique_positions1) if unique_positions1 else '0'
-                unique_positions2_str = ', '.join(unique_positions2) if unique_positions2 else '0'
-        
-                row.extend([unique_positions1_str, num_unique_positions1,
-                            unique_positions2_str, num_unique_positions2])
-        
-                writer.writerow(row)
-    
-    print(f"Comparison data successfully written to {output_file}")
+    output_stem = output_file[:-len(".tsv")] if output_file.endswith(".tsv") else output_file
+
+    # Parse the files and find the conditions of every site in one pass
+    tables = [parse_file(file_path) for file_path in file_paths]
+    if args.window > 0:
+        try:
+            membership = compare_conditions_window(tables, args.window)
+            matches = matched_pairs(tables, names, args.window)
+        except ValueError as e:
+            sys.exit(f"Error: {e}")
+        matches_file = f"{output_stem}_window{args.window}_matches.tsv"
+        matches.to_csv(matches_file, sep='\t', index=False)
+        print(f"{len(matches)} sites matched within {args.window} nt written to {matches_file}")
+    else:
+        membership = compare_conditions(tables)
+
+    membership_file = f"{output_stem}_membership.tsv"
+    membership_table(membership, names).to_csv(membership_file, sep='\t', index=False)
+    patterns = pattern_counts(membership, names)
+    patterns_file = f"{output_stem}_patterns.tsv"
+    patterns.to_csv(patterns_file, sep='\t', index=False)
+    print(patterns[['conditions', 'num_sites', 'num_transcripts']].to_string(index=False))
+    print(f"Site membership written to {membership_file} and pattern counts to {patterns_file}")
+
+    # the original two condition table
+    if len(file_paths) == 2:
+        write_pairwise(membership, file_paths, output_file)
+        print(f"Comparison data successfully written to {output_file}")
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,19 @@
-import pysam
-import re
 import pandas as pd
 import argparse
 import os
+import sys
+import tempfile
 from scipy.stats import wasserstein_distance, mannwhitneyu
 import numpy as np
 import logging
 from statsmodels.stats.multitest import multipletests
 import gffutils
 
+# the interogate package lives one directory up from the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from interogate.polya import (POLYA_COLUMNS, DISTANCE_COLUMN, DEFAULT_CHUNK_SIZE, DEFAULT_MIN_TAIL_LENGTH,
+                            scan_bam_files, merge_shards)
+
 def get_args():
     """
     Parse and return the command line arguments.
@@ -61,6 +66,30 @@ def get_args():
                           default=0.05,
                           help="False discovery rate threshold for multiple testing correction")
 
+    optional.add_argument("--min_polyA_length", dest='min_polyA_length',
+                          action="store",
+                          type=int,
+                          default=DEFAULT_MIN_TAIL_LENGTH,
+                          help="Shortest run of A at the 3' end of a read counted as a poly(A) tail")
+
+    optional.add_argument("--polyA_mismatches", dest='polyA_mismatches',
+                          action="store",
+                          type=int,
+                          default=0,
+                          help="Number of single non-A bases (basecalling errors) allowed inside the poly(A) tail")
+
+    optional.add_argument("--thread", dest='threads',
+                          action="store",
+                          type=int,
+                          default=1,
+                          help="Number of processes scanning the BAM files, each takes a share of the references")
+
+    optional.add_argument("--chunk_size", dest='chunk_size',
+                          action="store",
+                          type=int,
+                          default=DEFAULT_CHUNK_SIZE,
+                          help="References longer than this are scanned in several pieces")
+
     optional.add_argument("--log", dest='log',
                           action="store",
                           type=str,
@@ -101,67 +130,6 @@ def extract_stop_codon_positions(gtf_file):
                 stop_codons[transcript.id] = (stop_codon_pos, strand)
     return stop_codons
 
-def extract_polyA_sites(bam_file, fasta_file, stop_codons, group):
-    """
-    Extract poly(A) sites from the BAM file and calculate distances from stop codons.
-
-    Args:
-        bam_file (str): Path to the BAM file.
-        fasta_file (str): Path to the reference genome FASTA file.
-        stop_codons (dict): Dictionary of stop codon positions and strands.
-        group (str): Sample group (e.g., WT or MUT).
-
-    Returns:
-        list: A list of poly(A) site information.
-    """
-    logging.info(f"Processing file: {bam_file} as {group}")
-    bam = pysam.AlignmentFile(bam_file, "rb")
-    fasta = pysam.FastaFile(fasta_file)
-    
-    polyA_sites = []
-
-    for read in bam.fetch():
-        if not read.is_unmapped:
-            seq = read.query_sequence
-            if not isinstance(seq, str):
-                seq = str(seq)
-            match = re.search(r'(A{10,})$', seq)
-            
-            if match:
-                read_name = read.query_name
-                polyA_start = read.reference_start + match.start()
-                polyA_length = len(match.group(0))
-                transcript_id = read.reference_name
-                chrom = read.reference_name
-                coordinate = read.reference_start + match.start()
-                
-                if coordinate >= 20:
-                    region_start = coordinate - 20
-                    region_end = coordinate
-                    try:
-                        pre_polyA_seq = fasta.fetch(chrom, region_start, region_end)
-                    except KeyError:
-                        logging.error(f"Chromosome '{chrom}' not found in FASTA file.")
-                        continue
-                else:
-                    try:
-                        pre_polyA_seq = fasta.fetch(chrom, 0, coordinate)
-                    except KeyError:
-                        logging.error(f"Chromosome '{chrom}' not found in FASTA file.")
-                        continue
-
-                stop_codon_info = stop_codons.get(transcript_id, None)
-                if stop_codon_info:
-                    stop_codon_pos, strand = stop_codon_info
-                    if strand == '+':
-                        distance_from_stop = coordinate - stop_codon_pos
-                    else:
-                        distance_from_stop = stop_codon_pos - coordinate
-                    polyA_sites.append([read_name, transcript_id, coordinate, polyA_start, polyA_length, pre_polyA_seq, distance_from_stop])
-    
-    logging.info(f"Extracted {len(polyA_sites)} poly(A) sites from {bam_file}")
-    return polyA_sites
-
 def perform_statistical_analysis(polyA_data, fdr_threshold):
     """
     Perform statistical analysis on poly(A) site data to find significant differences.
@@ -217,22 +185,30 @@ def main():
     # Extract stop codon positions from GTF file
     stop_codons = extract_stop_codon_positions(args.gtf)
 
-    polyA_data = {'WT': [], 'MUT': []}
-
-    for bam_file, group in zip(args.bam, args.groups):
-        polyA_sites = extract_polyA_sites(bam_file, args.fasta, stop_codons, group)
-        polyA_data[group].extend(polyA_sites)
+    unknown_groups = set(args.groups) - {'WT', 'MUT'}
+    if unknown_groups:
+        logging.error(f"Groups must be WT or MUT, not {', '.join(sorted(unknown_groups))}")
+        return
 
-    # Convert results to DataFrame
-    columns = ['Read_Name', 'TranscriptID', 'Genomic_Coordinate', 'PolyA_Start', 'PolyA_Length', 'Pre_PolyA_Sequence', 'Distance_From_Stop']
-    polyA_df_wt = pd.DataFrame(polyA_data['WT'], columns=columns)
-    polyA_df_mut = pd.DataFrame(polyA_data['MUT'], columns=columns)
-    
-    # Save to TSV
-    polyA_df_wt.to_csv(f"WT_{args.output}", sep='\t', index=False)
-    polyA_df_mut.to_csv(f"MUT_{args.output}", sep='\t', index=False)
+    # Scan the references of every BAM file in parallel, each process writing
+    # its sites to a shard, and merge the shards of each group in order
+    columns = POLYA_COLUMNS + [DISTANCE_COLUMN]
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(args.output))) as shard_dir:
+        scanned = scan_bam_files(args.bam, args.fasta, shard_dir, args.threads, stop_codons, args.chunk_size,
+                                 args.min_polyA_length, args.polyA_mismatches)
+        for bam_file, group, (_, n_sites) in zip(args.bam, args.groups, scanned):
+            logging.info(f"Extracted {n_sites} poly(A) sites from {bam_file} as {group}")
+        for group in ('WT', 'MUT'):
+            shard_paths = [shard_path for (shard_paths, _), bam_group in zip(scanned, args.groups)
+                           if bam_group == group for shard_path in shard_paths]
+            merge_shards(shard_paths, f"{group}_{args.output}", columns)
     logging.info(f"Poly(A) sites have been extracted and saved to {args.output}")
 
+    text_columns = {'Read_Name': str, 'TranscriptID': str, 'Pre_PolyA_Sequence': str}
+    polyA_df_wt = pd.read_csv(f"WT_{args.output}", sep='\t', dtype=text_columns, keep_default_na=False)
+    polyA_df_mut = pd.read_csv(f"MUT_{args.output}", sep='\t', dtype=text_columns, keep_default_na=False)
+    polyA_data = {'WT': polyA_df_wt.values.tolist(), 'MUT': polyA_df_mut.values.tolist()}
+
     # Check if there are any poly(A) sites
     if polyA_df_wt.empty or polyA_df_mut.empty:
         logging.error("No poly(A) sites extracted. Ensure the input BAM files and GTF annotations are correct.")
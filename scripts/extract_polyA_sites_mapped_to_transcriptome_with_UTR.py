@@ -1,13 +1,18 @@
-import pysam
-import re
 import pandas as pd
 import argparse
 import os
+import sys
+import tempfile
 from scipy.stats import wasserstein_distance, mannwhitneyu
 import numpy as np
 import logging
 from statsmodels.stats.multitest import multipletests
 
+# the interogate package lives one directory up from the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from interogate.polya import (POLYA_COLUMNS, DEFAULT_CHUNK_SIZE, DEFAULT_MIN_TAIL_LENGTH,
+                            scan_bam_files, merge_shards)
+
 def get_args():
     parser = argparse.ArgumentParser(description="Extract poly(A) sites from nanopore direct RNAseq data",
                                      add_help=False)
@@ -46,6 +51,30 @@ def get_args():
                           default=0.05,
                           help="False discovery rate threshold for multiple testing correction")
 
+    optional.add_argument("--min_polyA_length", dest='min_polyA_length',
+                          action="store",
+                          type=int,
+                          default=DEFAULT_MIN_TAIL_LENGTH,
+                          help="Shortest run of A at the 3' end of a read counted as a poly(A) tail")
+
+    optional.add_argument("--polyA_mismatches", dest='polyA_mismatches',
+                          action="store",
+                          type=int,
+                          default=0,
+                          help="Number of single non-A bases (basecalling errors) allowed inside the poly(A) tail")
+
+    optional.add_argument("--thread", dest='threads',
+                          action="store",
+                          type=int,
+                          default=1,
+                          help="Number of processes scanning the BAM files, each takes a share of the transcripts")
+
+    optional.add_argument("--chunk_size", dest='chunk_size',
+                          action="store",
+                          type=int,
+                          default=DEFAULT_CHUNK_SIZE,
+                          help="References longer than this are scanned in several pieces")
+
     optional.add_argument("--log", dest='log',
                           action="store",
                           type=str,
@@ -57,38 +86,6 @@ def get_args():
 
     return parser.parse_args()
 
-def extract_polyA_sites(bam_file, fasta_file, group):
-    logging.info(f"Processing file: {bam_file} as {group}")
-    bam = pysam.AlignmentFile(bam_file, "rb")
-    fasta = pysam.FastaFile(fasta_file)
-    
-    polyA_sites = []
-
-    for read in bam.fetch():
-        if not read.is_unmapped:
-            seq = read.query_sequence
-            match = re.search(r'(A{10,})$', seq)
-            
-            if match:
-                read_name = read.query_name
-                polyA_start = read.reference_start + match.start()
-                polyA_length = len(match.group(0))
-                transcript_id = read.reference_name
-                chrom = read.reference_name
-                coordinate = read.reference_start + match.start()
-                
-                if coordinate >= 20:
-                    region_start = coordinate - 20
-                    region_end = coordinate
-                    pre_polyA_seq = fasta.fetch(chrom, region_start, region_end)
-                else:
-                    pre_polyA_seq = fasta.fetch(chrom, 0, coordinate)
-                
-                polyA_sites.append([read_name, transcript_id, coordinate, polyA_start, polyA_length, pre_polyA_seq])
-    
-    logging.info(f"Extracted {len(polyA_sites)} poly(A) sites from {bam_file}")
-    return polyA_sites
-
 def perform_statistical_analysis(polyA_data, fdr_threshold):
     results = []
 
@@ -128,21 +125,29 @@ def main():
     console.setFormatter(formatter)
     logging.getLogger('').addHandler(console)
 
-    polyA_data = {'WT': [], 'MUT': []}
-
-    for bam_file, group in zip(args.bam, args.groups):
-        polyA_sites = extract_polyA_sites(bam_file, args.fasta, group)
-        polyA_data[group].extend(polyA_sites)
-
-    # Convert results to DataFrame
-    polyA_df_wt = pd.DataFrame(polyA_data['WT'], columns=['Read_Name', 'TranscriptID', 'Genomic_Coordinate', 'PolyA_Start', 'PolyA_Length', 'Pre_PolyA_Sequence'])
-    polyA_df_mut = pd.DataFrame(polyA_data['MUT'], columns=['Read_Name', 'TranscriptID', 'Genomic_Coordinate', 'PolyA_Start', 'PolyA_Length', 'Pre_PolyA_Sequence'])
-    
-    # Save to TSV
-    polyA_df_wt.to_csv(f"WT_{args.output}", sep='\t', index=False)
-    polyA_df_mut.to_csv(f"MUT_{args.output}", sep='\t', index=False)
+    unknown_groups = set(args.groups) - {'WT', 'MUT'}
+    if unknown_groups:
+        logging.error(f"Groups must be WT or MUT, not {', '.join(sorted(unknown_groups))}")
+        return
+
+    # Scan the transcripts of every BAM file in parallel, each process writing
+    # its sites to a shard, and merge the shards of each group in order
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(args.output))) as shard_dir:
+        scanned = scan_bam_files(args.bam, args.fasta, shard_dir, args.threads, chunk_size=args.chunk_size,
+                                 min_length=args.min_polyA_length, max_mismatches=args.polyA_mismatches)
+        for bam_file, group, (_, n_sites) in zip(args.bam, args.groups, scanned):
+            logging.info(f"Extracted {n_sites} poly(A) sites from {bam_file} as {group}")
+        for group in ('WT', 'MUT'):
+            shard_paths = [shard_path for (shard_paths, _), bam_group in zip(scanned, args.groups)
+                           if bam_group == group for shard_path in shard_paths]
+            merge_shards(shard_paths, f"{group}_{args.output}", POLYA_COLUMNS)
     logging.info(f"Poly(A) sites have been extracted and saved to {args.output}")
 
+    text_columns = {'Read_Name': str, 'TranscriptID': str, 'Pre_PolyA_Sequence': str}
+    polyA_df_wt = pd.read_csv(f"WT_{args.output}", sep='\t', dtype=text_columns, keep_default_na=False)
+    polyA_df_mut = pd.read_csv(f"MUT_{args.output}", sep='\t', dtype=text_columns, keep_default_na=False)
+    polyA_data = {'WT': polyA_df_wt.values.tolist(), 'MUT': polyA_df_mut.values.tolist()}
+
     # Perform global statistical comparison of poly(A) site locations
     logging.info("Starting global statistical analysis of poly(A) site locations")
     wt_sites = polyA_df_wt['Genomic_Coordinate'].values
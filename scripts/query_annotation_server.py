@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+#
+# query_annotation_server.py
+
+# script to annotate the sites of an m6anet csv (or any csv/tab file with
+# transcript_id and transcript_position or position columns) using a running
+# annotation_server.py
+
+import os
+import sys
+import argparse
+
+# the interogate package lives one directory up from the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from interogate.annotation_server import AnnotationClient, DEFAULT_HOST, DEFAULT_PORT
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Annotate sites with a running annotation server",
+                                     add_help=False)
+    optional = parser.add_argument_group('optional arguments')
+    optional.add_argument("--sites", dest='sites',
+                          action="store", required=True, type=str,
+                          help="csv (or .tab) file of sites, e.g. data.site_proba.csv")
+    optional.add_argument("--threshold", dest='threshold',
+                          action="store", default=None, type=float,
+                          help="only sites with probability_modified above this")
+    optional.add_argument("--host", dest='host',
+                          action="store", default=DEFAULT_HOST, type=str,
+                          help=f"server address. Default {DEFAULT_HOST}")
+    optional.add_argument("--port", dest='port',
+                          action="store", default=DEFAULT_PORT, type=int,
+                          help=f"server port. Default {DEFAULT_PORT}")
+    optional.add_argument("-o", "--output", dest='output',
+                          action="store", default="annotated_sites.tab", type=str,
+                          help="output file (default: annotated_sites.tab)")
+    optional.add_argument("-h", "--help", action="help", default=argparse.SUPPRESS,
+                          help="Show this help message and exit")
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    import pandas as pd
+
+    sep = "\t" if args.sites.endswith(".tab") or args.sites.endswith(".tsv") else ","
+    sites = pd.read_csv(args.sites, sep=sep)
+    if args.threshold is not None:
+        sites = sites[sites['probability_modified'] > args.threshold]
+    with AnnotationClient(args.host, args.port) as client:
+        results_df = client.annotate_frame(sites)
+    results_df.to_csv(args.output, index=False, sep="\t")
+    print(f"{len(results_df)} annotated sites saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""Tests of the vectorised site annotation"""
+
+import io
+import unittest
+import numpy as np
+import pandas as pd
+from interogate.parse_gtf import parse_gff_gft
+from interogate.return_dict import generate_transcript_coordinates
+from interogate.parse_m6a_site_proba import identify_methylated_sites
+from interogate.parse_trans_len import parse_transcript_lengths
+from interogate.annotate import annotate_sites
+
+
+class TestAnnotateSites(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        features = parse_gff_gft('data/test.gtf')
+        transcript_lengths = parse_transcript_lengths('data/Araport11_genes.201606.cdna.len')
+        cls.transcript_dict, _, cls.gene_exon_counts, cls.last_exon_for_transcript, _ = \
+            generate_transcript_coordinates(features, transcript_lengths)
+
+
+    def test_matches_expected_output(self):
+        """Annotating data/test.data.site_proba.csv reproduces the stored result"""
+        sites = identify_methylated_sites('data/test.data.site_proba.csv', 0.9)
+        sites = sites[sites['transcript_id'].isin(set(self.transcript_dict.keys()))]
+        result = annotate_sites(sites, self.transcript_dict, self.gene_exon_counts)
+        expected = pd.read_csv('data/test.data.site_proba_exon_annotated.tab', sep='\t')
+        result = pd.read_csv(io.StringIO(result.to_csv(index=False, sep='\t')), sep='\t')
+        pd.testing.assert_frame_equal(result, expected)
+
+
+    def test_matches_single_queries(self):
+        """Every row agrees with a one site at a time TranscriptModel.query"""
+        rng = np.random.default_rng(0)
+        transcript_ids = list(self.transcript_dict.keys())
+        sites = pd.DataFrame({
+            'transcript_id': rng.choice(transcript_ids, 500),
+            'transcript_position': rng.integers(0, 1200, 500),
+        })
+        result = annotate_sites(sites, self.transcript_dict, self.gene_exon_counts)
+        for row in result.itertuples(index=False):
+            exon_number, total_exons, is_last = self.transcript_dict.query(row.transcript_id, row.position)
+            self.assertEqual(row.exon_number, exon_number if exon_number is not None else 'UTR')
+            self.assertEqual(row.is_last_exon, is_last)
+            if exon_number is not None:
+                self.assertEqual(row.total_exons_in_transcript, total_exons)
+                self.assertEqual(exon_number == self.last_exon_for_transcript[row.transcript_id], is_last)
+
+
+    def test_unknown_transcript(self):
+        """Transcripts missing from the model are UTR with an unknown gene"""
+        sites = pd.DataFrame({'transcript_id': ['NOT_A_GENE.1'], 'transcript_position': [5]})
+        result = annotate_sites(sites, self.transcript_dict, self.gene_exon_counts)
+        self.assertEqual(result.loc[0, 'exon_number'], 'UTR')
+        self.assertEqual(result.loc[0, 'total_exons_in_gene'], 'Unknown')
+        self.assertFalse(result.loc[0, 'is_last_exon'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Tests of the on disk annotation cache"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from interogate.annotation_cache import load_annotation, evict_cache, cache_key
+
+
+GTF = 'data/test.gtf'
+LENGTHS = 'data/Araport11_genes.201606.cdna.len'
+
+
+class TestAnnotationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+
+    def test_warm_load_matches_parse(self):
+        """A cached annotation is identical to a freshly parsed one"""
+        parsed = load_annotation(GTF, LENGTHS, cache_dir=None)
+        load_annotation(GTF, LENGTHS, cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        cached = load_annotation(GTF, LENGTHS, cache_dir=self.cache_dir)
+
+        lengths, model, exon_counts, gene_counts, last_exons, strands = cached
+        self.assertEqual(dict(lengths), dict(parsed[0]))
+        self.assertEqual(dict(model.items()), dict(parsed[1].items()))
+        np.testing.assert_array_equal(model.is_last_exon, parsed[1].is_last_exon)
+        self.assertEqual(exon_counts, parsed[2])
+        self.assertEqual(gene_counts, parsed[3])
+        self.assertEqual(last_exons, parsed[4])
+        self.assertEqual(dict(strands), dict(parsed[5]))
+
+
+    def test_key_follows_content(self):
+        """Changing the GTF content changes the cache key"""
+        gtf_copy = os.path.join(self.cache_dir, 'copy.gtf')
+        shutil.copy(GTF, gtf_copy)
+        key = cache_key(gtf_copy, LENGTHS)
+        self.assertEqual(key, cache_key(GTF, LENGTHS))
+        with open(gtf_copy, 'a') as handle:
+            handle.write("# extra comment\n")
+        self.assertNotEqual(key, cache_key(gtf_copy, LENGTHS))
+
+
+    def test_known_key_is_not_rehashed(self):
+        """A key from the caller names the cache file, the inputs are not hashed again"""
+        from unittest import mock
+
+        key = cache_key(GTF, LENGTHS)
+        with mock.patch('interogate.annotation_cache.file_digest') as file_digest:
+            load_annotation(GTF, LENGTHS, cache_dir=self.cache_dir, key=key)
+        file_digest.assert_not_called()
+        self.assertEqual(os.listdir(self.cache_dir), [f"annotation_{key}.npz"])
+
+
+    def test_eviction(self):
+        """The least recently used entries are removed first"""
+        for i, name in enumerate(['annotation_a.npz', 'annotation_b.npz', 'annotation_c.npz']):
+            path = os.path.join(self.cache_dir, name)
+            with open(path, 'wb') as handle:
+                handle.write(b'x' * 100)
+            os.utime(path, (i, i))
+        removed = evict_cache(self.cache_dir, max_bytes=150,
+                              keep=os.path.join(self.cache_dir, 'annotation_a.npz'))
+        self.assertEqual([os.path.basename(path) for path in removed],
+                         ['annotation_b.npz', 'annotation_c.npz'])
+        self.assertEqual(os.listdir(self.cache_dir), ['annotation_a.npz'])
+
+
+if __name__ == '__main__':
+    unittest.main()
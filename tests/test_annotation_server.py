@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests of the annotation server and client"""
+
+import threading
+import unittest
+import pandas as pd
+from interogate.parse_trans_len import parse_transcript_lengths
+from interogate.return_dict import transcript_coordinates_from_file
+from interogate.annotate import annotate_sites
+from interogate.annotation_server import make_server, AnnotationClient
+
+
+class TestAnnotationServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        transcript_lengths = parse_transcript_lengths('data/Araport11_genes.201606.cdna.len')
+        cls.transcript_dict, _, cls.gene_exon_counts, _, _ = \
+            transcript_coordinates_from_file('data/test.gtf', transcript_lengths)
+        cls.server = make_server(cls.transcript_dict, cls.gene_exon_counts, port=0)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def client(self):
+        host, port = self.server.server_address[:2]
+        return AnnotationClient(host, port)
+
+
+    def test_matches_annotate_sites(self):
+        """The server gives the same annotation as annotate_sites"""
+        sites = pd.read_csv('data/test.data.site_proba.csv')
+        expected = annotate_sites(sites, self.transcript_dict, self.gene_exon_counts)
+        with self.client() as client:
+            self.assertEqual(client.health()['transcripts'], len(self.transcript_dict))
+            result = client.annotate_frame(sites)
+        self.assertEqual(len(result), len(sites))
+        known = result['in_annotation']
+        self.assertFalse(known.all())
+        for column in ('exon_number', 'total_exons_in_gene', 'is_last_exon'):
+            self.assertEqual(result.loc[known, column].astype(str).tolist(),
+                             expected.loc[known.to_numpy(), column].astype(str).tolist())
+        self.assertEqual(result['is_utr'].tolist(), (result['exon_number'] == 'UTR').tolist())
+
+
+    def test_bad_request(self):
+        with self.client() as client:
+            with self.assertRaises(RuntimeError):
+                client.annotate(['AT1G01100.2'], [1, 2])
+            # the connection is still usable afterwards
+            self.assertEqual(len(client.annotate(['AT1G01100.2'], [1])['exon_number']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
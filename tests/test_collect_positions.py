@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""Tests of the position counting in scripts/collect_positions_of_m6a.py"""
+
+import os
+import sys
+import csv
+import tempfile
+import unittest
+import importlib.util
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+spec = importlib.util.spec_from_file_location('collect_positions_of_m6a',
+                                              os.path.join('scripts', 'collect_positions_of_m6a.py'))
+collect_positions_of_m6a = importlib.util.module_from_spec(spec)
+# registered so the worker processes can find parse_file
+sys.modules[spec.name] = collect_positions_of_m6a
+spec.loader.exec_module(collect_positions_of_m6a)
+
+
+def legacy_collect(file_paths):
+    """The original list based aggregation, as rows of the output."""
+    data = defaultdict(lambda: defaultdict(list))
+    for file_path in file_paths:
+        with open(file_path) as file:
+            reader = csv.DictReader(file, delimiter='\t')
+            column_name = 'position' if 'position' in reader.fieldnames else 'positions'
+            for row in reader:
+                data[row['transcript_id']][row['exon_number']].append(row[column_name])
+    rows = []
+    for transcript_id, exons in data.items():
+        for exon_number, positions in exons.items():
+            unique_positions = sorted(set(positions), key=int)
+            positions.sort(key=int)
+            rows.append([transcript_id, exon_number, ','.join(positions), str(len(positions)),
+                         str(len(unique_positions)),
+                         ', '.join([f"{pos}({positions.count(pos)})" for pos in unique_positions])])
+    return rows
+
+
+class TestCollectPositions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.file_paths = []
+        for replicate in range(4):
+            n = 2000
+            table = pd.DataFrame({
+                'transcript_id': [f"AT{t}.1" for t in rng.integers(0, 30, n)],
+                'position': rng.integers(1, 200, n),
+                'exon_number': np.where(rng.random(n) < 0.2, 'UTR', rng.integers(1, 5, n).astype(str))})
+            if replicate == 3:
+                table = table.rename(columns={'position': 'positions'})
+            path = os.path.join(self.tmp_dir.name, f"rep{replicate}.tab")
+            table.to_csv(path, sep='\t', index=False)
+            self.file_paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_output(self, threads):
+        output = os.path.join(self.tmp_dir.name, f"out{threads}.tsv")
+        counter = collect_positions_of_m6a.collect_counts(self.file_paths, threads)
+        collect_positions_of_m6a.write_summary(counter, output)
+        with open(output, newline='') as out_file:
+            return list(csv.reader(out_file, delimiter='\t'))[1:]
+
+
+    def test_matches_legacy(self):
+        """The counted output is the same as the original, in the same order"""
+        expected = legacy_collect(self.file_paths)
+        self.assertEqual(self.read_output(1), expected)
+        self.assertEqual(self.read_output(2), expected)
+
+
+    def test_header_only_files(self):
+        """Files without any positions give a table with just the header"""
+        for file_path in self.file_paths:
+            with open(file_path, 'w') as file:
+                file.write("transcript_id\tposition\texon_number\n")
+        self.assertEqual(legacy_collect(self.file_paths), [])
+        self.assertEqual(self.read_output(1), [])
+        self.assertEqual(self.read_output(2), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
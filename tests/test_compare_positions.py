@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""Tests of the N condition comparison in scripts/compare_positions_between_conditions.py"""
+
+import os
+import sys
+import tempfile
+import unittest
+import importlib.util
+import numpy as np
+import pandas as pd
+
+spec = importlib.util.spec_from_file_location('compare_positions_between_conditions',
+                                              os.path.join('scripts', 'compare_positions_between_conditions.py'))
+compare_positions = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = compare_positions
+spec.loader.exec_module(compare_positions)
+
+
+class TestComparePositions(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_condition(self, name, rng):
+        """A collect_positions_of_m6a.py style file, returning its set of sites."""
+        rows, sites = [], set()
+        for transcript in range(20):
+            for exon_number in ('1', '2', 'UTR'):
+                positions = [str(pos) for pos in rng.integers(1, 60, rng.integers(0, 6))]
+                if positions:
+                    rows.append([f"AT{transcript}.1", exon_number, ','.join(positions)])
+                    sites.update((f"AT{transcript}.1", exon_number, pos) for pos in positions)
+        path = os.path.join(self.tmp_dir.name, name)
+        pd.DataFrame(rows, columns=['transcript_id', 'exon_number', 'positions']).to_csv(path, sep='\t', index=False)
+        return path, sites
+
+
+    def test_membership_patterns(self):
+        """The bitmask of every site says which conditions have it"""
+        rng = np.random.default_rng(0)
+        files, condition_sites = zip(*[self.write_condition(f"cond{i}.tsv", rng) for i in range(3)])
+        membership = compare_positions.compare_conditions([compare_positions.parse_file(f) for f in files])
+
+        all_sites = set().union(*condition_sites)
+        self.assertEqual(len(membership), len(all_sites))
+        for transcript_id, exon_number, position, pattern in membership.itertuples(index=False):
+            site = (transcript_id, exon_number, position)
+            expected = sum(1 << i for i, sites in enumerate(condition_sites) if site in sites)
+            self.assertEqual(pattern, expected)
+
+        names = compare_positions.condition_names(files)
+        counts = compare_positions.pattern_counts(membership, names)
+        self.assertEqual(counts['num_sites'].sum(), len(all_sites))
+        shared = counts.loc[counts['pattern'] == 7, 'num_sites'].sum()
+        self.assertEqual(shared, len(set.intersection(*condition_sites)))
+
+
+    def test_pairwise_table(self):
+        """Two conditions still give the common and unique positions table"""
+        output = os.path.join(self.tmp_dir.name, 'pair.tsv')
+        files = ['tests/test1.sites.summerise', 'tests/test2.sites.summerise']
+        membership = compare_positions.compare_conditions([compare_positions.parse_file(f) for f in files])
+        compare_positions.write_pairwise(membership, files, output)
+        result = pd.read_csv(output, sep='\t', dtype=str, keep_default_na=False).set_index('transcript_id')
+        self.assertEqual(result.loc['UNIQU_FILE1.1', 'unique_positions_test1.sites.summerise'], '833')
+        self.assertEqual(result.loc['UNIQU_FILE1.1', 'unique_positions_test2.sites.summerise'], '0')
+        self.assertEqual(result.loc['AT1G36320.1', 'common_positions'], '1413, 1461')
+        self.assertEqual(result.loc['AT3G62290.1', 'unique_positions_test1.sites.summerise'],
+                         '88888888888888888888888888')
+
+
+    def test_window_matches(self):
+        """Sites within the window on the same transcript match their nearest site"""
+        rng = np.random.default_rng(1)
+        files, condition_sites = zip(*[self.write_condition(f"cond{i}.tsv", rng) for i in range(3)])
+        tables = [compare_positions.parse_file(f) for f in files]
+        names = compare_positions.condition_names(files)
+        window = 3
+
+        def nearest(site, sites):
+            """Brute force nearest site, upstream on ties"""
+            candidates = [(abs(int(pos) - int(site[2])), int(pos), pos) for t, _, pos in sites
+                          if t == site[0] and abs(int(pos) - int(site[2])) <= window]
+            return min(candidates)[2] if candidates else None
+
+        membership = compare_positions.compare_conditions_window(tables, window)
+        self.assertEqual(len(membership), len(set().union(*condition_sites)))
+        for transcript_id, exon_number, position, pattern in membership.itertuples(index=False):
+            site = (transcript_id, exon_number, position)
+            expected = sum(1 << i for i, sites in enumerate(condition_sites) if nearest(site, sites))
+            self.assertEqual(pattern, expected)
+
+        matches = compare_positions.matched_pairs(tables, names, window)
+        pair = matches[(matches['condition_a'] == names[0]) & (matches['condition_b'] == names[2])]
+        expected = {(t, pos, nearest((t, e, pos), condition_sites[2])) for t, e, pos in condition_sites[0]}
+        self.assertEqual(set(pair[['transcript_id', 'position_a', 'position_b']].itertuples(index=False, name=None)),
+                         {match for match in expected if match[2] is not None})
+        self.assertTrue(((pair['position_b'].astype(int) - pair['position_a'].astype(int)) == pair['offset']).all())
+        self.assertLessEqual(matches['offset'].abs().max(), window)
+
+
+    def test_window_rejects_large_positions(self):
+        tables = [compare_positions.parse_file(f) for f in
+                  ['tests/test1.sites.summerise', 'tests/test2.sites.summerise']]
+        with self.assertRaisesRegex(ValueError, "between 0 and 2\\^32 - 1, found '88888888888888888888888888'"):
+            compare_positions.compare_conditions_window(tables, 5)
+        for position in ('-3', '4294967296', '12.5', 'abc'):
+            table = pd.DataFrame({'transcript_id': ['T1.1', 'T1.1'], 'exon_number': ['1', '1'],
+                                  'position': ['7', position]})
+            with self.assertRaisesRegex(ValueError, f"found '{position}'"):
+                compare_positions.compare_conditions_window([table, table.iloc[:1]], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
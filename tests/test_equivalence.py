@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""Tests that the current code paths write the same tables as the original ones"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from interogate.synthetic import write_synthetic_dataset
+from interogate.equivalence import diff_tables, compare_code_paths, compare_benjamini_hochberg
+
+
+class TestEquivalence(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_diff_tables(self):
+        """Floats agree within the tolerance, other changes are reported per cell"""
+        expected = pd.DataFrame({'exon_number': [1, 'UTR', 3], 'p_value': [0.5, np.nan, 1.0]})
+        self.assertEqual(len(diff_tables(expected, expected.assign(p_value=[0.5 + 1e-12, np.nan, 1.0]))), 0)
+        differences = diff_tables(expected, pd.DataFrame({'exon_number': [1, 2, 3], 'p_value': [0.5, 0.1, 1.0]}))
+        self.assertEqual(list(zip(differences['row'], differences['column'])),
+                         [(1, 'exon_number'), (1, 'p_value')])
+        self.assertEqual(len(diff_tables(expected, expected.iloc[:2])), 1)
+
+
+    def test_test_data(self):
+        """The test data gives identical tables and 5' UTR sites"""
+        differences = compare_code_paths('data/test.gtf', 'data/Araport11_genes.201606.cdna.len',
+                                         'data/test.data.site_proba.csv', 0.9, self.tmp_dir.name)
+        self.assertEqual(len(differences), 0, differences.to_string())
+
+
+    def test_synthetic_data(self):
+        """Random synthetic inputs give identical tables and 5' UTR sites"""
+        for seed in (1, 2):
+            dataset = write_synthetic_dataset(os.path.join(self.tmp_dir.name, str(seed)),
+                                              n_transcripts=60, seed=seed)
+            differences = compare_code_paths(dataset['gtf'], dataset['length'], dataset['m6a'][0],
+                                             0.5, self.tmp_dir.name)
+            self.assertEqual(len(differences), 0, differences.to_string())
+
+
+    def test_benjamini_hochberg(self):
+        rng = np.random.default_rng(3)
+        self.assertEqual(len(compare_benjamini_hochberg(np.round(rng.random(1000), 2))), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Tests of annotating several samples together"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+from interogate.parse_trans_len import parse_transcript_lengths
+from interogate.return_dict import transcript_coordinates_from_file
+from interogate.annotate import annotate_sites
+from interogate.parse_m6a_site_proba import read_methylated_sites
+from interogate.multi_sample import read_samples, annotate_unique_sites, sample_matrix, category_totals
+
+
+class TestMultiSample(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        transcript_lengths = parse_transcript_lengths('data/Araport11_genes.201606.cdna.len')
+        cls.transcript_dict, _, cls.gene_exon_counts, _, _ = \
+            transcript_coordinates_from_file('data/test.gtf', transcript_lengths)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        sites = pd.read_csv('data/test.data.site_proba.csv')
+        self.m6a_files = []
+        # two replicates sharing some of their sites
+        for name, subset in (('rep1.csv', sites.iloc[::2]), ('rep2.csv', sites.iloc[1::3])):
+            path = os.path.join(self.tmp_dir.name, name)
+            subset.to_csv(path, index=False)
+            self.m6a_files.append(path)
+        shutil.copy('data/test.data.site_proba.csv', os.path.join(self.tmp_dir.name, 'rep3.csv'))
+        self.m6a_files.append(os.path.join(self.tmp_dir.name, 'rep3.csv'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_matches_per_sample_annotation(self):
+        """Each sample's rows equal annotating that file on its own"""
+        valid = set(self.transcript_dict.keys())
+        long_df = read_samples(self.m6a_files, 0.5, valid)
+        annotated, inverse, _ = annotate_unique_sites(long_df, self.transcript_dict, self.gene_exon_counts)
+        self.assertLess(len(annotated), len(long_df))
+
+        codes = long_df['sample'].cat.codes.to_numpy()
+        for code, m6a_file in enumerate(self.m6a_files):
+            sites = read_methylated_sites(m6a_file, 0.5, valid)
+            expected = annotate_sites(sites, self.transcript_dict, self.gene_exon_counts)
+            result = annotated.iloc[inverse[codes == code]].reset_index(drop=True)
+            pd.testing.assert_frame_equal(result.astype(str), expected.astype(str))
+
+
+    def test_combined_tables(self):
+        """The matrix and totals count every site of every sample"""
+        long_df = read_samples(self.m6a_files, 0.5, set(self.transcript_dict.keys()))
+        annotated, inverse, _ = annotate_unique_sites(long_df, self.transcript_dict, self.gene_exon_counts)
+        all_sites = annotated.iloc[inverse].reset_index(drop=True)
+        all_sites['sample'] = long_df['sample'].to_numpy()
+
+        matrix = sample_matrix(all_sites, self.m6a_files)
+        self.assertEqual(list(matrix.columns), ['transcript_id'] + self.m6a_files)
+        totals = category_totals(all_sites, self.m6a_files)
+        self.assertEqual(list(totals['total_sites']), list(matrix[self.m6a_files].sum()))
+        self.assertEqual(totals['total_sites'].sum(), len(long_df))
+
+
+    def test_no_readable_inputs(self):
+        """Unreadable files give an empty table with the same columns"""
+        missing = [os.path.join(self.tmp_dir.name, name) for name in ('nope.csv', 'alsonope.csv')]
+        long_df = read_samples(missing, 0.5, keep_probability=True)
+        self.assertTrue(long_df.empty)
+        self.assertEqual(list(long_df.columns),
+                         list(read_samples(self.m6a_files[:1], 0.5, keep_probability=True).columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,8 @@
 
 import os
 import unittest
-from interogate.parse_gtf import parse_gff_gft
+from interogate.parse_gtf import parse_gff_gft, iter_gff_gft
+from interogate.return_dict import generate_transcript_coordinates, transcript_coordinates_from_file
 
 class TestParseGFFGFT(unittest.TestCase):
 
@@ -34,5 +35,42 @@ class TestParseGFFGFT(unittest.TestCase):
         example_feature = ('1', 'Araport11', 'gene', 3631, 5899, '.', '+', '.', 'ID=AT1G01010;Name=AT1G01010;Note=NAC domain containing protein 1;symbol=NAC001;full_name=NAC domain containing protein 1;computational_description=NAC domain containing protein 1;locus=2200935;locus_type=protein_coding')
         self.assertIn(example_feature, features, "Example feature is not in the parsed features")
 
+
+    def test_iter_gff_gft_filters_features(self):
+        """The streaming reader yields only the wanted feature types"""
+        wanted = {'CDS', 'three_prime_UTR'}
+        streamed = list(iter_gff_gft(self.file_path, wanted))
+        expected = [(f[0], f[2], f[3], f[4], f[6], f[8]) for f in parse_gff_gft(self.file_path)
+                    if f[2] in wanted]
+        self.assertEqual(streamed, expected)
+
+
+    def test_iter_gff_gft_extractor(self):
+        """The attribute column is replaced by the extractor's result"""
+        streamed = list(iter_gff_gft(self.file_path, {'gene'}, lambda attribute: attribute.split(';')[0]))
+        self.assertIn(('1', 'gene', 3631, 5899, '+', 'ID=AT1G01010'), streamed)
+
+
+    def test_streamed_coordinates_match(self):
+        """Streaming the file gives the same transcript coordinates as the feature list"""
+        from_features = generate_transcript_coordinates(parse_gff_gft(self.file_path), {})
+        from_file = transcript_coordinates_from_file(self.file_path, {})
+        self.assertEqual(dict(from_file[0].items()), dict(from_features[0].items()))
+        for streamed, listed in zip(from_file[1:], from_features[1:]):
+            self.assertEqual(streamed, listed)
+
+
+    def test_restricted_coordinates(self):
+        """Restricting to some transcripts keeps their models and their genes' exon counts"""
+        full = transcript_coordinates_from_file(self.file_path, {})
+        wanted = set(list(full[0].keys())[:3]) | {'NOT_IN_THE_GTF.1'}
+        restricted = transcript_coordinates_from_file(self.file_path, {}, wanted)
+        self.assertEqual(set(restricted[0].keys()), wanted & set(full[0].keys()))
+        for transcript_id in restricted[0]:
+            self.assertEqual(restricted[0][transcript_id], full[0][transcript_id])
+            self.assertEqual(restricted[4][transcript_id], full[4][transcript_id])
+        for gene, count in restricted[2].items():
+            self.assertEqual(count, full[2][gene])
+
 if __name__ == '__main__':
     unittest.main()
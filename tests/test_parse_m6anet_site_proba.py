@@ -7,7 +7,8 @@ import unittest
 import pandas as pd
 import tempfile
 import os
-from interogate.parse_m6a_site_proba import identify_methylated_sites
+import numpy as np
+from interogate.parse_m6a_site_proba import identify_methylated_sites, read_methylated_sites
 
 
 # 3 exon 1, last exon and UTR
@@ -67,5 +68,54 @@ AT1G01090.1,1700,290,0.9626547265052795,AAACT,0.9455555555555556"""
 
         pd.testing.assert_frame_equal(result.reset_index(drop=True), expected_result)
 
+    def test_chunked_reader_matches(self):
+        """Small chunks and both engines give the same sites"""
+        expected = identify_methylated_sites(self.temp_file.name, 0.9).reset_index(drop=True)
+        engines = ['c']
+        try:
+            import pyarrow.csv
+            engines.append('pyarrow')
+        except ImportError:
+            pass
+        for engine in engines:
+            result = read_methylated_sites(self.temp_file.name, 0.9, chunksize=3, engine=engine)
+            self.assertEqual(result['transcript_id'].dtype, 'category')
+            self.assertEqual(result['transcript_position'].dtype, np.int32)
+            self.assertEqual(result['transcript_id'].astype(str).tolist(), expected['transcript_id'].tolist())
+            self.assertEqual(result['transcript_position'].tolist(), expected['transcript_position'].tolist())
+
+    def test_engines_agree_at_threshold(self):
+        """Probabilities are parsed to the same float whatever the engine"""
+        # the default C parser reads this 1 ulp low, on the threshold
+        probability = '0.91417776317066907'
+        threshold = np.nextafter(float(probability), 0)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write(f"transcript_id,transcript_position,probability_modified\nT1.1,5,{probability}\n")
+        self.addCleanup(os.remove, csv_file.name)
+        engines = ['c']
+        try:
+            import pyarrow.csv
+            engines.append('pyarrow')
+        except ImportError:
+            pass
+        for engine in engines:
+            result = read_methylated_sites(csv_file.name, threshold, engine=engine, keep_probability=True)
+            self.assertEqual(result['probability_modified'].tolist(), [float(probability)])
+
+    def test_valid_transcript_filter(self):
+        """Sites on transcripts outside valid_transcripts are dropped while reading"""
+        chunks = read_methylated_sites(self.temp_file.name, 0.9, valid_transcripts={'AT1G01090.1'},
+                                       chunksize=5, engine='c', iterator=True)
+        result = pd.concat([chunk.astype({'transcript_id': str}) for chunk in chunks])
+        self.assertEqual(result['transcript_id'].unique().tolist(), ['AT1G01090.1'])
+        self.assertEqual(result['transcript_position'].tolist(), [1600, 1700])
+
+    def test_missing_columns(self):
+        """Files without the required columns raise a ValueError"""
+        with open(self.temp_file.name, 'w') as handle:
+            handle.write("transcript_id,position\nA.1,5\n")
+        with self.assertRaises(ValueError):
+            read_methylated_sites(self.temp_file.name, 0.9)
+
 if __name__ == '__main__':
     unittest.main()
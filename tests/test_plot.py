@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""Tests of the binned distribution plot"""
+
+import os
+import logging
+import tempfile
+import unittest
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+from interogate.parse_trans_len import parse_transcript_lengths
+from interogate.site_categories import bin_sites
+from interogate.plot import plot_binned_distribution, normalise_position, PlotWorker
+
+
+class TestPlot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        results_df = pd.read_csv('data/test.data.site_proba_exon_annotated.tab', sep='\t')
+        transcript_lengths = parse_transcript_lengths('data/Araport11_genes.201606.cdna.len')
+        self.binned = bin_sites(results_df, transcript_lengths, {})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_plot_worker(self):
+        """Plots are written in the background and failures are logged"""
+        output_file = os.path.join(self.tmp_dir.name, 'plot.pdf')
+        bad_file = os.path.join(self.tmp_dir.name, 'missing', 'plot.pdf')
+        with self.assertLogs('test_plot', level='ERROR') as logs:
+            with PlotWorker(logging.getLogger('test_plot')) as plotter:
+                plotter.submit(plot_binned_distribution, self.binned, output_file)
+                plotter.submit(plot_binned_distribution, self.binned, bad_file)
+        self.assertTrue(os.path.getsize(output_file) > 0)
+        self.assertEqual(len(logs.output), 1)
+
+
+    def test_normalise_position(self):
+        """The row version gives the same positions as site_categories.normalise_positions"""
+        lengths = {'T1.1': 200, 'T2.1': 200, 'T3.1': 0}
+        strands = {'T1.1': '+', 'T2.1': '-'}
+        for transcript_id, expected in (('T1.1', 0.25), ('T2.1', 0.755), ('T3.1', 0.0), ('T4.1', 0.0)):
+            row = pd.Series({'transcript_id': transcript_id, 'position': 50})
+            self.assertAlmostEqual(normalise_position(row, lengths, strands), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
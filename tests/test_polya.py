@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""Tests of the poly(A) tail detection and sharded BAM scan in interogate/polya.py"""
+
+import os
+import re
+import random
+import tempfile
+import unittest
+import importlib.util
+from interogate.polya import (POLYA_COLUMNS, bam_regions, shard_regions, merge_shards,
+                              scan_bam_files, find_polyA_tail, tail_reference_position)
+
+HAVE_PYSAM = importlib.util.find_spec('pysam') is not None
+
+
+class TestPolyA(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_regions_cover_references(self):
+        """Long references are chunked, references without reads are left out"""
+        regions = bam_regions(['chr1', 'chr2', 'AT1G01010.1'], [12, 5, 3],
+                              {'chr1': 6, 'AT1G01010.1': 1}, chunk_size=5)
+        self.assertEqual([region[:3] for region in regions],
+                         [('chr1', 0, 5), ('chr1', 5, 10), ('chr1', 10, 12), ('AT1G01010.1', 0, 3)])
+        self.assertAlmostEqual(sum(region[3] for region in regions), 7)
+
+
+    def test_shards_keep_order(self):
+        regions = bam_regions([f"T{i}" for i in range(10)], [100] * 10, {f"T{i}": i + 1 for i in range(10)})
+        for n_shards in (1, 3, 20):
+            shards = shard_regions(regions, n_shards)
+            self.assertLessEqual(len(shards), n_shards)
+            self.assertEqual([region for shard in shards for region in shard],
+                             [region[:3] for region in regions])
+        self.assertEqual(shard_regions([], 4), [])
+
+
+    def test_merge_shards(self):
+        paths = []
+        for number, rows in enumerate(["r1\tT1\t5\t5\t12\tACGT\n", "", "r2\tT2\t9\t9\t10\t\n"]):
+            paths.append(os.path.join(self.tmp_dir.name, f"shard{number}.tsv"))
+            with open(paths[-1], 'w') as shard:
+                shard.write(rows)
+        output = os.path.join(self.tmp_dir.name, 'merged.tsv')
+        merge_shards(paths, output, POLYA_COLUMNS)
+        with open(output) as merged:
+            lines = merged.read().splitlines()
+        self.assertEqual(lines[0].split('\t'), POLYA_COLUMNS)
+        self.assertEqual([line.split('\t')[0] for line in lines[1:]], ['r1', 'r2'])
+
+
+    def test_tail_matches_regex(self):
+        """Without mismatches the tail is the terminal run the regex found"""
+        rng = random.Random(0)
+        for _ in range(5000):
+            seq = ''.join(rng.choice('ACGT') for _ in range(rng.randint(0, 40))) + 'A' * rng.choice([0, 5, 9, 10, 25])
+            if rng.random() < 0.2:
+                seq += rng.choice('CGT')
+            match = re.search(r'(A{10,})$', seq)
+            expected = (match.start(), len(match.group(0))) if match else None
+            self.assertEqual(find_polyA_tail(seq), expected)
+
+
+    def test_tail_options(self):
+        self.assertEqual(find_polyA_tail('GCGC' + 'A' * 6, min_length=5), (4, 6))
+        self.assertIsNone(find_polyA_tail('GCGC' + 'A' * 6))
+        # single errors between A are allowed, runs of them end the tail
+        self.assertEqual(find_polyA_tail('CCAAAAGAAAAAA', max_mismatches=1), (2, 11))
+        self.assertIsNone(find_polyA_tail('CCAAAAGGAAAAAA', max_mismatches=2))
+        self.assertIsNone(find_polyA_tail('CAAAAGAAAAGAAAA', max_mismatches=1))
+        self.assertEqual(find_polyA_tail('CAAAAGAAAAGAAAA', max_mismatches=2), (1, 14))
+
+
+    def test_tail_reference_position(self):
+        """The tail is placed through the CIGAR, not at reference_start plus its read index"""
+        # 5S 10M 2I 5M 3D 20S starting at 100, the tail is the 3' soft clip
+        cigar = [(4, 5), (0, 10), (1, 2), (0, 5), (2, 3), (4, 20)]
+        self.assertEqual(tail_reference_position(cigar, 118, 42, 22), 118)
+        # part of the tail aligned in the last match block
+        self.assertEqual(tail_reference_position(cigar, 118, 42, 19), 112)
+        # in the insertion, after the base before it
+        self.assertEqual(tail_reference_position(cigar, 118, 42, 16), 110)
+        self.assertEqual(tail_reference_position(cigar, 118, 42, 7), 102)
+        # hard clips are not in the read sequence
+        self.assertEqual(tail_reference_position([(5, 7), (0, 10), (4, 20), (5, 3)], 110, 30, 10), 110)
+
+
+    @unittest.skipUnless(HAVE_PYSAM, "pysam is not installed")
+    def test_threads_match_single_pass(self):
+        """The merged shards are the same whatever the number of processes"""
+        import pysam
+
+        fasta_path = os.path.join(self.tmp_dir.name, 'ref.fa')
+        with open(fasta_path, 'w') as fasta:
+            for name in ('T1', 'T2', 'T3'):
+                fasta.write(f">{name}\n{'ACGT' * 50}\n")
+        pysam.faidx(fasta_path)
+        header = {'HD': {'VN': '1.6', 'SO': 'coordinate'},
+                  'SQ': [{'SN': name, 'LN': 200} for name in ('T1', 'T2', 'T3')]}
+        bam_path = os.path.join(self.tmp_dir.name, 'reads.bam')
+        with pysam.AlignmentFile(bam_path, 'wb', header=header) as bam:
+            for number, (reference, start) in enumerate([(0, 5), (0, 40), (0, 90), (2, 10), (2, 60)]):
+                read = pysam.AlignedSegment(bam.header)
+                read.query_name = f"read{number}"
+                read.query_sequence = 'ACGT' * 5 + 'A' * (10 + number)
+                read.reference_id = reference
+                read.reference_start = start
+                read.cigartuples = [(0, 20), (4, 10 + number)]
+                read.mapping_quality = 60
+                bam.write(read)
+        pysam.index(bam_path)
+
+        merged = []
+        for threads, chunk_size in ((1, 1000), (2, 50)):
+            shard_dir = os.path.join(self.tmp_dir.name, f"shards{threads}")
+            os.mkdir(shard_dir)
+            (shard_paths, n_sites), = scan_bam_files([bam_path], fasta_path, shard_dir, threads,
+                                                     chunk_size=chunk_size)
+            self.assertEqual(n_sites, 5)
+            with open(shard_paths[0]) as shard:
+                # the soft clipped tail starts just after the 20 aligned bases
+                self.assertEqual(shard.readline().split('\t')[2], '25')
+            output = os.path.join(self.tmp_dir.name, f"merged{threads}.tsv")
+            merge_shards(shard_paths, output, POLYA_COLUMNS)
+            with open(output) as out_file:
+                merged.append(out_file.read())
+        self.assertEqual(merged[0], merged[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
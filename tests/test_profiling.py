@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Tests of the stage profiler used by --profile"""
+
+import os
+import json
+import tempfile
+import unittest
+from interogate.profiling import StageProfiler
+
+
+class TestStageProfiler(unittest.TestCase):
+
+    def test_disabled_records_nothing(self):
+        """A disabled profiler keeps no records"""
+        profiler = StageProfiler()
+        with profiler.stage("annotate", "a.csv") as record:
+            record['rows'] = 10
+        self.assertEqual(profiler.records, [])
+
+
+    def test_stage_record(self):
+        """Each stage records time, memory and rows, and is written as JSON"""
+        profiler = StageProfiler(enabled=True, trace_memory=True)
+        with profiler.stage("annotate", "a.csv", 0.9) as record:
+            data = list(range(10000))
+            record['rows'] = len(data)
+        record = profiler.records[0]
+        self.assertEqual((record['stage'], record['file'], record['threshold'], record['rows']),
+                         ("annotate", "a.csv", 0.9, 10000))
+        for key in ('wall_s', 'cpu_s', 'tracemalloc_peak_mb'):
+            self.assertGreaterEqual(record[key], 0)
+        self.assertGreater(record['tracemalloc_peak_mb'], 0)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_file = os.path.join(tmp_dir, 'profile.json')
+            profiler.write(out_file, {'command': 'test'})
+            with open(out_file) as handle:
+                report = json.load(handle)
+        self.assertEqual(report['command'], 'test')
+        self.assertEqual(len(report['stages']), 1)
+
+
+    def test_background_stage(self):
+        """A stage in another thread does not disturb the memory tracing or cProfile of the main one"""
+        import threading
+
+        def plot():
+            with profiler.stage("plot", "a.csv", background=True):
+                sorted(range(1000))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profiler = StageProfiler(enabled=True, trace_memory=True, cprofile_stages=['summarise', 'plot'],
+                                     cprofile_prefix=os.path.join(tmp_dir, "run"))
+            with profiler.stage("summarise", "a.csv") as record:
+                data = list(range(100000))
+                thread = threading.Thread(target=plot)
+                thread.start()
+                thread.join()
+                record['rows'] = len(data)
+        plot, summarise = profiler.records
+        self.assertEqual((plot['stage'], summarise['stage']), ("plot", "summarise"))
+        self.assertGreaterEqual(plot['wall_s'], 0)
+        for key in ('cpu_s', 'tracemalloc_peak_mb', 'peak_rss_mb'):
+            self.assertNotIn(key, plot)
+        self.assertGreater(summarise['tracemalloc_peak_mb'], 1)
+        # only the foreground stage ran under cProfile
+        self.assertNotIn('cprofile', plot)
+        self.assertIn('cprofile', summarise)
+
+
+    def test_cprofile_stage(self):
+        """Selected stages are dumped as cProfile stats"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            profiler = StageProfiler(enabled=True, cprofile_stages=['plot'],
+                                     cprofile_prefix=os.path.join(tmp_dir, 'profile'))
+            with profiler.stage("plot", "a.csv"):
+                sorted(range(1000), reverse=True)
+            with profiler.stage("annotate", "a.csv"):
+                pass
+            self.assertTrue(os.path.isfile(profiler.records[0]['cprofile']))
+            self.assertNotIn('cprofile', profiler.records[1])
+            self.assertEqual(profiler.pop_records()[0]['stage'], 'plot')
+            self.assertEqual(profiler.records, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
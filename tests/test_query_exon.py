@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Tests that the binary search exon lookup matches the original linear scan"""
+
+import re
+import unittest
+from collections import defaultdict
+from interogate.parse_gtf import parse_gff_gft
+from interogate import return_dict
+from interogate import find_exon
+from interogate.parse_trans_len import parse_transcript_lengths
+
+
+def legacy_cds_coordinates(features):
+    """Original per nucleotide list expansion of CDS features (return_dict)."""
+    transcript_dict = defaultdict(lambda: defaultdict(list))
+    nucleotide_counter = defaultdict(int)
+    for seqname, source, feature_type, start, end, score, strand, frame, attribute in features:
+        if feature_type in ['CDS', 'three_prime_UTR']:
+            transcript_id = None
+            exon_number = None
+            for attr in attribute.split(';'):
+                if 'Parent' in attr:
+                    transcript_id = attr.split('=')[1].strip() if '=' in attr else attr.split()[1].strip().strip('"')
+                if 'ID' in attr:
+                    exon_match = re.search(r'CDS:(\d+)', attr)
+                    if exon_match:
+                        exon_number = int(exon_match.group(1))
+            if transcript_id and exon_number:
+                exon_positions = []
+                for pos in range(start, end + 1):
+                    nucleotide_counter[transcript_id] += 1
+                    exon_positions.append(nucleotide_counter[transcript_id])
+                transcript_dict[transcript_id][exon_number] = exon_positions
+    return transcript_dict
+
+
+def legacy_exon_coordinates(features):
+    """Original per nucleotide list expansion of exon features (find_exon)."""
+    transcript_dict = defaultdict(lambda: defaultdict(list))
+    counters = defaultdict(int)
+    exon_counters = defaultdict(int)
+    for seqname, source, feature_type, start, end, score, strand, frame, attribute in features:
+        if feature_type == 'exon':
+            transcript_id = None
+            for attr in attribute.split(';'):
+                if 'Parent' in attr:
+                    transcript_id = attr.split('=')[1].strip()
+                    break
+            if transcript_id:
+                exon_counters[transcript_id] += 1
+                for pos in range(start, end + 1):
+                    transcript_dict[transcript_id][exon_counters[transcript_id]].append(counters[transcript_id] + 1)
+                    counters[transcript_id] += 1
+    return transcript_dict
+
+
+def legacy_query_transcript_exon(transcript_dict, transcript_id, position):
+    """Original linear scan lookup."""
+    if transcript_id in transcript_dict:
+        for exon_number, coordinates in transcript_dict[transcript_id].items():
+            if position in coordinates:
+                total_exons = len(transcript_dict[transcript_id])
+                return exon_number, total_exons
+    return None, None
+
+
+class TestQueryTranscriptExon(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.features = parse_gff_gft('data/test.gtf')
+        transcript_lengths = parse_transcript_lengths('data/Araport11_genes.201606.cdna.len')
+        cls.transcript_dict, _, _, cls.last_exon_for_transcript, _ = \
+            return_dict.generate_transcript_coordinates(cls.features, transcript_lengths)
+
+
+    def assert_same_answers(self, model, legacy, query):
+        for transcript_id, exons in legacy.items():
+            end = max(max(coords) for coords in exons.values() if coords)
+            for position in range(-1, end + 20):
+                self.assertEqual(query(model, transcript_id, position),
+                                 legacy_query_transcript_exon(legacy, transcript_id, position),
+                                 f"{transcript_id} position {position}")
+
+
+    def test_return_dict_matches_legacy(self):
+        """Every position of every CDS transcript in data/test.gtf"""
+        legacy = legacy_cds_coordinates(self.features)
+        self.assert_same_answers(self.transcript_dict, legacy, return_dict.query_transcript_exon)
+
+
+    def test_find_exon_matches_legacy(self):
+        """Every position of every exon transcript in data/test.gtf"""
+        legacy = legacy_exon_coordinates(self.features)
+        model = find_exon.generate_transcript_coordinates(self.features)
+        self.assert_same_answers(model, legacy, find_exon.query_transcript_exon)
+
+
+    def test_query_last_exon_flag(self):
+        """The last exon flag agrees with last_exon_for_transcript"""
+        for transcript_id, exons in self.transcript_dict.items():
+            for exon_number, coordinates in exons.items():
+                for position in (coordinates.start, coordinates.stop - 1):
+                    found, total, is_last = self.transcript_dict.query(transcript_id, position)
+                    self.assertEqual(found, exon_number)
+                    self.assertEqual(is_last, exon_number == self.last_exon_for_transcript[transcript_id])
+
+
+    def test_query_unknown(self):
+        """Unknown transcripts and positions outside exons return None"""
+        self.assertEqual(self.transcript_dict.query("NOT_A_TRANSCRIPT.1", 5), (None, None, False))
+        self.assertEqual(self.transcript_dict.query("TEST_1_3_UTR.1", 50), (None, None, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
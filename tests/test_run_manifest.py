@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""Tests of the run manifest used to skip unchanged m6a files"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from interogate import run_manifest
+import interogate_m6anet
+
+
+class TestRunManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.m6a_file = os.path.join(self.tmp_dir.name, 'data.site_proba.csv')
+        shutil.copy('data/test.data.site_proba.csv', self.m6a_file)
+        self.output = os.path.join(self.tmp_dir.name, 'data.site_proba_exon_annotated.tab')
+        with open(self.output, 'w') as out_file:
+            out_file.write('done\n')
+        self.parameters = {'thresholds': [0.9], 'plot': True}
+        self.version = run_manifest.code_version()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def up_to_date(self, annotation='gtf1', parameters=None):
+        return run_manifest.is_up_to_date(self.m6a_file, annotation, parameters or self.parameters,
+                                          self.version)
+
+
+    def test_skip_only_when_unchanged(self):
+        """A recorded file is up to date until its input, annotation, parameters or outputs change"""
+        self.assertFalse(self.up_to_date())
+        run_manifest.record_outputs(self.m6a_file, [self.output], 'gtf1', self.parameters, self.version)
+        self.assertTrue(os.path.exists(run_manifest.manifest_path(self.m6a_file)))
+        self.assertTrue(self.up_to_date())
+
+        self.assertFalse(self.up_to_date(annotation='gtf2'))
+        self.assertFalse(self.up_to_date(parameters={'thresholds': [0.8], 'plot': True}))
+
+        os.utime(self.m6a_file, ns=(0, 0))  # touched but the same content
+        self.assertTrue(self.up_to_date())
+
+        with open(self.m6a_file, 'a') as out_file:
+            out_file.write('AT1G01100.2,600,10,0.99,0.1,1\n')
+        self.assertFalse(self.up_to_date())
+
+
+    def test_missing_output(self):
+        """A removed output makes the file out of date"""
+        run_manifest.record_outputs(self.m6a_file, [self.output], 'gtf1', self.parameters, self.version)
+        os.remove(self.output)
+        self.assertFalse(self.up_to_date())
+
+
+    def test_unreadable_manifest(self):
+        """A corrupt manifest is treated as empty"""
+        with open(run_manifest.manifest_path(self.m6a_file), 'w') as out_file:
+            out_file.write('{not json')
+        self.assertFalse(self.up_to_date())
+        run_manifest.record_outputs(self.m6a_file, [self.output], 'gtf1', self.parameters, self.version)
+        self.assertTrue(self.up_to_date())
+
+
+    def test_failed_plot_is_recorded(self):
+        """A plot missing next to its table is still recorded, so the file is redone"""
+        outputs = interogate_m6anet.recorded_outputs(self.m6a_file, [0.9])
+        self.assertIn(self.output, outputs)
+        plot = os.path.join(self.tmp_dir.name, 'data.site_proba_m6a_distribution.pdf')
+        self.assertIn(plot, outputs)
+        self.assertNotIn(plot, interogate_m6anet.recorded_outputs(self.m6a_file, [0.9], plot=False))
+        # a missing summary (not written) is left out
+        self.assertFalse(any(output.endswith('summary_per_transcript.tab') for output in outputs))
+
+        run_manifest.record_outputs(self.m6a_file, outputs, 'gtf1', self.parameters, self.version)
+        self.assertFalse(self.up_to_date())
+
+
+    def test_combined_outputs(self):
+        """The combined tables are named like process_m6a_files_combined writes them"""
+        self.assertEqual(interogate_m6anet.combined_outputs('all', [0.9]),
+                         ['all_sample_matrix.tab', 'all_category_totals.tab'])
+        self.assertEqual(interogate_m6anet.combined_outputs('all', [0.9, 0.5], 'parquet'),
+                         ['all_t0.5_sample_matrix.parquet', 'all_t0.5_category_totals.parquet',
+                          'all_t0.9_sample_matrix.parquet', 'all_t0.9_category_totals.parquet'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""Tests of the vectorised site categories and normalised positions"""
+
+import unittest
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from interogate.site_categories import category_counts, assign_categories, normalise_positions, bin_sites
+
+
+def legacy_normalise_position(row, transcript_lengths, transcript_strands):
+    """The row at a time version from interogate.plot."""
+    transcript_id = row['transcript_id']
+    if transcript_id in transcript_lengths:
+        length = transcript_lengths[transcript_id]
+        strand = transcript_strands.get(transcript_id, '+')
+        if length != 0:
+            if strand == '+':
+                return row['position'] / length
+            return (length - row['position'] + 1) / length
+    return 0
+
+
+class TestSiteCategories(unittest.TestCase):
+
+    def setUp(self):
+        self.results_df = pd.read_csv('data/test.data.site_proba_exon_annotated.tab', sep='\t')
+        rng = np.random.default_rng(4)
+        transcript_ids = [f"T{i}.1" for i in range(50)]
+        self.transcript_lengths = defaultdict(int, {t: int(rng.integers(0, 3000)) for t in transcript_ids[:40]})
+        self.transcript_strands = defaultdict(str, {t: rng.choice(['+', '-']) for t in transcript_ids[:45]})
+        self.sites = pd.DataFrame({'transcript_id': rng.choice(transcript_ids, size=2000),
+                                   'position': rng.integers(1, 3000, size=2000)})
+
+
+    def test_normalise_positions(self):
+        """The vectorised positions equal the row at a time ones"""
+        expected = self.sites.apply(legacy_normalise_position, axis=1,
+                                    transcript_lengths=self.transcript_lengths,
+                                    transcript_strands=self.transcript_strands)
+        result = normalise_positions(self.sites['transcript_id'].to_numpy(), self.sites['position'].to_numpy(),
+                                     self.transcript_lengths, self.transcript_strands)
+        np.testing.assert_allclose(result, expected.to_numpy(dtype=float))
+
+
+    def test_categories(self):
+        """Categories and counts agree with the row wise rules"""
+        expected = self.results_df.apply(
+            lambda row: 'last_exon' if row['is_last_exon'] else ('UTR' if row['exon_number'] == 'UTR' else 'non_last_exon'), axis=1)
+        self.assertEqual(list(assign_categories(self.results_df)), list(expected))
+        self.assertEqual(category_counts(self.results_df), {'non_last_exon': 2, 'last_exon': 4, 'UTR': 4})
+
+
+    def test_bin_sites(self):
+        """The histograms hold every site of their category"""
+        binned = bin_sites(self.results_df, self.transcript_lengths, self.transcript_strands, bins=10)
+        self.assertEqual(len(binned['bin_edges']), 11)
+        for category, count in binned['counts'].items():
+            self.assertEqual(binned['histograms'][category].sum(), count)
+            self.assertEqual(binned['out_of_range'][category], 0)
+            self.assertEqual(category in binned['quantiles'], count > 0)
+
+
+    def test_bin_sites_out_of_range(self):
+        """A site past the end of its transcript is counted, not put in the last bin"""
+        sites = pd.DataFrame({'transcript_id': ['T1.1', 'T1.1', 'T1.1'], 'position': [10, 50, 150],
+                              'exon_number': [1, 1, 1], 'is_last_exon': [True, True, True]})
+        binned = bin_sites(sites, {'T1.1': 100}, {'T1.1': '+'}, bins=10)
+        self.assertEqual(binned['counts']['last_exon'], 3)
+        self.assertEqual(binned['out_of_range'], {'non_last_exon': 0, 'last_exon': 1, 'UTR': 0})
+        histogram = binned['histograms']['last_exon']
+        self.assertEqual(histogram.sum(), 2)
+        self.assertEqual(histogram[-1], 0)
+        self.assertEqual(binned['quantiles']['last_exon'][-1], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""Tests of the vectorised per transcript summary"""
+
+import os
+import logging
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2_contingency
+from interogate.summary_stats import benjamini_hochberg, chi2_2x2, summarise_methylation_sites
+
+
+def legacy_benjamini_hochberg(p_values):
+    """The loop implementation the vectorised one replaced."""
+    p_values = np.array(p_values)
+    n = len(p_values)
+    sorted_indices = np.argsort(p_values)
+    sorted_p_values = p_values[sorted_indices]
+    adjusted_p_values = np.zeros(n)
+    cummin = sorted_p_values[-1]
+    adjusted_p_values[sorted_indices[-1]] = cummin
+    for i in range(n-2, -1, -1):
+        cummin = min(cummin, sorted_p_values[i] * n / (i + 1))
+        adjusted_p_values[sorted_indices[i]] = cummin
+    return adjusted_p_values
+
+
+class TestSummaryStats(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_summary_stats')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.tmp_dir.name, 'summary.tab')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_benjamini_hochberg(self):
+        """The cumulative minimum gives the same adjusted p-values as the loop"""
+        rng = np.random.default_rng(1)
+        p_values = np.round(rng.random(500), 2)  # rounded so there are ties
+        np.testing.assert_allclose(benjamini_hochberg(p_values),
+                                   legacy_benjamini_hochberg(p_values))
+        self.assertEqual(len(benjamini_hochberg([])), 0)
+
+
+    def test_chi2_matches_scipy(self):
+        """The closed form statistics and p-values agree with chi2_contingency"""
+        rng = np.random.default_rng(2)
+        tables = rng.integers(1, 50, size=(200, 2, 2))
+        chi2, p_values = chi2_2x2(tables)
+        for table, stat, p in zip(tables, chi2, p_values):
+            expected_stat, expected_p, _, _ = chi2_contingency(table)
+            self.assertAlmostEqual(stat, expected_stat)
+            self.assertAlmostEqual(p, expected_p)
+
+
+    def test_summary_matches_expected_output(self):
+        """Summarising the stored annotation reproduces the stored summary"""
+        results_df = pd.read_csv('data/test.data.site_proba_exon_annotated.tab', sep='\t')
+        summarise_methylation_sites(results_df, self.output_file, self.logger)
+        result = pd.read_csv(self.output_file, sep='\t')
+        expected = pd.read_csv('data/test.data.site_proba_summary_per_transcript.tab', sep='\t')
+        pd.testing.assert_frame_equal(result, expected)
+
+
+    def test_summary_counts(self):
+        """Counts, ratios and tests of a larger random table are consistent"""
+        rng = np.random.default_rng(3)
+        n = 5000
+        exon_number = rng.integers(1, 6, size=n).astype(object)
+        exon_number[rng.random(n) < 0.2] = 'UTR'
+        results_df = pd.DataFrame({
+            'transcript_id': rng.choice([f"T{i}.1" for i in range(300)], size=n),
+            'exon_number': exon_number,
+            'is_last_exon': (exon_number != 'UTR') & (rng.random(n) < 0.5),
+        })
+        summarise_methylation_sites(results_df, self.output_file, self.logger)
+        summary = pd.read_csv(self.output_file, sep='\t')
+
+        self.assertEqual(summary['total_sites'].sum(), n)
+        self.assertTrue((summary['non_last_exon_sites'] + summary['last_exon_and_utr_sites']
+                         == summary['total_sites']).all())
+        row = summary.iloc[0]
+        sites = results_df[results_df['transcript_id'] == row['transcript_id']]
+        self.assertEqual(row['utr_sites'], (sites['exon_number'] == 'UTR').sum())
+        self.assertEqual(row['last_exon_sites'], sites['is_last_exon'].sum())
+        tested = summary['p_value'].notna()
+        np.testing.assert_allclose(summary.loc[tested, 'adjusted_p_value'],
+                                   legacy_benjamini_hochberg(summary.loc[tested, 'p_value']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""Tests of the synthetic benchmark inputs"""
+
+import tempfile
+import unittest
+from interogate.synthetic import write_synthetic_dataset
+from interogate.parse_trans_len import parse_transcript_lengths
+from interogate.return_dict import transcript_coordinates_from_file
+from interogate.parse_m6a_site_proba import read_methylated_sites
+from interogate.annotate import annotate_sites
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dataset = write_synthetic_dataset(self.tmp_dir.name, n_transcripts=200,
+                                               site_density=0.02, n_samples=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_annotation_parses(self):
+        """Every synthetic transcript is modelled with its length"""
+        transcript_lengths = parse_transcript_lengths(self.dataset['length'])
+        transcript_dict, _, gene_exon_counts, _, strands = \
+            transcript_coordinates_from_file(self.dataset['gtf'], transcript_lengths)
+        self.assertEqual(len(transcript_dict), 200)
+        self.assertEqual(len(gene_exon_counts), 100)
+        self.assertEqual(set(strands.values()), {'+', '-'})
+
+
+    def test_sites_annotate(self):
+        """The sites fall in exons and both UTRs"""
+        transcript_lengths = parse_transcript_lengths(self.dataset['length'])
+        transcript_dict, _, gene_exon_counts, _, _ = \
+            transcript_coordinates_from_file(self.dataset['gtf'], transcript_lengths)
+        sites = read_methylated_sites(self.dataset['m6a'][0], 0.0, set(transcript_dict.keys()))
+        results_df = annotate_sites(sites, transcript_dict, gene_exon_counts)
+        self.assertGreater(len(results_df), 0)
+        self.assertIn('UTR', set(results_df['exon_number']))
+        self.assertGreater((results_df['exon_number'] != 'UTR').sum(), 0)
+
+
+    def test_indiv_proba(self):
+        """The per read files have several reads per site and read the same with either engine"""
+        dataset = write_synthetic_dataset(self.tmp_dir.name, n_transcripts=50, site_density=0.02,
+                                          indiv_reads=4)
+        self.assertEqual(self.dataset['indiv'], [])
+        self.assertEqual(len(dataset['indiv']), 1)
+        all_reads = read_methylated_sites(dataset['indiv'][0], 0.0, chunksize=100)
+        sites = read_methylated_sites(dataset['m6a'][0], 0.0)
+        self.assertEqual(len(all_reads), 4 * len(sites))
+        chunked = read_methylated_sites(dataset['indiv'][0], 0.9, chunksize=100, engine='c')
+        whole = read_methylated_sites(dataset['indiv'][0], 0.9, engine='pyarrow')
+        self.assertEqual(chunked['transcript_position'].tolist(), whole['transcript_position'].tolist())
+        self.assertEqual(chunked['transcript_id'].astype(str).tolist(), whole['transcript_id'].astype(str).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""Tests of the table writers and readers"""
+
+import os
+import csv
+import tempfile
+import unittest
+import importlib.util
+import pandas as pd
+from interogate.table_io import OUTPUT_FORMATS, output_path, write_table, read_table, iter_table_rows
+
+
+class TestTableIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tab_file = 'data/test.data.site_proba_exon_annotated.tab'
+        self.results_df = pd.read_csv(self.tab_file, sep='\t')
+        with open(self.tab_file) as in_file:
+            self.expected_rows = list(csv.DictReader(in_file, delimiter='\t'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_output_path(self):
+        """TSV keeps its name, the other formats change the suffix"""
+        self.assertEqual(output_path('a_exon_annotated.tab'), 'a_exon_annotated.tab')
+        self.assertEqual(output_path('a_exon_annotated.tab', 'tsv.gz'), 'a_exon_annotated.tab.gz')
+        self.assertEqual(output_path('a_exon_annotated.tab', 'parquet'), 'a_exon_annotated.parquet')
+        self.assertEqual(output_path('a.tab.overall.summary', 'feather'), 'a.overall.summary.feather')
+        self.assertEqual(output_path('data.v2/s.1_summary_per_transcript.tab.overall.summary', 'parquet'),
+                         'data.v2/s.1_summary_per_transcript.overall.summary.parquet')
+        self.assertEqual(output_path('a.tab.overall.summary', 'tsv.gz'), 'a.tab.overall.summary.gz')
+        with self.assertRaises(ValueError):
+            output_path('a.tab', 'xlsx')
+
+
+    def test_round_trip(self):
+        """Every format reads back to the same rows the TSV gives"""
+        formats = [f for f in OUTPUT_FORMATS
+                   if f != 'tsv.zst' or importlib.util.find_spec('zstandard')]
+        for output_format in formats:
+            with self.subTest(output_format=output_format):
+                path = write_table(self.results_df, os.path.join(self.tmp_dir.name, 'sites.tab'),
+                                   output_format)
+                self.assertEqual(len(read_table(path)), len(self.results_df))
+                rows = list(iter_table_rows(path))
+                for column in ('transcript_id', 'position', 'exon_number', 'is_last_exon'):
+                    self.assertEqual([row[column] for row in rows],
+                                     [row[column] for row in self.expected_rows])
+
+
+    def test_stable_schema(self):
+        """exon_number is a string column in Parquet even without any UTR site"""
+        no_utr = self.results_df[self.results_df['exon_number'] != 'UTR'].copy()
+        no_utr['exon_number'] = no_utr['exon_number'].astype(int)
+        path = write_table(no_utr, os.path.join(self.tmp_dir.name, 'sites.tab'), 'parquet')
+        self.assertTrue(pd.api.types.is_string_dtype(read_table(path)['exon_number']))
+
+
+if __name__ == '__main__':
+    unittest.main()
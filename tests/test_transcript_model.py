@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests of the compact, interval based transcript model"""
+
+import unittest
+from interogate.parse_gtf import parse_gff_gft
+from interogate.return_dict import generate_transcript_coordinates
+from interogate.transcript_model import TranscriptModel
+from interogate.parse_trans_len import parse_transcript_lengths
+
+
+class TestTranscriptModel(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        features = parse_gff_gft('data/test.gtf')
+        transcript_lengths = parse_transcript_lengths('data/Araport11_genes.201606.cdna.len')
+        cls.transcript_dict, cls.transcript_exon_counts, cls.gene_exon_counts, \
+            cls.last_exon_for_transcript, cls.transcript_strands = \
+            generate_transcript_coordinates(features, transcript_lengths)
+
+
+    def test_model_type(self):
+        """The transcript dict is an array backed TranscriptModel"""
+        self.assertIsInstance(self.transcript_dict, TranscriptModel)
+        self.assertIn("AT1G01010.1", self.transcript_dict)
+        self.assertNotIn("NOT_A_TRANSCRIPT.1", self.transcript_dict)
+
+
+    def test_exon_intervals(self):
+        """TEST_neg_last_exon.1 exons are numbered in file order: 3, 2, 1"""
+        exons = self.transcript_dict["TEST_neg_last_exon.1"]
+        self.assertEqual(exons, {3: range(1, 12), 2: range(12, 32), 1: range(32, 52)})
+
+
+    def test_same_positions_as_nucleotide_lists(self):
+        """Every exon covers the same positions as the old per nucleotide lists"""
+        exons = self.transcript_dict["AT1G01010.1"]
+        # CDS lengths in data/test.gtf
+        lengths = [154, 281, 120, 390, 153, 192]
+        counter = 0
+        for exon_number, length in enumerate(lengths, start=1):
+            expected = list(range(counter + 1, counter + length + 1))
+            self.assertEqual(list(exons[exon_number]), expected)
+            counter += length
+
+
+    def test_counts_and_last_exon(self):
+        """Exon counts, last exons and strands agree with the returned dicts"""
+        for transcript_id in self.transcript_dict:
+            self.assertEqual(self.transcript_dict.exon_count(transcript_id),
+                             self.transcript_exon_counts[transcript_id])
+            self.assertEqual(self.transcript_dict.last_exon(transcript_id),
+                             self.last_exon_for_transcript[transcript_id])
+            self.assertEqual(self.transcript_dict.strand(transcript_id),
+                             self.transcript_strands[transcript_id])
+
+
+if __name__ == '__main__':
+    unittest.main()